@@ -1,6 +1,7 @@
 from app import create_app
 
-app = create_app()
-
+# Only under the entry point: the screener's spawn workers re-import this file as __mp_main__,
+# and must not build a second app (blueprints, TSETMC client, preload thread). WSGI servers use wsgi:app.
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app = create_app()
+    app.run(debug=True, host='0.0.0.0', port=5000)
@@ -47,7 +47,8 @@ def create_app():
                 for t in ["1", "2"]:
                     try:
                         logger.debug(f"Preloading symbol type {t}...")
-                        client.get_all_symbols(t)
+                        with client.traffic_lane("background"):
+                            client.get_all_symbols(t)
                         time.sleep(random.uniform(15, 25))
                     except Exception as e:
                         logger.error(f"Failed to preload type {t}: {str(e)}")
@@ -0,0 +1,201 @@
+"""
+Response encodings for history and analysis payloads.
+
+Endpoints build results as row dicts (the 'records' layout). This module can re-encode them as:
+- 'columnar': {"columns": {field: [values...]}, "meta": {...}}. Each field name is sent once,
+  and per-series values such as supports, fibonacci or chart_image sit in "meta" instead of on row 0.
+- 'arrow': an Apache Arrow IPC stream (needs the optional pyarrow package). Meta travels as JSON
+  in the schema metadata.
+compact=True narrows numeric columns to float32 precision: JSON numbers are rounded to 7 significant
+digits and Arrow columns become float32 (half-size buffers). The `fields` parameter projects rows
+(and meta) onto the requested keys.
+"""
+import json
+
+import numpy as np
+from flask import Response, jsonify
+
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    PYARROW_AVAILABLE = False
+
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+FORMATS = ('records', 'columnar', 'arrow')
+# Request keys that only select the encoding (excluded from result cache keys)
+FORMAT_PARAMS = ('format', 'fields', 'compact')
+_SEPARATORS = (',', ':')
+
+# Keys calculate_technical_analysis / fetch_data attach to the newest row only
+SUMMARY_KEYS = (
+    'supports', 'resistances', 'sr_levels', 'fibonacci', 'divergence',
+    'risk_reward', 'beta', 'recommended_indicators', 'chart_image',
+)
+
+class FormatError(ValueError):
+    """Raised for unknown formats or formats that cannot be produced here."""
+
+def parse_format(params, accept=None):
+    """
+    (format, compact, fields) from request params ('format', 'compact', 'fields') with the Accept
+    header as fallback for Arrow. fields may be a list or a comma-separated string.
+    """
+    fmt = (params.get('format') or '').lower()
+    compact = str(params.get('compact', '')).lower() in ('1', 'true', 'yes')
+    if not fmt:
+        if accept and ARROW_MIMETYPE in accept:
+            fmt = 'arrow'
+        else:
+            fmt = 'columnar' if compact else 'records'
+    if fmt not in FORMATS:
+        raise FormatError(f"Unknown format {fmt!r}; use one of {', '.join(FORMATS)}")
+    if fmt == 'arrow' and not PYARROW_AVAILABLE:
+        raise FormatError("The arrow format needs the pyarrow package on the server")
+
+    fields = params.get('fields')
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(',')]
+    fields = [f for f in fields if f] if fields else None
+    return fmt, compact, fields
+
+def project(rows, fields):
+    """Rows restricted to `fields` (order of `fields`); unknown fields are skipped."""
+    if not fields:
+        return rows
+    return [{f: row[f] for f in fields if f in row} for row in rows]
+
+def _split(rows, fields=None):
+    """(column names, meta dict) of a list of row dicts."""
+    merged = {}
+    for row in rows:
+        merged.update(row)
+    first = rows[0] if rows else {}
+    meta, columns = {}, []
+    for key, value in merged.items():
+        if (key in SUMMARY_KEYS and key in first) or isinstance(value, (dict, list)) or isinstance(first.get(key), (dict, list)):
+            meta[key] = first.get(key)
+        else:
+            columns.append(key)
+    if fields:
+        columns = [f for f in fields if f in merged and f not in meta]
+        meta = {f: meta[f] for f in fields if f in meta}
+    return columns, meta
+
+_NUMBER_TYPES = {int, float, type(None), np.float64, np.float32, np.int64, np.int32}
+
+def _numeric(values):
+    """float64 array of a column when every value is a number or None; None otherwise."""
+    if not set(map(type, values)) <= _NUMBER_TYPES:
+        return None
+    return np.array(values, dtype=np.float64)
+
+_POW10 = 10.0 ** np.arange(0, 24)
+
+def _float32_precision(array):
+    """Values rounded to 7 significant digits (float32 precision), so their shortest repr is short too."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        magnitude = np.floor(np.log10(np.abs(array)))
+    digits = np.clip(np.where(np.isfinite(magnitude), 6 - magnitude, 0), -23, 23).astype(np.int64)
+    scale = _POW10[np.abs(digits)]
+    return np.where(digits >= 0, np.round(array * scale) / scale, np.round(array / scale) * scale)
+
+def _json_numbers(array, compact):
+    """JSON text of a numeric column: integral values as integers, NaN as null, floats reduced when compact."""
+    if compact:
+        array = _float32_precision(array)
+    finite = np.isfinite(array)
+    integral = finite & (array == np.round(array)) & (np.abs(array) < 2 ** 53)
+    if integral.all():
+        return json.dumps(array.astype(np.int64).tolist(), separators=_SEPARATORS)
+    values = array.astype(object)
+    values[integral] = array[integral].astype(np.int64).tolist()
+    values[~finite] = None
+    return json.dumps(values.tolist(), separators=_SEPARATORS)
+
+def columnar_json(rows, fields=None, compact=False, extra=None):
+    """
+    Columnar JSON text of row dicts. Numeric columns go through NumPy (NaN -> null, integral
+    values as integers) and are dumped with one json call per column.
+    """
+    names, meta = _split(rows, fields)
+    parts = []
+    for name in names:
+        values = [row.get(name) for row in rows]
+        array = _numeric(values)
+        encoded = _json_numbers(array, compact) if array is not None else json.dumps(values, ensure_ascii=False, default=str, separators=_SEPARATORS)
+        parts.append(f'{json.dumps(name, ensure_ascii=False)}:{encoded}')
+    header = {'format': 'columnar', 'length': len(rows), **(extra or {})}
+    head = json.dumps(header, ensure_ascii=False, separators=_SEPARATORS)[:-1]
+    return (f'{head},"columns":{{{",".join(parts)}}},'
+            f'"meta":{json.dumps(meta, ensure_ascii=False, default=str, separators=_SEPARATORS)}}}')
+
+def arrow_stream(rows, fields=None, compact=False):
+    """Arrow IPC stream bytes of row dicts (numeric columns float64, or float32 when compact)."""
+    names, meta = _split(rows, fields)
+    arrays = []
+    for name in names:
+        values = [row.get(name) for row in rows]
+        array = _numeric(values)
+        if array is not None:
+            array = array.astype(np.float32) if compact else array
+            arrays.append(pa.array(array, from_pandas=True))
+        else:
+            arrays.append(pa.array([None if v is None else str(v) for v in values], type=pa.string()))
+    schema_meta = {'meta': json.dumps(meta, ensure_ascii=False, default=str)}
+    table = pa.Table.from_arrays(arrays, names=names).replace_schema_metadata(schema_meta)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _is_rows(value):
+    return isinstance(value, list) and all(isinstance(row, dict) for row in value)
+
+def _is_row_map(value):
+    return isinstance(value, dict) and bool(value) and all(_is_rows(v) for v in value.values())
+
+def _columnar_map(entry, fields=None, compact=False):
+    """JSON text of {key: value} with every row list in the columnar layout."""
+    parts = [
+        f'{json.dumps(key, ensure_ascii=False)}:'
+        + (columnar_json(value, fields, compact) if _is_rows(value) else json.dumps(value, ensure_ascii=False, default=str, separators=_SEPARATORS))
+        for key, value in entry.items()
+    ]
+    return f'{{{",".join(parts)}}}'
+
+def encode(result, fmt='records', compact=False, fields=None):
+    """
+    Flask response for a result list, or a {key: rows} map such as multi-timeframe results, in the
+    negotiated format (errors and other dicts stay JSON; Arrow takes a single list).
+    """
+    if _is_row_map(result) and fmt != 'arrow':
+        if fmt == 'columnar':
+            return Response(_columnar_map(result, fields, compact), mimetype='application/json')
+        return jsonify({key: project(rows, fields) for key, rows in result.items()})
+    if not _is_rows(result):
+        return jsonify(result)
+    if fmt == 'arrow':
+        return Response(arrow_stream(result, fields, compact), mimetype=ARROW_MIMETYPE)
+    if fmt == 'columnar':
+        return Response(columnar_json(result, fields, compact), mimetype='application/json')
+    return jsonify(project(result, fields))
+
+def encode_batch(results, fmt='records', compact=False, fields=None, extra=None):
+    """
+    Flask response for {symbol: {service: result}} (fetch_batch). Every row list is encoded in the
+    negotiated layout; Arrow streams hold a single table and are not available here.
+    """
+    if fmt == 'arrow':
+        raise FormatError("The arrow format is available for single-symbol requests only")
+    if fmt == 'records':
+        projected = {
+            symbol: {service: project(value, fields) if _is_rows(value) else value for service, value in entry.items()}
+            for symbol, entry in results.items()
+        }
+        return jsonify({'results': projected, **(extra or {})})
+
+    symbols = [f'{json.dumps(symbol, ensure_ascii=False)}:{_columnar_map(entry, fields, compact)}' for symbol, entry in results.items()]
+    tail = json.dumps(extra or {}, ensure_ascii=False, separators=_SEPARATORS)[1:]
+    return Response(f'{{"results":{{{",".join(symbols)}}}' + (',' + tail if extra else '}'), mimetype='application/json')
@@ -11,11 +11,18 @@ import zipfile
 import logging
 import json
 import hashlib
+import bisect
 
 from app.services.tsetmc import client
 from app.services.tgju import tgju_client
 from app.services.technical_analysis import TechnicalAnalyzer
+from app.services.search import symbol_search
+from app.services.indicator_state import indicator_states
+from app.services.screener import screener, ScreenerFilterError
+from app.services.correlation import correlation_engine
+from app.api.formats import parse_format, encode, encode_batch, FormatError, FORMAT_PARAMS
 from app.database import db
+from app.periods import PERIOD_TIMEFRAMES
 from app.core_utils import PROXY_URL, stats
 from app import cache
 
@@ -39,7 +46,12 @@ def get_market_status():
         "stats": {
             "global": stats["global"],
             "services": stats["services"]
-        }
+        },
+        "sessions": client.sessions.stats(),
+        "techniques": client.scoreboard.stats(),
+        "rate_limit": client.limiter.stats(),
+        "coalesced": client.inflight.stats(),
+        "database": db.pool_stats()
     })
 
 @main_bp.route('/api/health')
@@ -65,6 +77,72 @@ def get_symbols(market_type):
         return jsonify(symbols)
     return jsonify(symbols if symbols else [])
 
+@main_bp.route('/api/search')
+def search_symbols():
+    """
+    Server-side symbol search over tickers and names (Persian-normalized, prefix + substring).
+    Query params: q, market (UI market key, e.g. 1, 2, etf), page, page_size, refresh.
+    """
+    market = request.args.get('market')
+    refresh = request.args.get('refresh', 'false').lower() == 'true'
+    if market and market not in client.MARKET_CLASSES:
+        return jsonify({"error": f"جستجو برای بازار {market} پشتیبانی نمی‌شود."}), 400
+
+    if refresh or db.get_total_symbols_count() == 0:
+        client.ensure_equity_registry(force_refresh=refresh)
+
+    try:
+        page = int(request.args.get('page', 1))
+        page_size = int(request.args.get('page_size', 20))
+    except ValueError:
+        return jsonify({"error": "page و page_size باید عدد باشند."}), 400
+
+    return jsonify(symbol_search.search(
+        request.args.get('q', ''),
+        market_classes=client.MARKET_CLASSES.get(market) if market else None,
+        page=page,
+        page_size=page_size
+    ))
+
+@main_bp.route('/api/screener')
+def screen_market():
+    """
+    Technical screener over every symbol of a market, computed from local price history only.
+    Query params: market (UI market key), filter (e.g. "RSI < 30 and SMA20 > SMA50",
+    "Pattern == 'Hammer'", "divergence contains 'Bullish'"), sort, order (asc|desc),
+    page, page_size, adjusted, bars, refresh.
+    """
+    market = request.args.get('market', '1')
+    if market not in client.MARKET_CLASSES:
+        return jsonify({"error": f"اسکنر برای بازار {market} پشتیبانی نمی‌شود."}), 400
+    adjusted = request.args.get('adjusted', 'true').lower() == 'true'
+    refresh = request.args.get('refresh', 'false').lower() == 'true'
+
+    try:
+        page = int(request.args.get('page', 1))
+        page_size = int(request.args.get('page_size', 50))
+        bars = int(request.args['bars']) if request.args.get('bars') else None
+    except ValueError:
+        return jsonify({"error": "page، page_size و bars باید عدد باشند."}), 400
+
+    classes = set(client.MARKET_CLASSES[market])
+    universe = [
+        (ticker, client._history_db_key(ticker, 0, adjusted), name, market_class)
+        for _, ticker, name, market_class in db.get_registry_entries()
+        if market_class in classes and ticker
+    ]
+    try:
+        result = screener.screen(
+            universe, cache_key=(market, adjusted),
+            expression=request.args.get('filter'),
+            sort=request.args.get('sort'),
+            descending=request.args.get('order', 'asc').lower() == 'desc',
+            page=page, page_size=page_size, bars=bars, refresh=refresh
+        )
+    except ScreenerFilterError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"market": market, **result})
+
 @main_bp.route('/api/sync_registry', methods=['POST'])
 def sync_registry():
     """Manual trigger for persistent registry update. Runs in background."""
@@ -72,7 +150,8 @@ def sync_registry():
         logger.info("Starting manual registry synchronization...")
         for t in range(1, 6):
             try:
-                client._fetch_symbols_by_type(str(t), force_refresh=True)
+                with client.traffic_lane("background"):
+                    client._fetch_symbols_by_type(str(t), force_refresh=True)
                 logger.info(f"Sync complete for market type {t}")
                 if t < 5: time.sleep(random.uniform(5, 10))
             except Exception as e:
@@ -86,20 +165,157 @@ def sync_registry():
         "registry_count": db.get_total_symbols_count()
     })
 
+def _output_start(start_date, end_date, timeframe='daily'):
+    """
+    First date of the requested output; the selected range is expanded backwards by the timeframe's
+    TechnicalAnalyzer.RANGE_EXPANSION (weekly views: 5x).
+    """
+    factor = TechnicalAnalyzer.RANGE_EXPANSION.get(timeframe, 1)
+    if factor > 1 and start_date and end_date:
+        try:
+            s_dt = datetime.strptime(start_date, '%Y-%m-%d')
+            e_dt = datetime.strptime(end_date, '%Y-%m-%d')
+            return (e_dt - (e_dt - s_dt) * factor).strftime('%Y-%m-%d')
+        except ValueError as e:
+            logger.error(f"Date Filter Error: {e}")
+    return start_date
+
+def _technical_window(data, timeframe=None):
+    """SQL window for a technical request: the output candles plus the indicator warm-up."""
+    timeframe = timeframe or data.get('timeframe', 'daily')
+    start = _output_start(data.get('start_date'), data.get('end_date'), timeframe)
+    try:
+        return TechnicalAnalyzer.history_window(data.get('candle_count'), start, data.get('end_date'), timeframe)
+    except (TypeError, ValueError):
+        return TechnicalAnalyzer.history_window(None, start, data.get('end_date'), timeframe)
+
+def _window_rows(rows, window):
+    """Date-sorted candles cut to a history_window (lead rows before start_date, newest `limit` rows)."""
+    if window.get('lead'):
+        dates = [str(item.get('date', ''))[:10] for item in rows]
+        rows = rows[max(0, bisect.bisect_left(dates, window['start_date']) - window['lead']):]
+    if window.get('limit'):
+        rows = rows[-window['limit']:]
+    return rows
+
+def _period_bars(history_key, timeframe, candle_count=None, start_date=None, end_date=None):
+    """Prepared weekly / monthly candles from period_bars (None for daily or a series without stored bars)."""
+    if timeframe not in PERIOD_TIMEFRAMES:
+        return None
+    try:
+        # Stored bars are whole candles: the warm-up window is counted in bars
+        window = TechnicalAnalyzer.history_window(candle_count, start_date, end_date)
+    except (TypeError, ValueError):
+        window = TechnicalAnalyzer.history_window(None, start_date, end_date)
+    return TechnicalAnalyzer.prepare_ohlcv_data(db.get_period_bars(history_key, timeframe, **window))
+
+def _series_summary_data(history_key, history, timeframe, end_date=None, period_bars=False):
+    """
+    Whole series (up to end_date) behind the summaries of a windowed analysis, see
+    TechnicalAnalyzer.series_summary: a columnar price_history read of history_key (or its stored
+    period bars), else the prepared and resampled `history`.
+    """
+    if history_key and period_bars:
+        return TechnicalAnalyzer.prepare_ohlcv_data(db.get_period_bars(history_key, timeframe, end_date=end_date))
+    if history_key:
+        frame = TechnicalAnalyzer.prepare_ohlcv_arrays(db.get_history_arrays(history_key, end_date=end_date))
+        if not frame.empty:
+            return frame if timeframe == 'daily' else TechnicalAnalyzer.resample(frame.to_dict('records'), timeframe)
+    # Not stored (tgju, proxy indices, mock data): such histories are loaded whole
+    rows = TechnicalAnalyzer.prepare_ohlcv_data(history)
+    if end_date and isinstance(rows, list):
+        rows = [item for item in rows if str(item.get('date', ''))[:10] <= end_date]
+    return TechnicalAnalyzer.resample(rows, timeframe) if isinstance(rows, list) else None
+
+def _technical_results(history, symbol, timeframes, start_date=None, end_date=None, beta=None, chart=True,
+                       candle_count=None, bars_key=None, history_key=None):
+    """
+    Technical pipeline shared by fetch_data and fetch_batch: resampling, indicators, chart.
+    The daily candles are prepared once and every timeframe is derived from them; returns
+    {timeframe: rows}. With several timeframes the history covers the coarsest one, so finer
+    timeframes are analysed over their own warm-up window only. With a bars_key (price_history
+    key), weekly and monthly candles come from the stored period bars instead of a resample.
+    Candles before the output start only serve as indicator warm-up and are dropped afterwards.
+    The whole-series summaries (S/R levels, indicator rankings) of a windowed analysis are taken
+    from the full series, read back from the database under history_key (default: bars_key).
+    """
+    history_key = history_key or bars_key
+    daily = TechnicalAnalyzer.prepare_ohlcv_data(history)
+    if end_date and daily:
+        daily = [item for item in daily if str(item.get('date', ''))[:10] <= end_date]
+    if len(timeframes) > 1 and isinstance(daily, list):
+        daily = sorted(daily, key=lambda item: str(item.get('date', '')))
+
+    results = {}
+    for timeframe in timeframes:
+        final_start = _output_start(start_date, end_date, timeframe)
+        result = _period_bars(bars_key, timeframe, candle_count, final_start, end_date) if bars_key else None
+        period_bars = bool(result)
+        if not result:
+            result = daily
+            if len(timeframes) > 1 and isinstance(daily, list):
+                try:
+                    result = _window_rows(daily, TechnicalAnalyzer.history_window(candle_count, final_start, end_date, timeframe))
+                except (TypeError, ValueError):
+                    pass
+            result = TechnicalAnalyzer.resample(result, timeframe)
+        summary_data = None
+        if final_start or candle_count:
+            summary_data = _series_summary_data(history_key, history, timeframe, end_date, period_bars)
+        result = TechnicalAnalyzer.calculate_technical_analysis(result, summary_data=summary_data)
+        if final_start and isinstance(result, list):
+            result = [item for item in result if str(item.get('date', ''))[:10] >= final_start]
+        if beta is not None and result and isinstance(result[0], dict) and result[0].get('beta') is None:
+            result[0]['beta'] = beta
+
+        if chart and len(result) > 5: # Reduced minimum for better visibility
+            try:
+                buf = TechnicalAnalyzer.generate_chart_image(result, symbol, timeframe=timeframe)
+                if buf: result[0]['chart_image'] = base64.b64encode(buf.getvalue()).decode('utf-8')
+            except Exception as e:
+                logger.error(f"Chart Generation Error: {e}")
+        results[timeframe] = result
+    return results
+
+def _technical_result(history, symbol, timeframe='daily', start_date=None, end_date=None, beta=None, chart=True,
+                      candle_count=None, bars_key=None, history_key=None):
+    """Technical rows of a single timeframe (see _technical_results)."""
+    return _technical_results(history, symbol, (timeframe,), start_date, end_date, beta, chart, candle_count, bars_key,
+                              history_key)[timeframe]
+
 @main_bp.route('/api/fetch_data', methods=['POST'])
 def fetch_data():
+    """
+    Data of one symbol for a service (realtime, history, technical, ...).
+    Response layout: "format" = records (default) | columnar | arrow (or Accept:
+    application/vnd.apache.arrow.stream), "compact" = float32 numbers, "fields" = projection.
+    Technical requests may name several "timeframes" (daily, weekly, monthly) instead of one
+    "timeframe": the history is loaded and prepared once and {timeframe: rows} is returned
+    ("chart": false skips the server-side chart images).
+    """
     data = request.json
     force_refresh = data.get('refresh', False)
+    timeframes = data.get('timeframes') if data.get('service_type') == 'technical' else None
+    if timeframes is not None:
+        if not isinstance(timeframes, list) or not timeframes or not set(timeframes) <= set(TechnicalAnalyzer.TIMEFRAMES):
+            return jsonify({"error": f"timeframes باید فهرستی از {', '.join(TechnicalAnalyzer.TIMEFRAMES)} باشد."}), 400
+        timeframes = list(dict.fromkeys(timeframes))
+    try:
+        fmt, compact, fields = parse_format(data, request.headers.get('Accept'))
+        if timeframes and fmt == 'arrow':
+            raise FormatError("The arrow format holds a single timeframe; request one timeframe")
+    except FormatError as e:
+        return jsonify({"error": str(e)}), 406
     
-    # Stable Cache key using MD5 hash of sorted JSON
-    data_str = json.dumps(data, sort_keys=True)
+    # Stable Cache key using MD5 hash of sorted JSON (the encoding does not change the result)
+    data_str = json.dumps({k: v for k, v in data.items() if k not in FORMAT_PARAMS}, sort_keys=True)
     cache_key = hashlib.md5(data_str.encode()).hexdigest()
     
     if not force_refresh:
         cached_res = cache.get(cache_key)
         if cached_res: 
             logger.debug(f"Cache hit for {data.get('symbol')}")
-            return jsonify(cached_res)
+            return encode(cached_res, fmt, compact, fields)
 
     asset_type = data.get('asset_type')
     symbol = data.get('symbol')
@@ -109,6 +325,11 @@ def fetch_data():
     adjusted = data.get('adjusted', True)
     timeframe = data.get('timeframe', 'daily')
     candle_count = data.get('candle_count')
+    # The coarsest timeframe needs the widest history window. Weekly / monthly candles of stored
+    # symbols come from period_bars, so their daily read only covers the daily timeframe.
+    bars_key = client._history_db_key(symbol, 0, adjusted) if asset_type not in ('tgju', 'indices_market') else None
+    resampled = [tf for tf in (timeframes or [timeframe]) if not (bars_key and tf in PERIOD_TIMEFRAMES)]
+    window_timeframe = max(resampled, key=TechnicalAnalyzer.SESSIONS_PER_CANDLE.get) if resampled else 'daily'
 
     result = []
     
@@ -126,13 +347,16 @@ def fetch_data():
                 item = res2[0]
                 result.append({'l18': 'شاخص کل فرابورس', 'pc': item.get('value') or item.get('index')})
         elif service_type in ['history', 'technical']:
-            result = client.get_price_history(symbol, adjusted=False, force_refresh=force_refresh)
+            window = _technical_window(data, window_timeframe) if service_type == 'technical' else {}
+            result = client.get_price_history(symbol, adjusted=False, force_refresh=force_refresh, **window)
     else: # Default normal symbol
         if service_type == 'realtime':
             res = client.get_symbol_info(symbol)
             result = [res] if res else []
         elif service_type in ['history', 'technical']:
-            result = client.get_price_history(symbol, adjusted=adjusted, force_refresh=force_refresh)
+            # Technical requests read only their output window plus the indicator warm-up
+            window = _technical_window(data, window_timeframe) if service_type == 'technical' else {}
+            result = client.get_price_history(symbol, adjusted=adjusted, force_refresh=force_refresh, **window)
 
     # Handle error response (but don't error if it's mock data)
     if isinstance(result, dict) and "error" in result and not force_refresh:
@@ -144,48 +368,259 @@ def fetch_data():
         return jsonify(result)
 
     if service_type == 'technical' and isinstance(result, list) and len(result) > 0:
-        result = TechnicalAnalyzer.prepare_ohlcv_data(result)
-        
-        # Apply Date Range Filtering
-        if (start_date or end_date) and result:
-            try:
-                # If weekly, expand the range 5x backwards as per user requirement
-                final_start = start_date
-                if timeframe == 'weekly' and start_date and end_date:
-                    s_dt = datetime.strptime(start_date, '%Y-%m-%d')
-                    e_dt = datetime.strptime(end_date, '%Y-%m-%d')
-                    diff = e_dt - s_dt
-                    expanded_start = e_dt - (diff * 5)
-                    final_start = expanded_start.strftime('%Y-%m-%d')
-                
-                filtered = []
-                for item in result:
-                    item_date = item.get('date', '')[:10]
-                    if final_start and item_date < final_start: continue
-                    if end_date and item_date > end_date: continue
-                    filtered.append(item)
-                result = filtered
-            except Exception as e:
-                logger.error(f"Date Filter Error: {e}")
+        beta = _symbol_beta(symbol, adjusted) if asset_type not in ('tgju', 'indices_market') else None
+        # Stored series under which the whole-series summaries are read back
+        history_key = client._history_db_key(symbol, 0, False) if asset_type == 'indices_market' else bars_key
+        if timeframes:
+            result = _technical_results(result, symbol, timeframes, start_date, end_date, beta=beta,
+                                        chart=data.get('chart', True), candle_count=candle_count, bars_key=bars_key,
+                                        history_key=history_key)
+        else:
+            result = _technical_result(result, symbol, timeframe, start_date, end_date, beta=beta,
+                                       candle_count=candle_count, bars_key=bars_key, history_key=history_key)
 
-        if timeframe == 'weekly': 
-            result = TechnicalAnalyzer.resample_to_weekly(result)
-            
-        result = TechnicalAnalyzer.calculate_technical_analysis(result)
-        
-        if len(result) > 5: # Reduced minimum for better visibility
+    if result and candle_count:
+        try:
+            if isinstance(result, list):
+                result = result[:int(candle_count)]
+            elif timeframes:
+                result = {tf: rows[:int(candle_count)] for tf, rows in result.items()}
+        except: pass
+
+    cache.set(cache_key, result if result else [], timeout=600)
+    return encode(result if result else [], fmt, compact, fields)
+
+@main_bp.route('/api/fetch_batch', methods=['POST'])
+def fetch_batch():
+    """
+    Several symbols and services in one round trip (compare view, watchlists).
+    Body: {"symbols": [...], "services": ["realtime", "history", "technical"], "asset_type", "adjusted",
+           "timeframe", "start_date", "end_date", "candle_count", "chart": false, "refresh": false,
+           "format": "records" | "columnar", "compact", "fields"}
+    Work shared by the symbols is done once: stored histories are read with one query, betas are
+    computed together against one benchmark load and failed realtime lookups fall back to a single
+    registry read. Returns {"results": {symbol: {service: data}}, "took_ms": ...}.
+    """
+    data = request.json or {}
+    started = time.perf_counter()
+    symbols = list(dict.fromkeys(s for s in (data.get('symbols') or []) if s))[:50]
+    services = [s for s in dict.fromkeys(data.get('services') or ['technical']) if s in ('realtime', 'history', 'technical')]
+    if not symbols or not services:
+        return jsonify({"error": "symbols و services (realtime، history، technical) لازم است."}), 400
+
+    try:
+        fmt, compact, fields = parse_format(data)
+        if fmt == 'arrow':
+            raise FormatError("The arrow format is available for single-symbol requests only")
+    except FormatError as e:
+        return jsonify({"error": str(e)}), 406
+
+    asset_type = data.get('asset_type')
+    adjusted = data.get('adjusted', True)
+    force_refresh = data.get('refresh', False)
+    timeframe = data.get('timeframe', 'daily')
+    candle_count = data.get('candle_count')
+
+    request_key = json.dumps({k: v for k, v in data.items() if k not in FORMAT_PARAMS}, sort_keys=True)
+    cache_key = "batch:" + hashlib.md5(request_key.encode()).hexdigest()
+    if not force_refresh:
+        cached_res = cache.get(cache_key)
+        if cached_res:
+            return encode_batch(cached_res, fmt, compact, fields,
+                                {"took_ms": round((time.perf_counter() - started) * 1000, 2)})
+
+    results = {symbol: {} for symbol in symbols}
+    if asset_type == 'tgju':
+        for symbol in symbols:
+            history = tgju_client.get_history(symbol)
+            results[symbol] = {service: history for service in services}
+    else:
+        if 'realtime' in services:
+            snapshots = None
+            for symbol in symbols:
+                res = client.get_symbol_info(symbol)
+                if not res or (isinstance(res, dict) and "error" in res):
+                    if snapshots is None:
+                        # One registry read serves every symbol whose live lookup failed
+                        snapshots = db.get_symbols_by_l18(symbols)
+                    if symbol in snapshots:
+                        res = {**snapshots[symbol], 'source': 'registry'}
+                results[symbol]['realtime'] = [res] if res else []
+
+        if 'history' in services or 'technical' in services:
+            keys = {s: client._history_db_key(s, 0, adjusted) for s in symbols if not client._is_proxy_index(s)}
+            stored = db.get_latest_dates(keys.values())
+            for symbol, key in keys.items():
+                if force_refresh or key not in stored:
+                    client.get_price_history(symbol, adjusted=adjusted, force_refresh=force_refresh)
+            if 'history' in services:
+                histories = db.get_history_many(keys.values())
+            else:
+                # Technical only: each symbol's output window plus the indicator warm-up
+                # (weekly / monthly candles come from period_bars, see _technical_results)
+                histories = db.get_history_many(keys.values(), **_technical_window(data, 'daily'))
+
+            betas = {}
+            if 'technical' in services and keys:
+                try:
+                    betas = correlation_engine.betas(keys.values(), _beta_benchmark())
+                except Exception as e:
+                    logger.error(f"Batch Beta Error: {e}")
+
+            for symbol in symbols:
+                if symbol in keys:
+                    history = histories.get(keys[symbol]) or client._generate_mock_history(symbol)
+                else:
+                    history = client.get_price_history(symbol, adjusted=False, force_refresh=force_refresh)
+                if isinstance(history, dict) and "error" in history:
+                    for service in ('history', 'technical'):
+                        if service in services: results[symbol][service] = history
+                    continue
+                if 'history' in services:
+                    results[symbol]['history'] = history
+                if 'technical' in services and history:
+                    beta = (betas.get(keys[symbol]) or {}).get('beta') if symbol in keys else None
+                    results[symbol]['technical'] = _technical_result(
+                        history, symbol, timeframe, data.get('start_date'), data.get('end_date'),
+                        beta=beta, chart=data.get('chart', False), candle_count=candle_count, bars_key=keys.get(symbol)
+                    )
+
+    if candle_count:
+        try:
+            for entry in results.values():
+                for service, value in entry.items():
+                    if isinstance(value, list): entry[service] = value[:int(candle_count)]
+        except (TypeError, ValueError): pass
+
+    cache.set(cache_key, results, timeout=600)
+    return encode_batch(results, fmt, compact, fields, {"took_ms": round((time.perf_counter() - started) * 1000, 2)})
+
+BENCHMARK_REFRESH_SECONDS = 600
+_benchmark_refresh = {"thread": None, "started": 0.0}
+_benchmark_refresh_lock = threading.Lock()
+
+def _refresh_benchmark():
+    """
+    Builds / extends the beta benchmark in a background thread (backfill lane), at most once per
+    BENCHMARK_REFRESH_SECONDS and only while no refresh is running. Started lazily by requests
+    that need the benchmark, so it only runs in the serving process and never delays a response.
+    """
+    with _benchmark_refresh_lock:
+        running = _benchmark_refresh["thread"]
+        if (running and running.is_alive()) or time.time() - _benchmark_refresh["started"] < BENCHMARK_REFRESH_SECONDS:
+            return
+        _benchmark_refresh["started"] = time.time()
+
+        def run():
             try:
-                buf = TechnicalAnalyzer.generate_chart_image(result, symbol, timeframe=timeframe)
-                if buf: result[0]['chart_image'] = base64.b64encode(buf.getvalue()).decode('utf-8')
+                with client.traffic_lane("backfill"):
+                    client.get_market_proxy_history("1")
             except Exception as e:
-                logger.error(f"Chart Generation Error: {e}")
+                logger.error(f"Benchmark refresh failed: {e}")
 
-    if result and isinstance(result, list) and candle_count:
-        try: result = result[:int(candle_count)]
-        except: pass
+        thread = threading.Thread(target=run, daemon=True, name="BenchmarkRefreshThread")
+        _benchmark_refresh["thread"] = thread
+        thread.start()
 
-    cache.set(cache_key, result if result else [], timeout=600)
-    return jsonify(result if result else [])
+def _beta_benchmark():
+    """
+    Key of the market proxy index used as beta benchmark. Read-only: the index is built and
+    extended by _refresh_benchmark in the background, never inside a request; until it is
+    materialized betas are None.
+    """
+    _refresh_benchmark()
+    return client._proxy_index_key("market", "1", False)
+
+def _symbol_beta(symbol, adjusted=True):
+    """Daily beta of a symbol against the market proxy index (cached per trading day); None if unavailable."""
+    if client._is_proxy_index(symbol):
+        return None
+    try:
+        return correlation_engine.beta(client._history_db_key(symbol, 0, adjusted), _beta_benchmark())
+    except Exception as e:
+        logger.error(f"Beta Error for {symbol}: {e}")
+        return None
+
+@main_bp.route('/api/correlation', methods=['POST'])
+def compare_correlation():
+    """
+    Betas against the market proxy index, the return correlation matrix and rolling betas of a
+    group of symbols (the compare list), computed together from stored daily closes.
+    Body: {"symbols": [...], "adjusted": true, "lookback": 250, "window": 60}
+    """
+    data = request.json or {}
+    symbols = list(dict.fromkeys(s for s in (data.get('symbols') or []) if s))[:50]
+    adjusted = data.get('adjusted', True)
+    started = time.perf_counter()
+    try:
+        lookback = int(data['lookback']) if data.get('lookback') else None
+        window = int(data['window']) if data.get('window') else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "lookback و window باید عدد باشند."}), 400
+
+    unsupported = [s for s in symbols if client._is_proxy_index(s)]
+    symbols = [s for s in symbols if s not in unsupported]
+    if len(symbols) < 2:
+        return jsonify({"error": "حداقل ۲ نماد (غیر شاخص) برای همبستگی لازم است."}), 400
+
+    keys = {}
+    for symbol in symbols:
+        key = client._history_db_key(symbol, 0, adjusted)
+        if not db.get_latest_date(key):
+            client.get_price_history(symbol, adjusted=adjusted)
+        keys[symbol] = key
+
+    view = correlation_engine.correlation_view(list(keys.values()), _beta_benchmark(), lookback=lookback, window=window)
+    if view is None:
+        return jsonify({"error": "تاریخچه شاخص مرجع در دسترس نیست."})
+
+    return jsonify({
+        "benchmark": "شاخص کل",
+        "trading_day": view['trading_day'],
+        "lookback": view['lookback'],
+        "symbols": symbols,
+        "unsupported": unsupported,
+        "betas": {symbol: view['betas'].get(key) for symbol, key in keys.items()},
+        "matrix": view['matrix'],
+        "rolling": {
+            "window": view['rolling']['window'],
+            "dates": view['rolling']['dates'],
+            "betas": {symbol: view['rolling']['betas'][key] for symbol, key in keys.items()},
+        },
+        "took_ms": round((time.perf_counter() - started) * 1000, 2)
+    })
+
+@main_bp.route('/api/watchlist/technicals', methods=['POST'])
+def watchlist_technicals():
+    """
+    Latest indicator values and signal for every watchlist symbol, served from the streaming
+    indicator state (only candles added since the last call are processed).
+    Body: {"symbols": [...], "adjusted": true, "refresh": false}; refresh syncs prices first.
+    """
+    data = request.json or {}
+    symbols = [s for s in (data.get('symbols') or []) if s][:200]
+    adjusted = data.get('adjusted', True)
+    refresh = data.get('refresh', False)
+    started = time.perf_counter()
+
+    keys, results = {}, {}
+    for symbol in symbols:
+        if client._is_proxy_index(symbol):
+            results[symbol] = {"error": "برای شاخص‌ها پشتیبانی نمی‌شود."}
+            continue
+        key = client._history_db_key(symbol, 0, adjusted)
+        if refresh or not db.get_latest_date(key):
+            client.get_price_history(symbol, adjusted=adjusted, force_refresh=refresh)
+        keys[symbol] = key
+
+    states = indicator_states.latest_many(keys.values())
+    for symbol, key in keys.items():
+        results[symbol] = states.get(key) or {"error": "داده‌ای یافت نشد."}
+
+    return jsonify({
+        "results": results,
+        "took_ms": round((time.perf_counter() - started) * 1000, 2)
+    })
 
 @main_bp.route('/api/ai_package', methods=['POST'])
 def generate_ai_package():
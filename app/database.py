@@ -2,10 +2,122 @@ import sqlite3
 import json
 import os
 import logging
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
+import numpy as np
+import pandas as pd
+
+from app.periods import PERIOD_TIMEFRAMES, aggregate_bars, period_end
+
 logger = logging.getLogger(__name__)
 
+class ConnectionPool:
+    """
+    Bounded pool of SQLite connections shared by all threads.
+    A `with pool.connection()` block checks out an idle connection (opening one while fewer than
+    POOL_SIZE exist) and returns it afterwards, so a server that runs every request in a new
+    thread still reuses warm connections instead of reconnecting and rerunning the PRAGMAs.
+    Nested blocks of one thread share its connection. When all POOL_SIZE connections are in use,
+    callers wait up to `timeout` seconds for one. Connections run in WAL mode so readers keep
+    working while another thread writes.
+    """
+
+    POOL_SIZE = 8
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",   # Safe with WAL, avoids an fsync per commit
+        "PRAGMA cache_size=-20000",    # ~20 MB page cache per connection
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA busy_timeout=10000",
+    )
+
+    def __init__(self, db_path, timeout=30, size=None):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.size = size or self.POOL_SIZE
+        self._local = threading.local()
+        self._available = threading.Condition()
+        self._idle = []         # most recently returned last
+        self._open_count = 0
+        self._stats = {"opened": 0, "reused": 0, "closed": 0, "waited": 0}
+
+    def _open(self):
+        # A connection moves between threads, but only one thread uses it at a time
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _checkout(self):
+        """The warmest idle connection, a new one while below POOL_SIZE, else the next one returned."""
+        deadline = time.monotonic() + self.timeout
+        with self._available:
+            while not self._idle and self._open_count >= self.size:
+                self._stats["waited"] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._available.wait(remaining):
+                    raise sqlite3.OperationalError(f"No free database connection after {self.timeout}s")
+            if self._idle:
+                self._stats["reused"] += 1
+                return self._idle.pop()
+            self._open_count += 1
+        try:
+            conn = self._open()
+        except Exception:
+            with self._available:
+                self._open_count -= 1
+                self._available.notify()
+            raise
+        with self._available:
+            self._stats["opened"] += 1
+        return conn
+
+    def _checkin(self, conn):
+        with self._available:
+            self._idle.append(conn)
+            self._available.notify()
+
+    @contextmanager
+    def connection(self):
+        """Connection for one `with` block, which also scopes a transaction (commit / rollback)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            with conn:
+                yield conn
+            return
+
+        conn = self._checkout()
+        self._local.conn = conn
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._local.conn = None
+            self._checkin(conn)
+
+    def close_all(self):
+        """Closes the idle connections (connections in use go back to the pool when their block ends)."""
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._open_count -= len(idle)
+            self._stats["closed"] += len(idle)
+            self._available.notify_all()
+        for conn in idle:
+            try: conn.close()
+            except Exception: pass
+
+    def stats(self):
+        with self._available:
+            return {
+                **self._stats,
+                "size": self.size,
+                "open_connections": self._open_count,
+                "idle_connections": len(self._idle),
+            }
+
 class SymbolDatabase:
     """
     Manages SQLite database for caching TSETMC symbols and price history.
@@ -21,10 +133,21 @@ class SymbolDatabase:
         
         # Ensure data directory exists
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._pool = ConnectionPool(self.db_path)
+        self._ingest_totals = {}
+        self._classifier = None
         self._init_db()
 
     def _get_connection(self):
-        return sqlite3.connect(self.db_path)
+        """Pooled connection for one `with` block, which also scopes a transaction."""
+        return self._pool.connection()
+
+    def pool_stats(self):
+        """Connection pool statistics plus the active journal mode."""
+        stats = self._pool.stats()
+        with self._get_connection() as conn:
+            stats["journal_mode"] = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        return stats
 
     def _init_db(self):
         with self._get_connection() as conn:
@@ -68,11 +191,87 @@ class SymbolDatabase:
                 )
             ''')
             
+            # 2b. Staging area for atomic registry refreshes (see replace_symbols)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS symbols_staging (
+                    isin TEXT,
+                    symbol_l18 TEXT,
+                    name_l30 TEXT,
+                    market_category TEXT,
+                    market_class TEXT,
+                    raw_data TEXT,
+                    last_updated TIMESTAMP,
+                    PRIMARY KEY (market_category, isin)
+                )
+            ''')
+
+            # 2c. Materialized proxy indices (market / sector) and their constituents
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS proxy_index_history (
+                    index_key TEXT,
+                    date TEXT,
+                    open REAL, high REAL, low REAL, close REAL,
+                    volume REAL,
+                    weight REAL,
+                    components INTEGER,
+                    last_updated TIMESTAMP,
+                    PRIMARY KEY (index_key, date)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS proxy_index_components (
+                    index_key TEXT,
+                    position INTEGER,
+                    symbol TEXT,
+                    history_key TEXT,
+                    weight REAL,
+                    synced_date TEXT,
+                    last_updated TIMESTAMP,
+                    PRIMARY KEY (index_key, position)
+                )
+            ''')
+
+            # 2d. Streaming indicator state per price_history key (see app/services/indicator_state.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS indicator_state (
+                    symbol TEXT PRIMARY KEY,
+                    last_date TEXT,
+                    bars INTEGER,
+                    state TEXT,
+                    last_updated TIMESTAMP
+                )
+            ''')
+
+            # 2e. Weekly / monthly bars per price_history key, kept current by save_history (see app/periods.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS period_bars (
+                    symbol TEXT,
+                    timeframe TEXT,
+                    date TEXT,
+                    open REAL, high REAL, low REAL, close REAL,
+                    volume REAL,
+                    first_date TEXT,
+                    last_date TEXT,
+                    sessions INTEGER,
+                    last_updated TIMESTAMP,
+                    PRIMARY KEY (symbol, timeframe, date)
+                )
+            ''')
+
+            # 3. Key/value metadata (classifier version, registry generations, ...)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+            
             # MIGRATION: Ensure all columns exist in symbols table
             columns = {
                 "symbol_l18": "TEXT",
                 "name_l30": "TEXT",
                 "market_category": "TEXT",
+                "market_class": "TEXT",
                 "raw_data": "TEXT",
                 "last_updated": "TIMESTAMP"
             }
@@ -81,45 +280,276 @@ class SymbolDatabase:
                     cursor.execute(f"ALTER TABLE symbols ADD COLUMN {col_name} {col_type}")
                 except sqlite3.OperationalError:
                     pass # Already exists
+
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_symbols_class ON symbols (market_class, market_category)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_symbols_category ON symbols (market_category)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_symbols_l18 ON symbols (symbol_l18)")
                 
             conn.commit()
 
-    def save_history(self, symbol, history_data):
-        """Saves price history for a symbol. Uses INSERT OR IGNORE to avoid duplicates."""
-        now = datetime.now().isoformat()
+    def get_meta(self, key, default=None):
+        with self._get_connection() as conn:
+            res = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+            return res[0] if res else default
+
+    def set_meta(self, key, value):
+        with self._get_connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+            conn.commit()
+
+    # Numeric OHLCV columns of price_history, in storage order
+    HISTORY_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+    @staticmethod
+    def _history_values(item):
+        """Maps one API candle (pf/pmax/pmin/pc/tvol or plain OHLCV keys) to numeric column values."""
+        close = item.get('pc') or item.get('close') or item.get('index') or item.get('value')
+        return (
+            item.get('pf') or item.get('open'),
+            item.get('pmax') or item.get('high'),
+            item.get('pmin') or item.get('low'),
+            close,
+            item.get('tvol') or item.get('volume'),
+        )
+
+    INGEST_BATCH_SIZE = 1000
+
+    _HISTORY_INSERT = {
+        "ignore": '''
+            INSERT OR IGNORE INTO price_history
+            (symbol, date, open, high, low, close, volume, raw_data, last_updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        # Rewrites a stored candle only when one of its values actually changed
+        "upsert": '''
+            INSERT INTO price_history
+            (symbol, date, open, high, low, close, volume, raw_data, last_updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(symbol, date) DO UPDATE SET
+                open = excluded.open, high = excluded.high, low = excluded.low,
+                close = excluded.close, volume = excluded.volume,
+                raw_data = excluded.raw_data, last_updated = excluded.last_updated
+            WHERE price_history.open IS NOT excluded.open
+               OR price_history.high IS NOT excluded.high
+               OR price_history.low IS NOT excluded.low
+               OR price_history.close IS NOT excluded.close
+               OR price_history.volume IS NOT excluded.volume
+               OR price_history.raw_data IS NOT excluded.raw_data
+        ''',
+    }
+
+    def _bulk_write(self, table, sql, rows):
+        """
+        Runs a prepared statement over `rows` with batched executemany in a single transaction.
+        Returns ingest stats (rows offered, rows written, elapsed seconds, rows/s).
+        """
+        started = time.perf_counter()
+        written = 0
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            for item in history_data:
-                # Map API field names to DB names if necessary
-                # API usually gives: pc (close), pf (open), pmax (high), pmin (low), tvol (volume), date
-                date = item.get('date')
-                if not date: continue
-                
-                cursor.execute('''
-                    INSERT OR IGNORE INTO price_history 
-                    (symbol, date, open, high, low, close, volume, raw_data, last_updated)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    symbol,
-                    date,
-                    item.get('pf') or item.get('open'),
-                    item.get('pmax') or item.get('high'),
-                    item.get('pmin') or item.get('low'),
-                    item.get('pc') or item.get('close'),
-                    item.get('tvol') or item.get('volume'),
-                    json.dumps(item, ensure_ascii=False),
-                    now
-                ))
+            for i in range(0, len(rows), self.INGEST_BATCH_SIZE):
+                cursor.executemany(sql, rows[i:i + self.INGEST_BATCH_SIZE])
+                written += max(cursor.rowcount, 0)
             conn.commit()
+        elapsed = time.perf_counter() - started
 
-    def get_history(self, symbol):
-        """Retrieves ALL cached price history for a symbol, sorted by date."""
+        result = {
+            "table": table,
+            "rows": len(rows),
+            "written": written,
+            "seconds": round(elapsed, 4),
+            "rows_per_sec": round(len(rows) / elapsed) if elapsed > 0 else None,
+        }
+        totals = self._ingest_totals.setdefault(table, {"rows": 0, "written": 0, "seconds": 0.0})
+        totals["rows"] += result["rows"]
+        totals["written"] += written
+        totals["seconds"] += elapsed
+        logger.debug(f"Ingested {len(rows)} rows into {table} ({written} written) at {result['rows_per_sec']} rows/s")
+        return result
+
+    def ingest_stats(self):
+        """Cumulative bulk-ingestion throughput per table."""
+        return {
+            table: {**t, "seconds": round(t["seconds"], 3),
+                    "rows_per_sec": round(t["rows"] / t["seconds"]) if t["seconds"] > 0 else None}
+            for table, t in self._ingest_totals.items()
+        }
+
+    def save_history(self, symbol, history_data, keep_raw=True, mode="ignore"):
+        """
+        Saves price history for a symbol in batched executemany calls.
+        mode="ignore" keeps already stored candles (INSERT OR IGNORE); mode="upsert" rewrites
+        only the candles whose values changed (e.g. after a price adjustment).
+        With keep_raw=False only the numeric columns are stored (raw_data stays NULL),
+        which is enough for derived series such as proxy indices.
+        """
+        now = datetime.now().isoformat()
+        # Map API field names to DB names if necessary
+        # API usually gives: pc (close), pf (open), pmax (high), pmin (low), tvol (volume), date
+        rows = [
+            (symbol, item['date'], *self._history_values(item),
+             json.dumps(item, ensure_ascii=False) if keep_raw else None, now)
+            for item in history_data if item.get('date')
+        ]
+        result = self._bulk_write("price_history", self._HISTORY_INSERT[mode], rows)
+        if result["written"]:
+            with self._get_connection() as conn:
+                conn.execute('''
+                    INSERT INTO meta (key, value) VALUES ('history_version', '1')
+                    ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+                ''')
+                conn.commit()
+            # Only the periods from the earliest offered candle onwards can have changed
+            self.update_period_bars(symbol, from_date=min(row[1] for row in rows))
+        return result
+
+    def get_history_version(self):
+        """Counter bumped by every save_history call that wrote rows (cache key for derived results)."""
+        return int(self.get_meta('history_version', 0))
+
+    def get_history(self, symbol, start_date=None, end_date=None, limit=None, lead=0):
+        """
+        Retrieves cached price history for a symbol, sorted by date (ALL of it by default).
+        The window is applied in SQL: start_date / end_date bound the dates, `lead` extends it by
+        that many candles before start_date (indicator warm-up) and `limit` keeps the newest candles.
+        """
+        if start_date and lead:
+            start_date = self._date_before(symbol, start_date, lead)
+        where, params = self._history_window(symbol, start_date, end_date, limit)
         with self._get_connection() as conn:
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
-            cursor.execute('SELECT raw_data FROM price_history WHERE symbol = ? ORDER BY date ASC', (symbol,))
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(f'SELECT date, open, high, low, close, volume, raw_data FROM price_history {where}', params)
             rows = cursor.fetchall()
-            return [json.loads(row['raw_data']) for row in rows]
+        if limit:
+            rows.reverse()
+        return [self._history_candle(row) for row in rows]
+
+    @staticmethod
+    def _history_window(symbol, start_date=None, end_date=None, limit=None, timeframe=None):
+        """
+        WHERE / ORDER / LIMIT clause and params of a windowed price_history read (newest first with
+        a limit); with a timeframe, of a period_bars read.
+        """
+        clause, params = 'WHERE symbol = ?', [symbol]
+        if timeframe:
+            clause += ' AND timeframe = ?'
+            params.append(timeframe)
+        if start_date:
+            clause += ' AND date >= ?'
+            params.append(start_date)
+        if end_date:
+            # Dates may carry a time suffix, so compare against the end of the day
+            clause += ' AND date <= ?'
+            params.append(f"{end_date}\uffff")
+        if limit:
+            # Newest `limit` candles via the (symbol, date) primary key
+            clause += ' ORDER BY date DESC LIMIT ?'
+            params.append(int(limit))
+        else:
+            clause += ' ORDER BY date ASC'
+        return clause, params
+
+    def _date_before(self, symbol, date, count, timeframe=None):
+        """Date of the count-th candle (period bar with a timeframe) before `date`, or None when fewer precede it."""
+        with self._get_connection() as conn:
+            if timeframe:
+                res = conn.execute('''
+                    SELECT date FROM period_bars WHERE symbol = ? AND timeframe = ? AND date < ?
+                    ORDER BY date DESC LIMIT 1 OFFSET ?
+                ''', (symbol, timeframe, date, int(count) - 1)).fetchone()
+            else:
+                res = conn.execute('''
+                    SELECT date FROM price_history WHERE symbol = ? AND date < ?
+                    ORDER BY date DESC LIMIT 1 OFFSET ?
+                ''', (symbol, date, int(count) - 1)).fetchone()
+            return res[0] if res else None
+
+    @classmethod
+    def _history_candle(cls, row):
+        if row['raw_data']:
+            return json.loads(row['raw_data'])
+        # Numeric-only rows (no JSON blob stored)
+        return {'date': row['date'], **{f: row[f] for f in cls.HISTORY_FIELDS}}
+
+    def get_history_many(self, symbols, start_date=None, end_date=None, limit=None, lead=0):
+        """
+        Cached history of several symbols in one query (batch endpoints), optionally windowed
+        per symbol like get_history: candles in [start_date, end_date], `lead` more candles before
+        start_date and only the newest `limit` candles of each symbol.
+        Returns {symbol: candles sorted by date}; symbols without stored candles are left out.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return {}
+        placeholders = ",".join("?" * len(symbols))
+        where, params = f'WHERE symbol IN ({placeholders})', list(symbols)
+        if end_date:
+            where += ' AND date <= ?'
+            params.append(f"{end_date}\uffff")
+        source = f'SELECT * FROM price_history {where}'
+        if start_date and lead:
+            # The `lead` newest candles before start_date of each symbol (numbered newest first
+            # within the before / from-start_date partition) plus all candles from start_date
+            source = f'''
+                SELECT * FROM (
+                    SELECT *, ROW_NUMBER() OVER (PARTITION BY symbol, date >= ? ORDER BY date DESC) AS lead_rn
+                    FROM price_history {where}
+                ) WHERE date >= ? OR lead_rn <= ?
+            '''
+            params = [start_date, *params, start_date, int(lead)]
+        elif start_date:
+            source += ' AND date >= ?'
+            params.append(start_date)
+        query = f'SELECT symbol, date, open, high, low, close, volume, raw_data FROM ({source})'
+        if limit:
+            # Newest candles per symbol via a window over the (symbol, date) primary key
+            query = f'''
+                SELECT symbol, date, open, high, low, close, volume, raw_data FROM (
+                    SELECT *, ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY date DESC) AS rn
+                    FROM ({source})
+                ) WHERE rn <= ?
+            '''
+            params.append(int(limit))
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(query + ' ORDER BY symbol, date ASC', params)
+            histories = {}
+            for row in cursor.fetchall():
+                histories.setdefault(row['symbol'], []).append(self._history_candle(row))
+            return histories
+
+    def get_history_arrays(self, symbol, start_date=None, end_date=None, limit=None):
+        """
+        Columnar read of the numeric OHLCV columns, skipping JSON decoding entirely.
+        Returns a dict of NumPy arrays: 'date' (str) plus float64 open/high/low/close/volume
+        (missing values as NaN), sorted by date ascending. limit keeps only the newest candles.
+        """
+        where, params = self._history_window(symbol, start_date, end_date, limit)
+        with self._get_connection() as conn:
+            rows = conn.execute(f'SELECT date, open, high, low, close, volume FROM price_history {where}', params).fetchall()
+        if limit:
+            rows.reverse()
+
+        if not rows:
+            arrays = {'date': np.array([], dtype=object)}
+            arrays.update({f: np.array([], dtype=np.float64) for f in self.HISTORY_FIELDS})
+            return arrays
+
+        columns = list(zip(*rows))
+        arrays = {'date': np.array(columns[0], dtype=object)}
+        for i, field in enumerate(self.HISTORY_FIELDS, start=1):
+            try:
+                arrays[field] = np.array(columns[i], dtype=np.float64)
+            except (TypeError, ValueError):
+                # Non-numeric leftovers (e.g. empty strings) stored by older rows
+                arrays[field] = pd.to_numeric(pd.Series(columns[i]), errors='coerce').to_numpy(dtype=np.float64)
+        return arrays
+
+    def get_history_frame(self, symbol, start_date=None, end_date=None, limit=None):
+        """Same as get_history_arrays but wrapped in a DataFrame (date, open, high, low, close, volume)."""
+        return pd.DataFrame(self.get_history_arrays(symbol, start_date, end_date, limit))
 
     def get_latest_date(self, symbol):
         """Returns the latest date we have for a given symbol."""
@@ -129,40 +559,488 @@ class SymbolDatabase:
             res = cursor.fetchone()
             return res[0] if res else None
 
+    def get_close(self, symbol, date):
+        """Stored close of a single candle, or None."""
+        with self._get_connection() as conn:
+            res = conn.execute('SELECT close FROM price_history WHERE symbol = ? AND date = ?', (symbol, date)).fetchone()
+            return res[0] if res else None
+
+    def count_history(self, symbol, before_date=None):
+        """Number of stored candles of a symbol, optionally only those dated before `before_date`."""
+        query, params = 'SELECT COUNT(*) FROM price_history WHERE symbol = ?', [symbol]
+        if before_date:
+            query += ' AND date < ?'
+            params.append(before_date)
+        with self._get_connection() as conn:
+            return conn.execute(query, params).fetchone()[0]
+
+    def get_history_dates(self, symbol):
+        """Returns the set of dates stored for a symbol (index-only scan, no row decoding)."""
+        with self._get_connection() as conn:
+            rows = conn.execute('SELECT date FROM price_history WHERE symbol = ?', (symbol,)).fetchall()
+            return {row[0] for row in rows}
+
+    def find_history_gaps(self, symbol, max_gap_days=10):
+        """
+        Detects holes in a stored series: pairs of consecutive stored dates that are more than
+        max_gap_days calendar days apart (longer than weekends and regular market holidays).
+        Returns a list of (last_date_before_gap, first_date_after_gap) tuples.
+        """
+        with self._get_connection() as conn:
+            rows = conn.execute('''
+                SELECT prev_date, date FROM (
+                    SELECT date, LAG(date) OVER (ORDER BY date) AS prev_date
+                    FROM price_history WHERE symbol = ?
+                )
+                WHERE prev_date IS NOT NULL
+                  AND julianday(substr(date, 1, 10)) - julianday(substr(prev_date, 1, 10)) > ?
+            ''', (symbol, max_gap_days)).fetchall()
+            return [(prev, nxt) for prev, nxt in rows]
+
+    def get_latest_dates(self, symbols):
+        """{symbol: latest stored date} for several price_history keys in one grouped query."""
+        symbols = list(symbols)
+        if not symbols:
+            return {}
+        placeholders = ",".join("?" * len(symbols))
+        with self._get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT symbol, MAX(date) FROM price_history
+                WHERE symbol IN ({placeholders}) GROUP BY symbol
+            ''', symbols).fetchall()
+            return dict(rows)
+
+    def get_last_closes(self, symbols, on_or_before):
+        """{symbol: close of its last candle on or before a date} for several price_history keys."""
+        symbols = list(symbols)
+        if not symbols:
+            return {}
+        placeholders = ",".join("?" * len(symbols))
+        with self._get_connection() as conn:
+            # SQLite returns the bare `close` column from the row holding MAX(date)
+            rows = conn.execute(f'''
+                SELECT symbol, close, MAX(date) FROM price_history
+                WHERE symbol IN ({placeholders}) AND date <= ? AND close IS NOT NULL
+                GROUP BY symbol
+            ''', (*symbols, f"{on_or_before}\uffff")).fetchall()
+            return {symbol: close for symbol, close, _ in rows}
+
+    def get_closes(self, symbols, start_date=None):
+        """
+        Closes of several price_history keys in one query, for cross-sectional calculations.
+        Returns {symbol: {'date': array, 'close': float64 array}} sorted by date ascending;
+        symbols without stored candles are left out.
+        """
+        symbols = list(symbols)
+        if not symbols:
+            return {}
+        placeholders = ",".join("?" * len(symbols))
+        query = f'SELECT symbol, date, close FROM price_history WHERE symbol IN ({placeholders}) AND close IS NOT NULL'
+        params = list(symbols)
+        if start_date:
+            query += ' AND date >= ?'
+            params.append(start_date)
+        with self._get_connection() as conn:
+            rows = conn.execute(query + ' ORDER BY symbol, date', params).fetchall()
+        if not rows:
+            return {}
+
+        keys, dates, closes = zip(*rows)
+        keys = np.array(keys, dtype=object)
+        closes = pd.to_numeric(pd.Series(closes), errors='coerce').to_numpy(dtype=np.float64)
+        dates = np.array(dates, dtype=object)
+        # Rows are grouped by symbol, so each series is one contiguous slice
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        ends = np.append(starts[1:], len(keys))
+        return {keys[s]: {'date': dates[s:e], 'close': closes[s:e]} for s, e in zip(starts, ends)}
+
+    # --- Streaming Indicator State Methods ---
+
+    def get_indicator_state(self, symbol):
+        """(last_date, bars, state) of a stored indicator state, state decoded from JSON; or None."""
+        with self._get_connection() as conn:
+            res = conn.execute('SELECT last_date, bars, state FROM indicator_state WHERE symbol = ?', (symbol,)).fetchone()
+        if not res:
+            return None
+        try:
+            return res[0], res[1], json.loads(res[2])
+        except (TypeError, ValueError):
+            return None
+
+    def save_indicator_states(self, states):
+        """Bulk upsert of indicator states given as (symbol, last_date, bars, state_dict)."""
+        now = datetime.now().isoformat()
+        rows = [(symbol, last_date, bars, json.dumps(state), now) for symbol, last_date, bars, state in states]
+        with self._get_connection() as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO indicator_state (symbol, last_date, bars, state, last_updated)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+        return len(rows)
+
+    # --- Period Bar Methods (weekly / monthly) ---
+
+    _BAR_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+    def _period_rows(self, symbol, timeframe, start_date=None, end_date=None):
+        """period_bars rows aggregated from the stored daily candles in [start_date, end_date]."""
+        bars = aggregate_bars(self.get_history_arrays(symbol, start_date, end_date), timeframe)
+        now = datetime.now().isoformat()
+        return [
+            (symbol, timeframe, date, *values, first, last, int(sessions), now)
+            for date, *values, first, last, sessions in zip(
+                bars['date'], *(bars[f].tolist() for f in self._BAR_FIELDS),
+                bars['first_date'], bars['last_date'], bars['sessions'])
+        ]
+
+    def update_period_bars(self, symbol, from_date=None, timeframes=PERIOD_TIMEFRAMES):
+        """
+        Recomputes the stored bars of the periods from the one holding `from_date` onwards (all of
+        them without a date). The period holding from_date is rebuilt from its first stored session,
+        so a still-open week or month is simply rewritten when its next session lands.
+        """
+        started = time.perf_counter()
+        with self._get_connection() as conn:
+            for timeframe in timeframes:
+                start = from_date
+                if from_date:
+                    res = conn.execute('''
+                        SELECT first_date FROM period_bars WHERE symbol = ? AND timeframe = ? AND date >= ?
+                        ORDER BY date LIMIT 1
+                    ''', (symbol, timeframe, str(from_date)[:10])).fetchone()
+                    if res and res[0] < start:
+                        start = res[0]
+                rows = self._period_rows(symbol, timeframe, start)
+                if start:
+                    conn.execute('DELETE FROM period_bars WHERE symbol = ? AND timeframe = ? AND date >= ?',
+                                 (symbol, timeframe, period_end(start, timeframe)))
+                else:
+                    conn.execute('DELETE FROM period_bars WHERE symbol = ? AND timeframe = ?', (symbol, timeframe))
+                conn.executemany('''
+                    INSERT OR REPLACE INTO period_bars
+                    (symbol, timeframe, date, open, high, low, close, volume, first_date, last_date, sessions, last_updated)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+            conn.commit()
+        logger.debug(f"Updated {'/'.join(timeframes)} bars of {symbol} from {from_date} in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def _sync_period_bars(self, symbol, timeframe):
+        """Builds or catches up the bars of series stored before period_bars existed (or written around save_history)."""
+        latest = self.get_latest_date(symbol)
+        if not latest:
+            return
+        with self._get_connection() as conn:
+            covered = conn.execute('SELECT MAX(last_date) FROM period_bars WHERE symbol = ? AND timeframe = ?',
+                                   (symbol, timeframe)).fetchone()[0]
+        if covered != latest:
+            self.update_period_bars(symbol, covered if covered and covered < latest else None, (timeframe,))
+
+    def get_period_bars(self, symbol, timeframe, start_date=None, end_date=None, limit=None, lead=0):
+        """
+        Stored weekly / monthly bars of a price_history key, sorted by date (same window arguments as
+        get_history; lead and limit count bars). Bars carry date (period end), OHLCV, sessions and
+        last_date; the newest bar is still open while last_date is before its period end. With an
+        end_date inside a period, that period's bar is re-aggregated from its sessions up to end_date.
+        """
+        self._sync_period_bars(symbol, timeframe)
+        label = period_end(end_date, timeframe) if end_date else None
+        if start_date and lead:
+            start_date = self._date_before(symbol, start_date, lead, timeframe)
+        where, params = self._history_window(symbol, start_date, label, limit, timeframe)
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(f'SELECT date, open, high, low, close, volume, first_date, last_date, sessions FROM period_bars {where}', params)
+            rows = [dict(row) for row in cursor.fetchall()]
+        if limit:
+            rows.reverse()
+        if rows and label and rows[-1]['date'] == label and rows[-1]['last_date'][:10] > end_date:
+            partial = self._period_rows(symbol, timeframe, rows[-1]['first_date'], end_date)
+            if partial:
+                _, _, date, *values, first, last, sessions, _ = partial[-1]
+                rows[-1] = {'date': date, **dict(zip(self._BAR_FIELDS, values)), 'first_date': first, 'last_date': last, 'sessions': sessions}
+            else:
+                rows.pop()
+        return [{'date': row['date'], **{f: row[f] for f in self._BAR_FIELDS}, 'sessions': row['sessions'], 'last_date': row['last_date']}
+                for row in rows]
+
+    # --- Materialized Proxy Index Methods ---
+
+    def save_proxy_index(self, index_key, components, index_frame, synced_dates, replace=False):
+        """
+        Persists a computed proxy index series (DataFrame from index_engine.build_aggregate_index).
+        components is a list of (symbol, history_key, weight); synced_dates maps each history_key to
+        the latest component candle the series now covers. With replace=True the stored series and
+        constituents are rebuilt from scratch, otherwise rows are appended/upserted.
+        """
+        now = datetime.now().isoformat()
+        rows = [
+            (index_key, str(r.date), float(r.open), float(r.high), float(r.low), float(r.close),
+             float(r.volume), float(r.weight), int(r.components), now)
+            for r in index_frame.itertuples(index=False)
+        ]
+        with self._get_connection() as conn:
+            if replace:
+                conn.execute('DELETE FROM proxy_index_history WHERE index_key = ?', (index_key,))
+                conn.execute('DELETE FROM proxy_index_components WHERE index_key = ?', (index_key,))
+                conn.executemany('''
+                    INSERT INTO proxy_index_components (index_key, position, symbol, history_key, weight, last_updated)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [(index_key, i, sym, key, float(w), now) for i, (sym, key, w) in enumerate(components)])
+            conn.executemany('''
+                UPDATE proxy_index_components SET synced_date = ?, last_updated = ?
+                WHERE index_key = ? AND history_key = ?
+            ''', [(synced_dates.get(key), now, index_key, key) for _, key, _ in components])
+            conn.executemany('''
+                INSERT OR REPLACE INTO proxy_index_history
+                (index_key, date, open, high, low, close, volume, weight, components, last_updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+        return len(rows)
+
+    def get_proxy_components(self, index_key):
+        """Stored constituents of a proxy index as [(symbol, history_key, weight, synced_date)] in column order."""
+        with self._get_connection() as conn:
+            return conn.execute('''
+                SELECT symbol, history_key, weight, synced_date FROM proxy_index_components
+                WHERE index_key = ? ORDER BY position
+            ''', (index_key,)).fetchall()
+
+    def get_proxy_latest_date(self, index_key):
+        with self._get_connection() as conn:
+            res = conn.execute('SELECT MAX(date) FROM proxy_index_history WHERE index_key = ?', (index_key,)).fetchone()
+            return res[0] if res else None
+
+    def get_proxy_arrays(self, index_key, start_date=None, limit=None):
+        """Columnar read of a materialized proxy index (same layout as get_history_arrays)."""
+        query = 'SELECT date, open, high, low, close, volume FROM proxy_index_history WHERE index_key = ?'
+        params = [index_key]
+        if start_date:
+            query += ' AND date >= ?'
+            params.append(start_date)
+        if limit:
+            query += ' ORDER BY date DESC LIMIT ?'
+            params.append(int(limit))
+        else:
+            query += ' ORDER BY date ASC'
+        with self._get_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        if limit:
+            rows.reverse()
+        columns = list(zip(*rows)) if rows else [()] * 6
+        arrays = {'date': np.array(columns[0], dtype=object)}
+        for i, field in enumerate(self.HISTORY_FIELDS, start=1):
+            arrays[field] = np.array(columns[i], dtype=np.float64)
+        return arrays
+
+    def get_proxy_history(self, index_key):
+        """Materialized proxy index as candle dicts (BrsApi-style keys), sorted by date ascending."""
+        with self._get_connection() as conn:
+            rows = conn.execute('''
+                SELECT date, open, high, low, close, volume, weight, components
+                FROM proxy_index_history WHERE index_key = ? ORDER BY date ASC
+            ''', (index_key,)).fetchall()
+        return [
+            {'date': d, 'pf': o, 'pmax': h, 'pmin': l, 'pc': c, 'tvol': v, 'weight': w, 'components': n}
+            for d, o, h, l, c, v, w, n in rows
+        ]
+
     # --- Symbol Registry Methods ---
     
-    def save_symbols(self, symbol_list, market_category):
-        """Saves or updates symbols in the registry. Uses REPLACE to handle updates."""
+    _SYMBOLS_INSERT = {
+        "replace": '''
+            INSERT OR REPLACE INTO symbols
+            (isin, symbol_l18, name_l30, market_category, market_class, raw_data, last_updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''',
+        # Rewrites a registry row only when its payload or market actually changed
+        "upsert": '''
+            INSERT INTO symbols
+            (isin, symbol_l18, name_l30, market_category, market_class, raw_data, last_updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(isin) DO UPDATE SET
+                symbol_l18 = excluded.symbol_l18, name_l30 = excluded.name_l30,
+                market_category = excluded.market_category, market_class = excluded.market_class,
+                raw_data = excluded.raw_data, last_updated = excluded.last_updated
+            WHERE symbols.raw_data IS NOT excluded.raw_data
+               OR symbols.market_category IS NOT excluded.market_category
+               OR symbols.market_class IS NOT excluded.market_class
+        ''',
+    }
+
+    def save_symbols(self, symbol_list, market_category, mode="replace"):
+        """
+        Saves or updates symbols in the registry with batched executemany.
+        mode="replace" rewrites every row (INSERT OR REPLACE); mode="upsert" only touches changed rows.
+        The registered classifier (see register_classifier) fills market_class at ingest time.
+        """
         if not symbol_list or not isinstance(symbol_list, list):
             return
             
+        return self._bulk_write("symbols", self._SYMBOLS_INSERT[mode], self._symbol_rows(symbol_list, market_category))
+
+    def _symbol_rows(self, symbol_list, market_category):
+        """Prepared (isin, l18, l30, category, class, raw, ts) tuples for the symbols/staging tables."""
         now = datetime.now().isoformat()
+        category = str(market_category)
+        classify = self._classifier
+        rows = []
+        for sym in symbol_list:
+            # Use ISIN as primary key, fallback to ticker or id
+            isin = sym.get('isin') or sym.get('id') or sym.get('l18')
+            if not isin: continue
+            rows.append((
+                str(isin),
+                str(sym.get('l18', '')),
+                str(sym.get('l30', '')),
+                category,
+                classify(sym) if classify else None,
+                json.dumps(sym, ensure_ascii=False),
+                now
+            ))
+        return rows
+
+    def replace_symbols(self, symbol_list, market_category):
+        """
+        Atomic full refresh of one market category.
+        The new universe is first loaded into symbols_staging, then swapped into symbols
+        (delete old rows + copy staged rows) inside a single write transaction that also
+        bumps the registry generation. With WAL, concurrent readers see either the old or
+        the new universe, never an empty market. Returns the new generation of the category.
+        """
+        if not symbol_list or not isinstance(symbol_list, list):
+            return None
+
+        category = str(market_category)
+        rows = self._symbol_rows(symbol_list, category)
+        if not rows:
+            return None
+
+        # 1. Stage (slow part, outside the swap transaction)
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            for sym in symbol_list:
-                # Use ISIN as primary key, fallback to ticker or id
-                isin = sym.get('isin') or sym.get('id') or sym.get('l18')
-                if not isin: continue
-                
-                cursor.execute('''
-                    INSERT OR REPLACE INTO symbols 
-                    (isin, symbol_l18, name_l30, market_category, raw_data, last_updated)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    str(isin),
-                    str(sym.get('l18', '')),
-                    str(sym.get('l30', '')),
-                    str(market_category),
-                    json.dumps(sym, ensure_ascii=False),
-                    now
-                ))
+            conn.execute('DELETE FROM symbols_staging WHERE market_category = ?', (category,))
+            conn.commit()
+        self._bulk_write("symbols_staging", '''
+            INSERT OR REPLACE INTO symbols_staging
+            (isin, symbol_l18, name_l30, market_category, market_class, raw_data, last_updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+        # 2. Swap
+        with self._get_connection() as conn:
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('DELETE FROM symbols WHERE market_category = ?', (category,))
+                conn.execute('''
+                    INSERT OR REPLACE INTO symbols
+                    (isin, symbol_l18, name_l30, market_category, market_class, raw_data, last_updated)
+                    SELECT isin, symbol_l18, name_l30, market_category, market_class, raw_data, last_updated
+                    FROM symbols_staging WHERE market_category = ?
+                ''', (category,))
+                conn.execute('DELETE FROM symbols_staging WHERE market_category = ?', (category,))
+                generation = self._bump_generation(conn, category)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        logger.info(f"Registry swap for {category}: {len(rows)} symbols, generation {generation}")
+        return generation
+
+    def _bump_generation(self, conn, category):
+        """Increments the global and per-category registry generation inside the caller's transaction."""
+        generation = None
+        for key in ('registry_generation', f'registry_generation:{category}'):
+            res = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+            value = int(res[0]) + 1 if res else 1
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+            generation = value
+        return generation
+
+    def get_registry_generation(self, market_category=None):
+        """
+        Monotonic counter bumped by every atomic registry swap (globally, or for one category).
+        Readers compare it with the value they cached to know whether their copy is stale.
+        """
+        key = 'registry_generation' if market_category is None else f'registry_generation:{market_category}'
+        return int(self.get_meta(key, 0))
+
+    def register_classifier(self, classifier, version):
+        """
+        Sets the function used to precompute market_class at ingest time.
+        Stored rows are reclassified in bulk when the rules version differs from the one
+        they were classified with, or when unclassified rows exist (e.g. right after migration).
+        """
+        self._classifier = classifier
+        with self._get_connection() as conn:
+            unclassified = conn.execute('SELECT COUNT(*) FROM symbols WHERE market_class IS NULL').fetchone()[0]
+        if unclassified or self.get_meta('classifier_version') != str(version):
+            self.reclassify_symbols()
+            self.set_meta('classifier_version', version)
+
+    def reclassify_symbols(self):
+        """Recomputes market_class for every stored symbol with the registered classifier."""
+        if not self._classifier:
+            return 0
+        with self._get_connection() as conn:
+            rows = conn.execute('SELECT isin, raw_data FROM symbols').fetchall()
+            updates = []
+            for isin, raw in rows:
+                try: sym = json.loads(raw) if raw else {}
+                except ValueError: sym = {}
+                updates.append((self._classifier(sym), isin))
+            conn.executemany('UPDATE symbols SET market_class = ? WHERE isin = ?', updates)
             conn.commit()
+        logger.info(f"Reclassified {len(updates)} registry symbols")
+        return len(updates)
+
+    def get_symbols_by_class(self, market_classes, category_prefix="symbols_type_"):
+        """Indexed lookup of registry symbols by precomputed market class (one row per ISIN)."""
+        classes = list(market_classes)
+        if not classes:
+            return []
+        placeholders = ",".join("?" * len(classes))
+        with self._get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT raw_data FROM symbols
+                WHERE market_class IN ({placeholders}) AND market_category LIKE ?
+                ORDER BY symbol_l18
+            ''', (*classes, f"{category_prefix}%")).fetchall()
+            return [json.loads(row[0]) for row in rows]
+
+    def get_registry_version(self):
+        """Cheap change marker for the registry (swap generation + row count + newest write)."""
+        with self._get_connection() as conn:
+            count, newest = conn.execute('SELECT COUNT(*), MAX(last_updated) FROM symbols').fetchone()
+        return (self.get_registry_generation(), count, newest)
+
+    def get_registry_entries(self, category_prefix="symbols_type_"):
+        """(isin, ticker, name, market_class) for every registry row, without decoding raw_data."""
+        with self._get_connection() as conn:
+            return conn.execute('''
+                SELECT isin, symbol_l18, name_l30, market_class FROM symbols
+                WHERE market_category LIKE ?
+            ''', (f"{category_prefix}%",)).fetchall()
+
+    def get_symbols_by_l18(self, tickers, category_prefix="symbols_type_"):
+        """{ticker: registry snapshot} for several tickers in one indexed query."""
+        tickers = list(dict.fromkeys(tickers))
+        if not tickers:
+            return {}
+        placeholders = ",".join("?" * len(tickers))
+        with self._get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT symbol_l18, raw_data FROM symbols
+                WHERE symbol_l18 IN ({placeholders}) AND market_category LIKE ?
+            ''', (*tickers, f"{category_prefix}%")).fetchall()
+            return {ticker: json.loads(raw) for ticker, raw in rows if raw}
 
     def get_symbols_by_market(self, market_category):
         """Retrieves symbols for a specific market from local storage."""
         with self._get_connection() as conn:
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             cursor.execute('SELECT raw_data FROM symbols WHERE market_category = ?', (market_category,))
             rows = cursor.fetchall()
             return [json.loads(row['raw_data']) for row in rows]
@@ -0,0 +1,79 @@
+"""
+Trading-period calendar shared by the resampler (TechnicalAnalyzer) and the stored period bars
+(SymbolDatabase.period_bars).
+
+Bars are labelled with the last calendar day of their period:
+- weekly: Saturday-Wednesday trading weeks, labelled with the Wednesday (pandas 'W-WED')
+- monthly: Jalali (Solar Hijri) calendar months, labelled with the month's last day
+"""
+import jdatetime
+import numpy as np
+import pandas as pd
+
+PERIOD_TIMEFRAMES = ('weekly', 'monthly')
+
+def _jalali_month_ends(dates):
+    """
+    Last Gregorian day of the Jalali month of each date. Only the month boundaries of the covered
+    span are converted; dates are placed by binary search.
+    """
+    month = jdatetime.date.fromgregorian(date=dates.min().date()).replace(day=1)
+    last = dates.max()
+    ends = []
+    while not ends or ends[-1] < last:
+        month = jdatetime.date(month.year + 1, 1, 1) if month.month == 12 else jdatetime.date(month.year, month.month + 1, 1)
+        ends.append(pd.Timestamp(month.togregorian()) - pd.Timedelta(days=1))
+    ends = pd.DatetimeIndex(ends)
+    return ends[np.searchsorted(ends.values, dates.values, side='left')]
+
+def period_ends(dates, timeframe):
+    """Period label (DatetimeIndex) of every date in a DatetimeIndex for 'weekly' or 'monthly'."""
+    dates = pd.DatetimeIndex(dates).normalize()
+    if not len(dates):
+        return dates
+    if timeframe == 'weekly':
+        # Days until the next Wednesday (weekday 2), 0 on Wednesdays
+        return dates + pd.to_timedelta((2 - dates.weekday) % 7, unit='D')
+    if timeframe == 'monthly':
+        return _jalali_month_ends(dates)
+    raise ValueError(f"Unknown period timeframe {timeframe!r}")
+
+def period_end(date, timeframe):
+    """Period label ('YYYY-MM-DD') of a single date string."""
+    return period_ends(pd.DatetimeIndex([str(date)[:10]]), timeframe)[0].strftime('%Y-%m-%d')
+
+def aggregate_bars(arrays, timeframe):
+    """
+    Period bars of date-sorted daily columns (get_history_arrays layout: 'date' plus float
+    open/high/low/close/volume). Candles without a close are skipped and missing open/high/low fall
+    back to the close, like TechnicalAnalyzer.prepare_ohlcv_data. Consecutive candles with the same
+    label form a bar, reduced with ufunc.reduceat. Returns a dict of arrays: 'date' (label),
+    open/high/low/close/volume, 'first_date' / 'last_date' (first and last session) and 'sessions'.
+    """
+    close = arrays['close']
+    keep = np.isfinite(close) & (close != 0)
+    close = close[keep]
+    dates = np.asarray(arrays['date'], dtype=object)[keep]
+    if not len(dates):
+        return {'date': dates, 'first_date': dates, 'last_date': dates, 'sessions': np.array([], dtype=np.int64),
+                **{f: close for f in ('open', 'high', 'low', 'close', 'volume')}}
+
+    def filled(name, fallback):
+        values = arrays[name][keep]
+        return np.where(np.isfinite(values) & (values != 0), values, fallback)
+
+    labels = period_ends(pd.to_datetime([str(d)[:10] for d in dates]), timeframe)
+    label_values = labels.values
+    starts = np.flatnonzero(np.r_[True, label_values[1:] != label_values[:-1]])
+    ends = np.r_[starts[1:], len(dates)] - 1
+    return {
+        'date': np.asarray(labels[starts].strftime('%Y-%m-%d'), dtype=object),
+        'open': filled('open', close)[starts],
+        'high': np.maximum.reduceat(filled('high', close), starts),
+        'low': np.minimum.reduceat(filled('low', close), starts),
+        'close': close[ends],
+        'volume': np.add.reduceat(filled('volume', 0.0), starts),
+        'first_date': dates[starts],
+        'last_date': dates[ends],
+        'sessions': ends - starts + 1,
+    }
@@ -0,0 +1,32 @@
+"""
+Market classification rules for registry symbols.
+Kept free of client state so the database layer can apply them once at ingest time.
+"""
+
+# Bump whenever the rules below change; stored rows are then reclassified in bulk.
+CLASSIFIER_VERSION = 1
+
+def normalize_text(text):
+    if not text: return ""
+    # Standardize Persian characters
+    return text.replace('ي', 'ی').replace('ك', 'ک').strip()
+
+def classify_equity_market(s):
+    """Refined classification logic."""
+    isin = str(s.get('isin', ''))
+    cs_id = str(s.get('cs_id', '') or s.get('cs', ''))
+    cs_name = str(s.get('cs_name', ''))
+    flow = str(s.get('flow', ''))
+    market_name = str(s.get('market_name', '')).lower()
+    ticker = str(s.get('l18', ''))
+
+    if not isin or isin == "None": return "unknown"
+    if cs_id == "68" or isin.startswith("IRO5") or "etf" in cs_name.lower() or "صندوق" in cs_name or "صندوق" in ticker: return "etf"
+    if cs_id == "69" or isin.startswith(("IRO2", "IRO4", "IROB")) or any(k in cs_name for k in ["اوراق", "سکوک", "اجاره", "مرابحه", "منفعت", "گام"]): return "fixed_income"
+    if cs_id == "59" or isin.startswith("IROL") or any(k in cs_name for k in ["تسهیلات", "مسکن"]) or ticker.startswith("تسه"): return "tashilat"
+    if "انرژی" in market_name or "energy" in market_name or "انرژی" in cs_name: return "energy"
+    if cs_id in ["67", "28", "32"] or any(k in ticker for k in ["سکه", "طلا", "زعف", "نفت", "برنج", "پسته", "میوه", "شمش"]): return "commodity"
+    if flow in ["5", "6", "7", "8"] or any(k in market_name for k in ["پایه", "payeh", "زرد", "نارنجی", "قرمز"]) or isin.startswith("IRO7"): return "base"
+    if flow in ["3", "4"] or any(k in market_name for k in ["فرابورس", "farabourse", "ifb"]) or isin.startswith("IRO3"): return "farabourse"
+    if flow in ["1", "2"] or any(k in market_name for k in ["بورس", "bourse", "tse"]) or isin.startswith("IRO1"): return "bourse"
+    return "bourse"
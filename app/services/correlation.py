@@ -0,0 +1,241 @@
+import time
+import threading
+import logging
+
+import numpy as np
+
+from app.database import db
+from app.services.index_engine import align_components
+
+logger = logging.getLogger(__name__)
+
+def _masked(returns):
+    """(returns with NaN replaced by 0, float mask of valid entries) for masked matrix products."""
+    valid = ~np.isnan(returns)
+    return np.where(valid, returns, 0.0), valid.astype(np.float64)
+
+def beta_statistics(returns, benchmark, min_observations=30):
+    """
+    Beta, correlation and observation count of every column of a (days x symbols) returns matrix
+    against a benchmark return series. NaN entries are skipped pairwise (each symbol uses the days
+    it has a return on), and all moments come from a handful of matrix-vector products.
+    """
+    r, m = _masked(returns)
+    b = np.asarray(benchmark, dtype=np.float64)
+    n = m.sum(axis=0)
+    sum_b, sum_bb = b @ m, (b * b) @ m
+    sum_r, sum_rr, sum_rb = r.sum(axis=0), (r * r).sum(axis=0), b @ r
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sum_rb - sum_r * sum_b / n
+        var_b = sum_bb - sum_b * sum_b / n
+        var_r = sum_rr - sum_r * sum_r / n
+        beta = cov / var_b
+        corr = cov / np.sqrt(var_r * var_b)
+    short = n < min_observations
+    beta[short | ~np.isfinite(beta)] = np.nan
+    corr[short | ~np.isfinite(corr)] = np.nan
+    return beta, corr, n.astype(int)
+
+def correlation_matrix(returns, min_observations=30):
+    """
+    Pairwise-complete Pearson correlation of the columns of a (days x symbols) returns matrix.
+    Pair counts, pairwise sums and cross products are four matrix products over the masked matrix.
+    """
+    r, m = _masked(returns)
+    n = m.T @ m
+    sums = r.T @ m               # sums[i, j]: sum of r_i over the days r_j is valid too
+    squares = (r * r).T @ m
+    cross = r.T @ r
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = cross - sums * sums.T / n
+        var = squares - sums * sums / n
+        corr = cov / np.sqrt(var * var.T)
+    corr[(n < min_observations) | ~np.isfinite(corr)] = np.nan
+    np.fill_diagonal(corr, 1.0)
+    return np.clip(corr, -1.0, 1.0)
+
+def rolling_betas(returns, benchmark, window=60, min_periods=None):
+    """
+    Beta of every column over a trailing window, for all days at once: windowed sums are
+    differences of cumulative sums. Returns a (days x symbols) matrix, NaN until a window holds
+    `min_periods` observations (default: half the window).
+    """
+    min_periods = min_periods or max(2, window // 2)
+    r, m = _masked(returns)
+    b = np.asarray(benchmark, dtype=np.float64)[:, None]
+
+    idx = np.arange(1, len(r) + 1)
+    lo = np.maximum(idx - window, 0)
+
+    def windowed(x):
+        csum = np.vstack([np.zeros((1, x.shape[1])), np.cumsum(x, axis=0)])
+        return csum[idx] - csum[lo]
+
+    n = windowed(m)
+    sum_b, sum_bb = windowed(b * m), windowed(b * b * m)
+    sum_r, sum_rb = windowed(r), windowed(r * b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = (sum_rb - sum_r * sum_b / n) / (sum_bb - sum_b * sum_b / n)
+    beta[(n < min_periods) | ~np.isfinite(beta)] = np.nan
+    return beta
+
+class CorrelationEngine:
+    """
+    Beta and correlation of stored price series against a benchmark index, computed
+    cross-sectionally: closes of all requested series are read in one query, aligned with the
+    benchmark on its trading days into a returns matrix, and reduced with matrix products.
+    The benchmark is a materialized proxy index (proxy_index_history) or any price_history key.
+    Results are cached per trading day (the benchmark's latest date) and per series version (the
+    series' own latest date), so a refreshed history gets a new beta.
+    """
+
+    LOOKBACK = 250            # trading days of returns (about one year)
+    ROLLING_WINDOW = 60
+    MIN_OBSERVATIONS = 30     # same floor as the index_data beta of calculate_technical_analysis
+
+    def __init__(self, database):
+        self._db = database
+        self._lock = threading.Lock()
+        self._trading_day = {}
+        self._betas = {}
+        self._views = {}
+
+    def _benchmark(self, benchmark_key, lookback):
+        arrays = self._db.get_proxy_arrays(benchmark_key, limit=lookback + 1)
+        if not len(arrays['date']):
+            arrays = self._db.get_history_arrays(benchmark_key, limit=lookback + 1)
+        keep = ~np.isnan(arrays['close'])
+        return {'date': arrays['date'][keep], 'close': arrays['close'][keep]}
+
+    def trading_day(self, benchmark_key):
+        """Latest date of the benchmark, which scopes every cached result."""
+        latest = self._db.get_proxy_latest_date(benchmark_key) or self._db.get_latest_date(benchmark_key)
+        return latest[:10] if latest else None
+
+    def returns_matrix(self, history_keys, benchmark_key, lookback=None):
+        """
+        Simple daily returns of several series and of the benchmark over the benchmark's last
+        `lookback` trading days. Returns (dates, returns, benchmark_returns) where returns is a
+        (days x series) matrix with NaN on days a series has no candle (or had none the day before);
+        None when the benchmark has no history.
+        """
+        lookback = lookback or self.LOOKBACK
+        bench = self._benchmark(benchmark_key, lookback)
+        if len(bench['date']) < 2:
+            return None
+        history_keys = list(history_keys)
+        series = self._db.get_closes(history_keys, start_date=str(bench['date'][0])[:10])
+        dates, matrices = align_components([bench] + [series.get(key) for key in history_keys], fields=('close',))
+
+        closes = matrices['close']
+        trading = ~np.isnan(closes[:, 0])
+        dates, closes = dates[trading], closes[trading]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = closes[1:] / closes[:-1] - 1.0
+        returns[~np.isfinite(returns)] = np.nan
+        return dates[1:], returns[:, 1:], returns[:, 0]
+
+    def _scope(self, benchmark_key):
+        """Current trading day of a benchmark; drops cached results of earlier days."""
+        day = self.trading_day(benchmark_key)
+        with self._lock:
+            if self._trading_day.get(benchmark_key) != day:
+                self._trading_day[benchmark_key] = day
+                self._betas = {k: v for k, v in self._betas.items() if k[0] != benchmark_key}
+                self._views = {k: v for k, v in self._views.items() if k[0] != benchmark_key}
+        return day
+
+    def betas(self, history_keys, benchmark_key, lookback=None):
+        """
+        {history_key: {'beta', 'correlation', 'observations'}} against the benchmark.
+        Series not cached for the current trading day are computed together in one pass.
+        """
+        lookback = lookback or self.LOOKBACK
+        day = self._scope(benchmark_key)
+        if day is None:
+            return {}
+        history_keys = list(dict.fromkeys(history_keys))
+        versions = self._db.get_latest_dates(history_keys)
+        results = {}
+        with self._lock:
+            for k in history_keys:
+                cached = self._betas.get((benchmark_key, lookback, k))
+                if cached and cached[0] == versions.get(k):
+                    results[k] = cached[1]
+        missing = [k for k in history_keys if k not in results]
+        if not missing:
+            return results
+
+        started = time.perf_counter()
+        matrix = self.returns_matrix(missing, benchmark_key, lookback)
+        if matrix is None:
+            return results
+        _, returns, bench = matrix
+        beta, corr, n = beta_statistics(returns, bench, self.MIN_OBSERVATIONS)
+        computed = {
+            key: {
+                'beta': None if np.isnan(beta[j]) else round(float(beta[j]), 2),
+                'correlation': None if np.isnan(corr[j]) else round(float(corr[j]), 3),
+                'observations': int(n[j]),
+            }
+            for j, key in enumerate(missing)
+        }
+        with self._lock:
+            self._betas.update({(benchmark_key, lookback, k): (versions.get(k), v) for k, v in computed.items()})
+        logger.debug(f"Computed {len(missing)} betas against {benchmark_key} in {(time.perf_counter() - started) * 1000:.1f} ms")
+        results.update(computed)
+        return results
+
+    def beta(self, history_key, benchmark_key, lookback=None):
+        """Beta of one series against the benchmark (None when there is too little overlap)."""
+        stats = self.betas([history_key], benchmark_key, lookback).get(history_key)
+        return stats['beta'] if stats else None
+
+    def correlation_view(self, history_keys, benchmark_key, lookback=None, window=None):
+        """
+        Betas, correlation matrix and rolling betas of a group of series (e.g. the compare list).
+        Returns a dict with 'trading_day', 'betas' (by key), 'matrix' (rows/columns in key order)
+        and 'rolling' {'window', 'dates', 'betas': {key: [...]}}; None without benchmark history.
+        """
+        lookback = lookback or self.LOOKBACK
+        window = window or self.ROLLING_WINDOW
+        history_keys = list(dict.fromkeys(history_keys))
+        day = self._scope(benchmark_key)
+        if day is None:
+            return None
+        cache_key = (benchmark_key, lookback, window, tuple(history_keys))
+        versions = self._db.get_latest_dates(history_keys)
+        with self._lock:
+            cached = self._views.get(cache_key)
+            if cached and cached[0] == versions:
+                return cached[1]
+
+        matrix = self.returns_matrix(history_keys, benchmark_key, lookback)
+        if matrix is None:
+            return None
+        dates, returns, bench = matrix
+        corr = correlation_matrix(returns, self.MIN_OBSERVATIONS)
+        rolling = rolling_betas(returns, bench, window)
+        # Rolling values only from the first day any series has a full-enough window
+        first = np.flatnonzero(~np.isnan(rolling).all(axis=1))
+        start = int(first[0]) if len(first) else len(dates)
+
+        def clean(values, digits):
+            return [None if np.isnan(v) else round(float(v), digits) for v in values]
+
+        view = {
+            'trading_day': day,
+            'lookback': lookback,
+            'betas': self.betas(history_keys, benchmark_key, lookback),
+            'matrix': [clean(row, 3) for row in corr],
+            'rolling': {
+                'window': window,
+                'dates': [str(d) for d in dates[start:]],
+                'betas': {key: clean(rolling[start:, j], 2) for j, key in enumerate(history_keys)},
+            },
+        }
+        with self._lock:
+            self._views[cache_key] = (versions, view)
+        return view
+
+correlation_engine = CorrelationEngine(db)
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+OHLCV_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+def _as_float(values):
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+
+def _day_keys(dates):
+    dates = np.asarray(dates)
+    try:
+        return dates.astype('datetime64[D]')
+    except ValueError:
+        # Dates with a time suffix: keep the 'YYYY-MM-DD' part only
+        return dates.astype(str).astype('U10').astype('datetime64[D]')
+
+def align_components(components, fields=OHLCV_FIELDS):
+    """
+    Aligns per-symbol OHLCV series on the union of their dates.
+    Each component is a DataFrame or a dict of arrays (as returned by SymbolDatabase.get_history_arrays)
+    with 'date' plus open/high/low/close/volume.
+    Returns (dates, matrices) where dates is a sorted array of 'YYYY-MM-DD' strings and
+    matrices[field] is a float64 (n_dates x n_symbols) matrix with NaN where a symbol has no candle.
+    """
+    # Empty components keep their (all-NaN) column so columns stay aligned with weights
+    components = [c if c is not None and len(c['date']) else None for c in components]
+    day_keys = [_day_keys(c['date']) if c is not None else None for c in components]
+    present = [d for d in day_keys if d is not None]
+    if not present:
+        return np.array([], dtype=object), {field: np.empty((0, len(components))) for field in fields}
+
+    # Integer day keys make the union/sort/search cheap compared to string dates
+    days_union = np.unique(np.concatenate(present))
+    dates = np.datetime_as_string(days_union, unit='D').astype(object)
+    matrices = {field: np.full((len(dates), len(components)), np.nan) for field in fields}
+    for j, (c, days) in enumerate(zip(components, day_keys)):
+        if c is None:
+            continue
+        rows = np.searchsorted(days_union, days)
+        for field in fields:
+            if field in c:
+                matrices[field][rows, j] = _as_float(c[field])
+    return dates, matrices
+
+def _forward_fill(matrix, valid):
+    """Column-wise forward fill of `matrix` from the last row where `valid` is True."""
+    rows = np.where(valid, np.arange(matrix.shape[0])[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return matrix[rows, np.arange(matrix.shape[1])]
+
+def build_aggregate_index(components, weights=None, fill='ffill', seed_close=None):
+    """
+    Computes a weighted (or equal-weight, when weights is None) OHLC index over several components
+    in one vectorized pass over a date x symbol matrix.
+
+    Missing days are handled explicitly:
+    - fill='ffill': a component that is listed (has had a candle before) but did not trade on a day
+      contributes its last close as a flat candle (O=H=L=C, zero volume), so its weight stays in the index.
+    - fill='skip': a component only counts on days it actually traded; the remaining weights are
+      renormalized (the behaviour of the previous groupby implementation).
+    Components never count before their first candle.
+
+    seed_close (ffill only) carries each component's last known close from before the first
+    date of `components`, so an already materialized index can be extended with new candles only.
+
+    Returns a DataFrame sorted by date ascending with columns
+    date, open, high, low, close, volume, weight (sum of active weights), components.
+    """
+    dates, m = align_components(components)
+    if not len(dates):
+        return pd.DataFrame(columns=['date', *OHLCV_FIELDS, 'weight', 'components'])
+
+    n_symbols = m['close'].shape[1]
+    w = np.ones(n_symbols) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    seeded = seed_close is not None and fill == 'ffill'
+    if seeded:
+        # Virtual first row holding the prior closes; dropped from the output below
+        seed = np.asarray(seed_close, dtype=np.float64).reshape(1, n_symbols)
+        dates = np.concatenate([np.array([None], dtype=object), dates])
+        for f in OHLCV_FIELDS:
+            m[f] = np.vstack([seed if f != 'volume' else np.zeros((1, n_symbols)), m[f]])
+
+    close = m['close']
+    traded = ~np.isnan(close)
+    # Index-style series may only carry a close; use it for the missing price fields
+    prices = {f: np.where(np.isnan(m[f]), close, m[f]) for f in ('open', 'high', 'low')}
+    prices['close'] = close
+    volume = np.nan_to_num(m['volume'])
+
+    if fill == 'ffill':
+        listed = np.maximum.accumulate(traded, axis=0)
+        last_close = _forward_fill(close, traded)
+        for f in prices:
+            prices[f] = np.where(traded, prices[f], last_close)
+        active = listed
+        volume = np.where(traded, volume, 0.0)
+    elif fill == 'skip':
+        active = traded
+    else:
+        raise ValueError(f"Unknown fill mode: {fill}")
+
+    active_w = active * w
+    total_w = active_w.sum(axis=1)
+    keep = total_w > 0
+    if seeded:
+        keep[0] = False
+
+    result = {'date': dates[keep]}
+    for f, values in prices.items():
+        weighted = np.where(active, np.nan_to_num(values), 0.0) * w
+        result[f] = weighted.sum(axis=1)[keep] / total_w[keep]
+    result['volume'] = np.where(active, volume, 0.0).sum(axis=1)[keep]
+    result['weight'] = total_w[keep]
+    result['components'] = active.sum(axis=1)[keep]
+    return pd.DataFrame(result)[['date', *OHLCV_FIELDS, 'weight', 'components']]
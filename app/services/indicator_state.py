@@ -0,0 +1,261 @@
+import math
+import time
+import logging
+from collections import deque
+
+from app.database import db
+from app.services.technical_analysis import TechnicalAnalyzer, INDICATOR_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+_PRICE_COLUMNS = ('SMA20', 'BBU', 'BBL', 'SMA50')
+
+def _price_rounding(price):
+    """Decimal places used for prices of this magnitude (same rule as TechnicalAnalyzer.prepare_ohlcv_data)."""
+    return 0 if price > 1000 else (1 if price > 100 else 2)
+
+class StreamingIndicators:
+    """
+    Running state of the TechnicalAnalyzer indicator set for one series.
+    update() consumes one candle in constant time (EMA accumulators, Wilder RSI/ATR/ADX sums and
+    52-bar rolling windows), and snapshot() yields the same values calculate_technical_analysis
+    computes for the latest bar from the full history.
+    """
+
+    VERSION = 1
+    WINDOW = 52          # longest rolling window (Ichimoku span B)
+    WILDER = 14          # RSI / ATR / ADX period
+
+    def __init__(self):
+        self.bars = 0
+        self.highs, self.lows, self.closes = deque(maxlen=self.WINDOW), deque(maxlen=self.WINDOW), deque(maxlen=self.WINDOW)
+        self.prev = None                    # (high, low, close) of the previous bar
+        self.ema12 = self.ema26 = None
+        self.macd_sig, self.macd_count = None, 0
+        self.rsi_up = self.rsi_down = None
+        self.atr, self.tr_sum = 0.0, 0.0
+        self.dm_sums = [0.0, 0.0, 0.0]      # warm-up sums of true range, +DM, -DM
+        self.trs = self.dip = self.din = None
+        self.dx_sum, self.adx = 0.0, None
+
+    @staticmethod
+    def _ema_step(prev, value, alpha):
+        return value if prev is None else prev + alpha * (value - prev)
+
+    def update(self, high, low, close):
+        """Consumes one candle (prices already rounded like prepare_ohlcv_data)."""
+        w = self.WILDER
+        k = self.bars
+        if self.prev is None:
+            tr, up, down, pos, neg = high - low, 0.0, 0.0, 0.0, 0.0
+        else:
+            p_high, p_low, p_close = self.prev
+            tr = max(high, p_close) - min(low, p_close)
+            diff = close - p_close
+            up, down = max(diff, 0.0), max(-diff, 0.0)
+            diff_up, diff_down = high - p_high, p_low - low
+            pos = diff_up if diff_up > diff_down and diff_up > 0 else 0.0
+            neg = diff_down if diff_down > diff_up and diff_down > 0 else 0.0
+
+        # MACD: EMA12 / EMA26 from the first bar, signal EMA9 from the first valid MACD (bar 25)
+        self.ema12 = self._ema_step(self.ema12, close, 2.0 / 13)
+        self.ema26 = self._ema_step(self.ema26, close, 2.0 / 27)
+        if k >= 25:
+            self.macd_sig = self._ema_step(self.macd_sig, self.ema12 - self.ema26, 2.0 / 10)
+            self.macd_count += 1
+
+        # RSI: Wilder averages of gains / losses starting at the first bar
+        self.rsi_up = self._ema_step(self.rsi_up, up, 1.0 / w)
+        self.rsi_down = self._ema_step(self.rsi_down, down, 1.0 / w)
+
+        # ATR: mean of the first 14 true ranges (first bar: high - low), then Wilder smoothing
+        if k < w:
+            self.tr_sum += tr
+            if k == w - 1:
+                self.atr = self.tr_sum / w
+        else:
+            self.atr = (self.atr * (w - 1) + tr) / w
+
+        # ADX: directional sums seeded over bars 1..14, DX averaged over bars 14..27, then smoothed
+        if 1 <= k <= w:
+            self.dm_sums = [self.dm_sums[0] + tr, self.dm_sums[1] + pos, self.dm_sums[2] + neg]
+            if k == w:
+                self.trs, self.dip, self.din = self.dm_sums
+        elif k > w:
+            decay = 1.0 - 1.0 / w
+            self.trs, self.dip, self.din = self.trs * decay + tr, self.dip * decay + pos, self.din * decay + neg
+        if k >= w:
+            dip = 100.0 * self.dip / self.trs if self.trs != 0 else 0.0
+            din = 100.0 * self.din / self.trs if self.trs != 0 else 0.0
+            dx = 100.0 * abs((dip - din) / (dip + din)) if dip + din != 0 else 0.0
+            if k < 2 * w - 1:
+                self.dx_sum += dx
+            elif k == 2 * w - 1:
+                self.adx = (self.dx_sum + dx) / w
+            else:
+                self.adx = (self.adx * (w - 1) + dx) / w
+
+        self.highs.append(high)
+        self.lows.append(low)
+        self.closes.append(close)
+        self.prev = (high, low, close)
+        self.bars = k + 1
+
+    def snapshot(self):
+        """Indicator values of the latest bar; None where the history is too short (as in the batch path)."""
+        n = self.bars
+        out = dict.fromkeys(INDICATOR_COLUMNS)
+        if n == 0:
+            return out
+        closes = list(self.closes)
+
+        if n >= 20:
+            window = closes[-20:]
+            mean = sum(window) / 20
+            std = math.sqrt(sum((c - mean) ** 2 for c in window) / 20)
+            out.update(SMA20=mean, BBU=mean + 2 * std, BBL=mean - 2 * std)
+        else:
+            window = closes[-min(n, 5):]
+            out['SMA20'] = sum(window) / len(window)
+        if n >= 50:
+            out['SMA50'] = sum(closes[-50:]) / 50
+        if n >= 26:
+            out['MACD'] = self.ema12 - self.ema26
+            out['MACD_Sig'] = self.macd_sig if self.macd_count >= 9 else None
+        if n >= self.WILDER:
+            out['RSI'] = 100.0 if self.rsi_down == 0 else 100.0 - 100.0 / (1.0 + self.rsi_up / self.rsi_down)
+            out['ATR'] = self.atr
+            out['ADX'] = self.adx if n >= 2 * self.WILDER else None
+        if n >= 52:
+            highs, lows = list(self.highs), list(self.lows)
+            conv = 0.5 * (max(highs[-9:]) + min(lows[-9:]))
+            base = 0.5 * (max(highs[-26:]) + min(lows[-26:]))
+            out.update(Ichimoku_A=0.5 * (conv + base), Ichimoku_B=0.5 * (max(highs) + min(lows)),
+                       Ichimoku_Base=base, Ichimoku_Conv=conv)
+        return out
+
+    def to_dict(self):
+        state = {k: v for k, v in self.__dict__.items() if k not in ('highs', 'lows', 'closes')}
+        state.update(version=self.VERSION, highs=list(self.highs), lows=list(self.lows), closes=list(self.closes))
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        """Restores a state; returns None for states written by another VERSION."""
+        if not state or state.get('version') != cls.VERSION:
+            return None
+        obj = cls()
+        for key, value in state.items():
+            if key in ('highs', 'lows', 'closes'):
+                getattr(obj, key).extend(value)
+            elif key != 'version':
+                setattr(obj, key, value)
+        if obj.prev is not None:
+            obj.prev = tuple(obj.prev)
+        return obj
+
+    def copy(self):
+        return StreamingIndicators.from_dict(self.to_dict())
+
+class IndicatorStateStore:
+    """
+    Persists a StreamingIndicators state per price_history key in the indicator_state table.
+    The stored state covers every candle except the latest one, which is kept separately: the
+    last candle of an open session may still change, so it is re-applied on each read instead
+    of being folded in. Advancing to new candles costs O(new candles); the stored state is
+    discarded and rebuilt from the full history only when the series it was built from changed
+    (candle count or last folded close differ, e.g. after an adjustment rewrite).
+    """
+
+    def __init__(self, database):
+        self._db = database
+
+    def _load(self, history_key):
+        stored = self._db.get_indicator_state(history_key)
+        if not stored:
+            return None
+        last_date, bars, payload = stored
+        base = StreamingIndicators.from_dict(payload.get('base'))
+        if base is None or bars != base.bars + 1:
+            return None
+        # Validate the folded part against the current series with two indexed lookups
+        if self._db.count_history(history_key, before_date=last_date) != base.bars:
+            return None
+        base_date = payload.get('base_date')
+        if base_date and base.prev is not None:
+            stored_close = self._db.get_close(history_key, base_date)
+            if stored_close is None or abs(self._round(stored_close) - base.prev[2]) > 1e-9:
+                return None
+        return last_date, base, base_date
+
+    @staticmethod
+    def _round(price):
+        return round(float(price), _price_rounding(float(price)))
+
+    def _advance(self, history_key):
+        """Brings the state of one series up to date; returns (row_for_db, latest_values) or None."""
+        loaded = self._load(history_key)
+        if loaded:
+            last_date, base, base_date = loaded
+            arrays = self._db.get_history_arrays(history_key, start_date=last_date)
+        else:
+            base, base_date = StreamingIndicators(), None
+            arrays = self._db.get_history_arrays(history_key)
+
+        candles = []
+        for date, high, low, close in zip(arrays['date'], arrays['high'], arrays['low'], arrays['close']):
+            if math.isnan(close):
+                continue
+            # High and low take the close's precision, as in TechnicalAnalyzer.prepare_ohlcv_data
+            digits = _price_rounding(float(close))
+            close = round(float(close), digits)
+            high = close if math.isnan(high) or not high else round(float(high), digits)
+            low = close if math.isnan(low) or not low else round(float(low), digits)
+            candles.append((date, high, low, close))
+        if not candles:
+            return None
+
+        for date, high, low, close in candles[:-1]:
+            base.update(high, low, close)
+            base_date = date
+        current = base.copy()
+        date, high, low, close = candles[-1]
+        current.update(high, low, close)
+
+        row = (history_key, date, current.bars, {'base': base.to_dict(), 'base_date': base_date})
+        return row, self._describe(date, close, current)
+
+    @staticmethod
+    def _describe(date, close, state):
+        values = state.snapshot()
+        decimals = _price_rounding(close)
+        result = {'date': date, 'close': close, 'bars': state.bars}
+        for col, value in values.items():
+            if value is not None:
+                value = round(value, decimals if col in _PRICE_COLUMNS else 2)
+            result[col] = value
+        result['Signal'] = TechnicalAnalyzer.signal_labels(values)
+        return result
+
+    def latest_many(self, history_keys):
+        """{history_key: latest indicator values} for several series; states are saved in one batch."""
+        started = time.perf_counter()
+        results, rows = {}, []
+        for key in history_keys:
+            try:
+                advanced = self._advance(key)
+            except Exception as e:
+                logger.error(f"Indicator state error for {key}: {e}")
+                advanced = None
+            if advanced:
+                rows.append(advanced[0])
+                results[key] = advanced[1]
+        if rows:
+            self._db.save_indicator_states(rows)
+        logger.debug(f"Advanced {len(rows)} indicator states in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return results
+
+    def latest(self, history_key):
+        return self.latest_many([history_key]).get(history_key)
+
+indicator_states = IndicatorStateStore(db)
@@ -0,0 +1,246 @@
+"""
+Pure NumPy indicator kernels.
+
+Every kernel works on float64 arrays and reproduces the numbers of the `ta` package
+(including its warm-up conventions) without building intermediate pandas objects.
+compute_indicators() evaluates the whole indicator set of TechnicalAnalyzer in one pass,
+sharing the EMAs between MACD and its signal line, the rolling mean between SMA20 and the
+Bollinger bands, and the true range between ATR and ADX.
+
+Kernels assume series without gaps after their first valid value; callers with NaNs inside
+the OHLC columns should use the `ta` path instead.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+_SCAN_BLOCK = 64
+
+def _as_array(values):
+    return np.asarray(values, dtype=np.float64)
+
+def _first_valid(values):
+    valid = np.flatnonzero(~np.isnan(values))
+    return int(valid[0]) if len(valid) else len(values)
+
+def linear_recurrence(x, a, y0=0.0):
+    """
+    Solves y[i] = a * y[i-1] + x[i] (with y[-1] = y0) without a per-element Python loop.
+    The series is scanned in blocks: inside a block the recurrence is a scaled cumulative sum,
+    and only one carry per block is propagated sequentially. Blocks are kept short so the
+    a**-k scaling stays well conditioned.
+    """
+    x = _as_array(x)
+    n = len(x)
+    if n == 0:
+        return x.copy()
+    block = _SCAN_BLOCK
+    n_blocks = -(-n // block)
+    padded = np.zeros(n_blocks * block)
+    padded[:n] = x
+    powers = a ** np.arange(1, block + 1)          # a^(j+1)
+    inv_powers = a ** -np.arange(block, dtype=np.float64)
+    # Zero-start solution of every block: y_j = a^j * sum_{k<=j} a^-k * x_k
+    local = np.cumsum(padded.reshape(n_blocks, block) * inv_powers, axis=1) * (powers / a)
+    carries = np.empty(n_blocks)
+    carry = y0
+    a_block = powers[-1]
+    for b in range(n_blocks):
+        carries[b] = carry
+        carry = local[b, -1] + carry * a_block
+    return (local + carries[:, None] * powers).ravel()[:n]
+
+def sma(values, window, min_periods=None):
+    """Simple moving average (pandas rolling(window, min_periods).mean())."""
+    values = _as_array(values)
+    min_periods = window if min_periods is None else min_periods
+    out = np.full(len(values), np.nan)
+    if len(values) == 0:
+        return out
+    filled = np.nan_to_num(values)
+    csum = np.concatenate([[0.0], np.cumsum(filled)])
+    ccount = np.concatenate([[0], np.cumsum(~np.isnan(values))])
+    idx = np.arange(1, len(values) + 1)
+    lo = np.maximum(idx - window, 0)
+    counts = ccount[idx] - ccount[lo]
+    ok = counts >= max(min_periods, 1)
+    out[ok] = (csum[idx] - csum[lo])[ok] / counts[ok]
+    return out
+
+def _rolling_reduce(values, window, reducer, fill, min_periods=None):
+    values = _as_array(values)
+    min_periods = window if min_periods is None else min_periods
+    n = len(values)
+    out = np.full(n, np.nan)
+    if n == 0:
+        return out
+    # Pad the front so every position owns a full window; the pad never wins the reduction
+    padded = np.concatenate([np.full(window - 1, fill), values])
+    windows = sliding_window_view(padded, window)
+    out[:] = reducer(windows, axis=1)
+    out[:max(min_periods, 1) - 1] = np.nan
+    return out
+
+def rolling_max(values, window, min_periods=None):
+    return _rolling_reduce(values, window, np.max, -np.inf, min_periods)
+
+def rolling_min(values, window, min_periods=None):
+    return _rolling_reduce(values, window, np.min, np.inf, min_periods)
+
+def rolling_std(values, window, mean=None):
+    """Population (ddof=0) rolling standard deviation; pass `mean` to reuse an existing SMA."""
+    values = _as_array(values)
+    n = len(values)
+    out = np.full(n, np.nan)
+    if n < window:
+        return out
+    mean = sma(values, window) if mean is None else mean
+    windows = sliding_window_view(values, window)
+    deviations = windows - mean[window - 1:, None]
+    out[window - 1:] = np.sqrt((deviations * deviations).mean(axis=1))
+    return out
+
+def ema(values, span=None, alpha=None, min_periods=0):
+    """
+    Exponential moving average matching pandas ewm(span|alpha, min_periods, adjust=False).mean().
+    Leading NaNs are skipped (the average starts at the first valid value).
+    """
+    values = _as_array(values)
+    alpha = 2.0 / (span + 1.0) if alpha is None else alpha
+    out = np.full(len(values), np.nan)
+    start = _first_valid(values)
+    if start >= len(values):
+        return out
+    tail = values[start:]
+    # y_0 = x_0, y_i = (1 - alpha) * y_{i-1} + alpha * x_i
+    x = alpha * tail
+    x[0] = tail[0]
+    out[start:] = linear_recurrence(x, 1.0 - alpha)
+    out[:start + max(min_periods, 1) - 1] = np.nan
+    return out
+
+def true_range(high, low, close):
+    """True range; the first bar (no previous close) is NaN like ta's directional-movement input."""
+    high, low, close = _as_array(high), _as_array(low), _as_array(close)
+    prev_close = np.concatenate([[np.nan], close[:-1]])
+    return np.maximum(high, prev_close) - np.minimum(low, prev_close)
+
+def atr(high, low, close, window=14, tr=None):
+    """Average true range as computed by ta (zeros during warm-up, Wilder smoothing afterwards)."""
+    tr = true_range(high, low, close) if tr is None else tr
+    n = len(tr)
+    out = np.zeros(n)
+    if n < window:
+        return out
+    # ta's ATR uses high - low for the first bar
+    tr = tr.copy()
+    tr[0] = _as_array(high)[0] - _as_array(low)[0]
+    x = tr[window - 1:] / window
+    x[0] = tr[:window].mean()
+    out[window - 1:] = linear_recurrence(x, (window - 1) / window)
+    return out
+
+def rsi(close, window=14):
+    """Relative strength index with Wilder smoothing (ta.momentum.rsi)."""
+    close = _as_array(close)
+    diff = np.concatenate([[np.nan], np.diff(close)])
+    up = np.where(diff > 0, diff, 0.0)
+    down = np.where(diff < 0, -diff, 0.0)
+    ema_up = ema(up, alpha=1.0 / window, min_periods=window)
+    ema_down = ema(down, alpha=1.0 / window, min_periods=window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where(ema_down == 0, 100.0, 100.0 - 100.0 / (1.0 + ema_up / ema_down))
+    out[np.isnan(ema_down)] = np.nan
+    return out
+
+def _wilder_sum(values, window):
+    """ta's running directional-movement sums: seed with the first `window` values, then decay."""
+    length = len(values) - (window - 1)
+    out = np.zeros(length)
+    valid = values[~np.isnan(values)]
+    out[0] = valid[:window].sum()
+    if length > 2:
+        # ta leaves the last element at zero
+        out[1:length - 1] = linear_recurrence(values[window + 1:window + length - 1], 1.0 - 1.0 / window, y0=out[0])
+    return out
+
+def adx(high, low, close, window=14, tr=None):
+    """
+    Average directional index reproducing ta.trend.adx, including its warm-up zeros.
+    Needs at least 2 * window bars (ta raises below that); returns None otherwise.
+    """
+    high, low, close = _as_array(high), _as_array(low), _as_array(close)
+    n = len(close)
+    if n < 2 * window:
+        return None
+    tr = true_range(high, low, close) if tr is None else tr
+
+    diff_up = np.concatenate([[np.nan], np.diff(high)])
+    diff_down = np.concatenate([[np.nan], -np.diff(low)])
+    pos = np.where((diff_up > diff_down) & (diff_up > 0), diff_up, 0.0)
+    neg = np.where((diff_down > diff_up) & (diff_down > 0), diff_down, 0.0)
+    pos[0] = neg[0] = np.nan
+
+    trs = _wilder_sum(tr, window)
+    dip_sum = _wilder_sum(pos, window)
+    din_sum = _wilder_sum(neg, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dip = np.where(trs != 0, 100.0 * dip_sum / trs, 0.0)
+        din = np.where(trs != 0, 100.0 * din_sum / trs, 0.0)
+        di_sum = dip + din
+        dx = np.where(di_sum != 0, 100.0 * np.abs((dip - din) / di_sum), 0.0)
+
+    length = len(trs)
+    smoothed = np.zeros(length)
+    if length > window:
+        x = dx[window:length - 1] / window
+        x = np.concatenate([[dx[:window].mean()], x])
+        smoothed[window:] = linear_recurrence(x, (window - 1) / window)
+    return np.concatenate([np.zeros(window - 1), smoothed])
+
+def compute_indicators(high, low, close):
+    """
+    Computes the TechnicalAnalyzer indicator columns in one pass with shared intermediates.
+    Returns {column: float64 array or None}; None marks indicators the series is too short for.
+    """
+    high, low, close = _as_array(high), _as_array(low), _as_array(close)
+    n = len(close)
+    out = {}
+
+    if n >= 20:
+        mavg = sma(close, 20)
+        mstd = rolling_std(close, 20, mean=mavg)
+        out['SMA20'] = mavg
+        out['BBU'] = mavg + 2 * mstd
+        out['BBL'] = mavg - 2 * mstd
+    else:
+        out['SMA20'] = sma(close, min(n, 5))
+        out['BBU'] = out['BBL'] = None
+
+    out['SMA50'] = sma(close, 50) if n >= 50 else None
+
+    if n >= 26:
+        macd = ema(close, span=12, min_periods=12) - ema(close, span=26, min_periods=26)
+        out['MACD'] = macd
+        out['MACD_Sig'] = ema(macd, span=9, min_periods=9)
+    else:
+        out['MACD'] = out['MACD_Sig'] = None
+
+    if n >= 14:
+        tr = true_range(high, low, close)
+        out['RSI'] = rsi(close, 14)
+        out['ADX'] = adx(high, low, close, 14, tr=tr)
+        out['ATR'] = atr(high, low, close, 14, tr=tr)
+    else:
+        out['RSI'] = out['ADX'] = out['ATR'] = None
+
+    if n >= 52:
+        conv = 0.5 * (rolling_max(high, 9) + rolling_min(low, 9))
+        base = 0.5 * (rolling_max(high, 26) + rolling_min(low, 26))
+        out['Ichimoku_A'] = 0.5 * (conv + base)
+        out['Ichimoku_B'] = 0.5 * (rolling_max(high, 52, min_periods=0) + rolling_min(low, 52, min_periods=0))
+        out['Ichimoku_Base'] = base
+        out['Ichimoku_Conv'] = conv
+    else:
+        out['Ichimoku_A'] = out['Ichimoku_B'] = out['Ichimoku_Base'] = out['Ichimoku_Conv'] = None
+
+    return out
@@ -0,0 +1,389 @@
+import os
+import re
+import math
+import time
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from app.database import db, SymbolDatabase
+from app.services.technical_analysis import TechnicalAnalyzer, INDICATOR_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+class ScreenerFilterError(ValueError):
+    """Raised for filter expressions that cannot be parsed or reference unknown fields."""
+
+# Fields of a screener row (latest bar of the TechnicalAnalyzer output plus registry info)
+SCREEN_FIELDS = (
+    'symbol', 'name', 'market_class', 'date', 'bars',
+    'open', 'high', 'low', 'close', 'volume', 'change',
+    *INDICATOR_COLUMNS,
+    'Signal', 'Pattern', 'divergence', 'rr_ratio', 'support', 'resistance',
+)
+
+# --- Filter expressions ---
+#
+# Grammar (keywords are case-insensitive, field names too):
+#   expr       := and_expr (('or' | '||') and_expr)*
+#   and_expr   := not_expr (('and' | '&&') not_expr)*
+#   not_expr   := ('not' | '!') not_expr | comparison
+#   comparison := sum (('<' | '<=' | '>' | '>=' | '==' | '=' | '!=' | 'contains') sum)?
+#   sum        := term (('+' | '-') term)*
+#   term       := unary (('*' | '/') unary)*
+#   unary      := '-' unary | number | 'string' | field | '(' expr ')'
+# Missing values (None) make comparisons false and arithmetic None; nothing is ever eval'ed.
+
+_TOKEN_RE = re.compile(r"""\s*(?:
+    (?P<number>\d+(?:\.\d*)?|\.\d+)
+  | (?P<string>'[^']*'|"[^"]*")
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op><=|>=|==|!=|&&|\|\||[<>=!()+\-*/])
+)""", re.VERBOSE)
+
+_FIELD_NAMES = {f.lower(): f for f in SCREEN_FIELDS}
+_KEYWORDS = {'and': '&&', 'or': '||', 'not': '!', 'contains': 'contains'}
+
+def _compare(op):
+    def apply(a, b):
+        if a is None or b is None:
+            return False
+        try:
+            if op == 'contains':
+                return str(b).lower() in str(a).lower()
+            if op in ('==', '='):
+                return a == b
+            if op == '!=':
+                return a != b
+            if op == '<':
+                return a < b
+            if op == '<=':
+                return a <= b
+            if op == '>':
+                return a > b
+            return a >= b
+        except TypeError:
+            return False
+    return apply
+
+def _arithmetic(op):
+    def apply(a, b):
+        if a is None or b is None:
+            return None
+        try:
+            if op == '+':
+                return a + b
+            if op == '-':
+                return a - b
+            if op == '*':
+                return a * b
+            return a / b if b else None
+        except TypeError:
+            return None
+    return apply
+
+def _tokenize(text):
+    tokens, pos = [], 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match or match.end() == pos:
+            raise ScreenerFilterError(f"Unexpected character at position {pos}: {text[pos:pos + 10]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'name' and value.lower() in _KEYWORDS:
+            kind, value = 'op', _KEYWORDS[value.lower()]
+        tokens.append((kind, value))
+        pos = match.end()
+    return tokens
+
+class _Parser:
+    """Recursive-descent compiler from a filter expression to a predicate over screener rows."""
+
+    COMPARISONS = ('<', '<=', '>', '>=', '==', '=', '!=', 'contains')
+
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _accept(self, *ops):
+        kind, value = self._peek()
+        if kind == 'op' and value in ops:
+            self.pos += 1
+            return value
+        return None
+
+    def compile(self):
+        node = self._or()
+        if self.pos != len(self.tokens):
+            raise ScreenerFilterError(f"Unexpected token {self._peek()[1]!r}")
+        return lambda row: bool(node(row))
+
+    def _or(self):
+        node = self._and()
+        while self._accept('||'):
+            left, right = node, self._and()
+            node = lambda row, l=left, r=right: bool(l(row)) or bool(r(row))
+        return node
+
+    def _and(self):
+        node = self._not()
+        while self._accept('&&'):
+            left, right = node, self._not()
+            node = lambda row, l=left, r=right: bool(l(row)) and bool(r(row))
+        return node
+
+    def _not(self):
+        if self._accept('!'):
+            inner = self._not()
+            return lambda row: not inner(row)
+        return self._comparison()
+
+    def _comparison(self):
+        left = self._sum()
+        op = self._accept(*self.COMPARISONS)
+        if op is None:
+            return left
+        right, compare = self._sum(), _compare(op)
+        return lambda row: compare(left(row), right(row))
+
+    def _sum(self):
+        node = self._term()
+        while True:
+            op = self._accept('+', '-')
+            if op is None:
+                return node
+            left, right, apply = node, self._term(), _arithmetic(op)
+            node = lambda row, l=left, r=right, f=apply: f(l(row), r(row))
+
+    def _term(self):
+        node = self._unary()
+        while True:
+            op = self._accept('*', '/')
+            if op is None:
+                return node
+            left, right, apply = node, self._unary(), _arithmetic(op)
+            node = lambda row, l=left, r=right, f=apply: f(l(row), r(row))
+
+    def _unary(self):
+        if self._accept('-'):
+            inner = self._unary()
+            return lambda row: None if inner(row) is None else -inner(row)
+        if self._accept('('):
+            node = self._or()
+            if not self._accept(')'):
+                raise ScreenerFilterError("Missing closing parenthesis")
+            return node
+
+        kind, value = self._peek()
+        if kind is None:
+            raise ScreenerFilterError("Unexpected end of expression")
+        self.pos += 1
+        if kind == 'number':
+            number = float(value)
+            return lambda row: number
+        if kind == 'string':
+            text = value[1:-1]
+            return lambda row: text
+        if kind == 'name':
+            field = _FIELD_NAMES.get(value.lower())
+            if field is None:
+                raise ScreenerFilterError(f"Unknown field {value!r}. Available: {', '.join(SCREEN_FIELDS)}")
+            return lambda row: row.get(field)
+        raise ScreenerFilterError(f"Unexpected token {value!r}")
+
+def compile_filter(expression, max_length=500):
+    """Compiles a filter expression (e.g. "RSI < 30 and SMA20 > SMA50") into a row predicate."""
+    if not expression or not expression.strip():
+        return None
+    if len(expression) > max_length:
+        raise ScreenerFilterError(f"Filter expression longer than {max_length} characters")
+    return _Parser(expression).compile()
+
+# --- Per-symbol analysis (runs inside pool workers) ---
+
+_worker_db = None
+
+def _init_worker(db_path):
+    global _worker_db
+    _worker_db = SymbolDatabase(db_path)
+
+def _scan_chunk(items, bars):
+    """Pool task: analyzes a chunk of (symbol, history_key) pairs with the worker's own DB handle."""
+    return [row for row in (analyze_symbol(_worker_db, symbol, key, bars) for symbol, key in items) if row]
+
+def _clean(value):
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+def analyze_symbol(database, symbol, history_key, bars, min_bars=30):
+    """
+    Runs the TechnicalAnalyzer latest-bar analysis over the newest `bars` stored candles of one
+    symbol and returns its screener row, or None without enough local history.
+    """
+    frame = TechnicalAnalyzer.prepare_ohlcv_arrays(database.get_history_arrays(history_key, limit=bars))
+    if len(frame) < min_bars:
+        return None
+    latest = TechnicalAnalyzer.latest_bar_analysis(frame)
+    if not latest:
+        return None
+
+    previous = latest['previous_close']
+    supports, resistances = latest['supports'], latest['resistances']
+    row = {field: _clean(latest.get(field)) for field in SCREEN_FIELDS if field in latest}
+    row.update(
+        symbol=symbol,
+        change=round((latest['close'] - previous) / previous * 100, 2) if previous else None,
+        rr_ratio=(latest.get('risk_reward') or {}).get('rr_ratio'),
+        support=supports[0]['value'] if supports else None,
+        resistance=resistances[0]['value'] if resistances else None,
+    )
+    return row
+
+class Screener:
+    """
+    Universe-wide technical screener over locally stored price history (no network calls).
+    A scan runs the TechnicalAnalyzer latest-bar analysis for every symbol of the universe, fanned out in
+    chunks over a process pool, and is cached until price history or the registry changes
+    (or CACHE_TTL passes). Filters, sorting and paging are applied to the cached rows.
+    """
+
+    DEFAULT_BARS = 400
+    CHUNK_SIZE = 25
+    CACHE_TTL = 900
+    MAX_PAGE_SIZE = 200
+
+    def __init__(self, database, max_workers=None):
+        self._db = database
+        self._max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._cache = {}
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn: workers must not inherit the server's threads or SQLite handles
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self._max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self._db.db_path,),
+                )
+            return self._pool
+
+    def _reset_pool(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _run_scan(self, universe, bars):
+        items = [(symbol, key) for symbol, key, _, _ in universe]
+        if self._max_workers <= 1 or len(items) <= self.CHUNK_SIZE:
+            return [row for row in (analyze_symbol(self._db, s, k, bars) for s, k in items) if row]
+
+        chunks = [items[i:i + self.CHUNK_SIZE] for i in range(0, len(items), self.CHUNK_SIZE)]
+        try:
+            pool = self._executor()
+            rows = []
+            for chunk_rows in pool.map(_scan_chunk, chunks, [bars] * len(chunks)):
+                rows.extend(chunk_rows)
+            return rows
+        except Exception as e:
+            logger.error(f"Screener pool failed ({e}); scanning in-process")
+            self._reset_pool()
+            return [row for row in (analyze_symbol(self._db, s, k, bars) for s, k in items) if row]
+
+    def scan(self, universe, cache_key, bars=None, refresh=False):
+        """
+        Latest-bar rows for a universe of (symbol, history_key, name, market_class) tuples.
+        Returns (rows, info) where info describes the scan (cached, took_ms, generated_at).
+        """
+        bars = bars or self.DEFAULT_BARS
+        # The universe itself is part of the version: the same size can hold other symbols
+        members = hash(tuple(sorted((symbol, history_key) for symbol, history_key, _, _ in universe)))
+        version = (self._db.get_history_version(), self._db.get_registry_generation(), members)
+        key = (cache_key, bars)
+
+        def cached():
+            entry = self._cache.get(key)
+            if entry and entry['version'] == version and time.time() - entry['created'] < self.CACHE_TTL:
+                return entry
+            return None
+
+        entry = None if refresh else cached()
+        if entry is not None:
+            return entry['rows'], {**self._describe(entry), 'cached': True}
+
+        with self._scan_lock:
+            # Another request may have completed the same scan while we waited
+            entry = None if refresh else cached()
+            if entry is not None:
+                return entry['rows'], {**self._describe(entry), 'cached': True}
+
+            started = time.perf_counter()
+            rows = self._run_scan(universe, bars)
+            details = {symbol: (name, market_class) for symbol, _, name, market_class in universe}
+            for row in rows:
+                row['name'], row['market_class'] = details.get(row['symbol'], (None, None))
+            entry = {
+                'rows': rows,
+                'version': version,
+                'created': time.time(),
+                'took_ms': round((time.perf_counter() - started) * 1000, 1),
+                'universe': len(universe),
+            }
+            self._cache[key] = entry
+            logger.info(f"Screener scanned {len(universe)} symbols ({len(rows)} with history) in {entry['took_ms']} ms")
+            return rows, {**self._describe(entry), 'cached': False}
+
+    @staticmethod
+    def _describe(entry):
+        return {
+            'universe': entry['universe'],
+            'analyzed': len(entry['rows']),
+            'scan_ms': entry['took_ms'],
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(entry['created'])),
+        }
+
+    def screen(self, universe, cache_key, expression=None, sort=None, descending=False,
+               page=1, page_size=50, bars=None, refresh=False):
+        """Filters, sorts and pages a (cached) universe scan. Raises ScreenerFilterError for bad input."""
+        predicate = compile_filter(expression)
+        if sort and sort.lower() not in _FIELD_NAMES:
+            raise ScreenerFilterError(f"Unknown sort field {sort!r}")
+
+        started = time.perf_counter()
+        rows, info = self.scan(universe, cache_key, bars=bars, refresh=refresh)
+        matches = [row for row in rows if predicate(row)] if predicate else list(rows)
+        if sort:
+            field = _FIELD_NAMES[sort.lower()]
+            present = [r for r in matches if r.get(field) is not None]
+            missing = [r for r in matches if r.get(field) is None]
+            try:
+                present.sort(key=lambda r: r[field], reverse=descending)
+            except TypeError:
+                present.sort(key=lambda r: str(r[field]), reverse=descending)
+            matches = present + missing
+
+        page = max(1, page)
+        page_size = max(1, min(page_size, self.MAX_PAGE_SIZE))
+        start = (page - 1) * page_size
+        return {
+            **info,
+            'filter': expression or None,
+            'total': len(matches),
+            'page': page,
+            'page_size': page_size,
+            'took_ms': round((time.perf_counter() - started) * 1000, 2),
+            'results': matches[start:start + page_size],
+        }
+
+screener = Screener(db)
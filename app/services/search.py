@@ -0,0 +1,114 @@
+import time
+import threading
+import logging
+
+from app.database import db
+from app.services.classification import normalize_text
+
+logger = logging.getLogger(__name__)
+
+def normalize_query(text):
+    """Search normalization: Persian letter folding (ي/ك), ZWNJ as space, lowercase, single spaces."""
+    text = normalize_text(str(text or '')).replace('\u200c', ' ').replace('ى', 'ی').replace('ة', 'ه')
+    return " ".join(text.lower().split())
+
+class SymbolSearchIndex:
+    """
+    In-memory search index over the symbol registry (ticker = symbol_l18, name = name_l30).
+    Built from the registry columns only (no JSON decoding) and rebuilt automatically
+    when the registry changes. Supports prefix and substring matching with ranking:
+    exact ticker > ticker prefix > name / name-word prefix > ticker substring > name substring.
+    """
+
+    RANK_EXACT, RANK_TICKER_PREFIX, RANK_NAME_PREFIX, RANK_TICKER_SUBSTR, RANK_NAME_SUBSTR = range(5)
+    MAX_PAGE_SIZE = 200
+
+    def __init__(self, database, category_prefix="symbols_type_"):
+        self._db = database
+        self._category_prefix = category_prefix
+        self._lock = threading.Lock()
+        self._entries = {None: []}
+        self._by_ticker = {None: []}
+        self._version = None
+
+    def _ensure_fresh(self):
+        version = self._db.get_registry_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            started = time.perf_counter()
+            entries = []
+            for isin, ticker, name, market_class in self._db.get_registry_entries(self._category_prefix):
+                n_ticker, n_name = normalize_query(ticker), normalize_query(name)
+                # (haystack, ticker, " " + name for word-prefix tests, market class, output record)
+                entries.append((
+                    f"{n_ticker}\x00{n_name}\x00{str(isin).lower()}",
+                    n_ticker,
+                    f" {n_name}",
+                    market_class,
+                    {"isin": isin, "l18": ticker, "l30": name, "market_class": market_class},
+                ))
+            # Shorter tickers first as the tie-breaker inside a rank
+            entries.sort(key=lambda e: (len(e[1]), e[1]))
+            by_ticker = sorted(entries, key=lambda e: e[1])
+
+            self._entries = {None: entries}
+            self._by_ticker = {None: by_ticker}
+            for market_class in {e[3] for e in entries}:
+                self._entries[market_class] = [e for e in entries if e[3] == market_class]
+                self._by_ticker[market_class] = [e for e in by_ticker if e[3] == market_class]
+            self._version = version
+            logger.info(f"Symbol search index rebuilt: {len(entries)} symbols in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def _candidates(self, market_classes, browse):
+        """Entries restricted to the given market classes, in rank order (or ticker order when browsing)."""
+        source = self._by_ticker if browse else self._entries
+        if not market_classes:
+            return source[None]
+        if len(market_classes) == 1:
+            return source.get(market_classes[0], [])
+        allowed = set(market_classes)
+        return [e for e in source[None] if e[3] in allowed]
+
+    def search(self, query, market_classes=None, page=1, page_size=20):
+        """
+        Returns one page of ranked matches: {"query", "total", "page", "page_size", "took_ms", "results"}.
+        An empty query browses the (optionally class-filtered) registry in ticker order.
+        """
+        started = time.perf_counter()
+        self._ensure_fresh()
+        q = normalize_query(query)
+        page = max(int(page or 1), 1)
+        page_size = min(max(int(page_size or 20), 1), self.MAX_PAGE_SIZE)
+        entries = self._candidates(list(market_classes or []), browse=not q)
+
+        if q:
+            # One C-level substring test per symbol; only hits pay for ranking
+            word_q = f" {q}"
+            buckets = ([], [], [], [], [])
+            for e in entries:
+                if q not in e[0]:
+                    continue
+                ticker = e[1]
+                if ticker == q: buckets[self.RANK_EXACT].append(e)
+                elif ticker.startswith(q): buckets[self.RANK_TICKER_PREFIX].append(e)
+                elif word_q in e[2]: buckets[self.RANK_NAME_PREFIX].append(e)
+                elif q in ticker: buckets[self.RANK_TICKER_SUBSTR].append(e)
+                else: buckets[self.RANK_NAME_SUBSTR].append(e)
+            matched = [e for bucket in buckets for e in bucket]
+        else:
+            matched = entries
+
+        start = (page - 1) * page_size
+        return {
+            "query": query,
+            "total": len(matched),
+            "page": page,
+            "page_size": page_size,
+            "took_ms": round((time.perf_counter() - started) * 1000, 2),
+            "results": [e[4] for e in matched[start:start + page_size]],
+        }
+
+symbol_search = SymbolSearchIndex(db)
@@ -12,14 +12,63 @@ import base64
 import random
 import logging
 
+from app.services import indicators
+from app.periods import period_ends
+
 logger = logging.getLogger(__name__)
 
+INDICATOR_COLUMNS = (
+    'SMA20', 'BBU', 'BBL', 'SMA50', 'MACD', 'MACD_Sig', 'RSI', 'ADX', 'ATR',
+    'Ichimoku_A', 'Ichimoku_B', 'Ichimoku_Base', 'Ichimoku_Conv',
+)
+
+# Bit order of TechnicalAnalyzer.signal_flags
+SIGNAL_LABELS = ('Bullish (SMA)', 'Bearish (SMA)', 'Oversold', 'Overbought', 'MACD Bullish', 'Ichimoku Bullish Cross')
+# Signal text for every combination of flags
+_SIGNAL_TEXT = np.array([
+    ", ".join(label for bit, label in enumerate(SIGNAL_LABELS) if flags >> bit & 1) or 'Neutral'
+    for flags in range(1 << len(SIGNAL_LABELS))
+], dtype=object)
+
 class TechnicalAnalyzer:
     """
     Encapsulates all technical analysis logic, including indicators, 
     support/resistance levels, and chart generation.
     """
 
+    # 'numpy' (shared-kernel backend) or 'ta' (one ta call per indicator)
+    INDICATOR_BACKEND = 'numpy'
+
+    # Bars loaded ahead of a requested output window: the longest rolling window (Ichimoku span B;
+    # SMA50 needs 50) plus enough bars for the exponential / Wilder averages (MACD, RSI, ATR, ADX)
+    # to forget their seed, so trimmed runs match full-history runs at display precision.
+    WARMUP_BARS = 52
+    SETTLING_BARS = 150
+    # Daily sessions per candle (five-session trading weeks, about 21 sessions per Jalali month),
+    # used to size the warm-up of resampled timeframes
+    SESSIONS_PER_CANDLE = {'daily': 1, 'weekly': 5, 'monthly': 21}
+    TIMEFRAMES = tuple(SESSIONS_PER_CANDLE)
+    # How far a selected date range is widened backwards per timeframe (weekly views show 5x the range)
+    RANGE_EXPANSION = {'weekly': 5}
+
+    @classmethod
+    def history_window(cls, candle_count=None, start_date=None, end_date=None, timeframe='daily'):
+        """
+        History to load for an analysis whose output is the newest `candle_count` candles and/or
+        the candles in [start_date, end_date]: keyword arguments for get_price_history / get_history
+        (start_date, end_date, lead = warm-up candles before start_date, limit = newest candles).
+        """
+        per_candle = cls.SESSIONS_PER_CANDLE.get(timeframe, 1)
+        # Also cover the longest S/R lookback so sr_levels match the full-history run
+        warmup = max(cls.WARMUP_BARS + cls.SETTLING_BARS, cls.SR_LOOKBACKS[-1]) * per_candle
+        window = {'start_date': start_date, 'end_date': end_date}
+        if start_date:
+            window['lead'] = warmup
+        if candle_count:
+            # One extra candle of sessions for a partial first week / month
+            window['limit'] = int(candle_count) * per_candle + warmup + per_candle
+        return window
+
     @staticmethod
     def detect_divergence(df, indicator_col='RSI', window=5):
         """
@@ -128,7 +177,32 @@ class TechnicalAnalyzer:
         return standardized
 
     @staticmethod
-    def resample_to_weekly(data):
+    def prepare_ohlcv_arrays(arrays):
+        """
+        prepare_ohlcv_data for a columnar read (SymbolDatabase.get_history_arrays): a date-sorted
+        OHLCV DataFrame with the same fallbacks (missing open / high / low = close, volume = 0)
+        and the same rounding, without decoding any JSON.
+        """
+        close = np.asarray(arrays['close'], dtype=np.float64)
+        valid = ~np.isnan(close) & (close != 0)
+        close = close[valid]
+        frame = pd.DataFrame({'date': np.asarray(arrays['date'])[valid]})
+        tens = np.where(close > 1000, 1, np.where(close > 100, 10, 100))
+        for field in ('open', 'high', 'low', 'close'):
+            values = np.asarray(arrays[field], dtype=np.float64)[valid]
+            values = np.where(np.isnan(values) | (values == 0), close, values)
+            frame[field] = np.round(values * tens) / tens
+        volume = np.asarray(arrays['volume'], dtype=np.float64)[valid]
+        frame['volume'] = np.where(np.isnan(volume), 0.0, volume)
+        return frame
+
+    # How the extra (raw API) fields of daily candles combine into a longer candle. Any other
+    # field keeps the period's last value, like the close.
+    RAW_AGGREGATION = {'pf': 'first', 'pmax': 'max', 'pmin': 'min', 'tvol': 'sum', 'tval': 'sum', 'tno': 'sum', 'count': 'sum'}
+
+    @classmethod
+    def _resample(cls, data, timeframe):
+        """OHLCV candles of daily `data` aggregated per period (see app/periods.py), newest first."""
         if not data or not isinstance(data, list) or len(data) < 5:
             return data
         
@@ -138,14 +212,6 @@ class TechnicalAnalyzer:
             return data
             
         try:
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-            
-            df[date_col] = pd.to_datetime(df[date_col])
-            df = df.sort_values(date_col)
-            df.set_index(date_col, inplace=True)
-            
             logic = {
                 'open': 'first',
                 'high': 'max',
@@ -154,140 +220,204 @@ class TechnicalAnalyzer:
                 'volume': 'sum'
             }
             for col in df.columns:
+                if col in logic or col in cls.RAW_AGGREGATION:
+                    df[col] = pd.to_numeric(df[col], errors='coerce')
                 if col not in logic:
-                    logic[col] = 'first'
-                    
-            weekly_df = df.resample('W-WED').apply(logic)
-            weekly_df = weekly_df.dropna(subset=['close'])
-            weekly_df.reset_index(inplace=True)
-            weekly_df['date'] = weekly_df[date_col].dt.strftime('%Y-%m-%d')
-            weekly_df = weekly_df.sort_values('date', ascending=False)
+                    logic[col] = cls.RAW_AGGREGATION.get(col, 'last')
+            logic.pop(date_col)
+            logic = {col: how for col, how in logic.items() if col in df.columns}
+            
+            df[date_col] = pd.to_datetime(df[date_col])
+            df = df.sort_values(date_col)
+            df.set_index(date_col, inplace=True)
+            
+            resampled = df.groupby(period_ends(df.index, timeframe)).agg(logic)
+            resampled = resampled.dropna(subset=['close'])
+            resampled.index.name = date_col
+            resampled.reset_index(inplace=True)
+            resampled['date'] = resampled[date_col].dt.strftime('%Y-%m-%d')
+            resampled = resampled.sort_values('date', ascending=False)
             
-            return weekly_df.to_dict('records')
+            return resampled.to_dict('records')
         except Exception as e:
             logger.error(f"Resampling Error: {e}")
             return data
 
+    @classmethod
+    def resample_to_weekly(cls, data):
+        """Weekly candles (Saturday-Wednesday trading weeks, labelled with the Wednesday)."""
+        return cls._resample(data, 'weekly')
+
+    @classmethod
+    def resample_to_monthly(cls, data):
+        """Monthly candles by Jalali calendar month, labelled with the month's last day."""
+        return cls._resample(data, 'monthly')
+
+    @classmethod
+    def resample(cls, data, timeframe='daily'):
+        """Candles of daily `data` in `timeframe` (daily data is returned unchanged)."""
+        if timeframe == 'weekly':
+            return cls.resample_to_weekly(data)
+        if timeframe == 'monthly':
+            return cls.resample_to_monthly(data)
+        return data
+
+    # Lookback windows (bars) reported next to the full-history levels in sr_levels
+    SR_LOOKBACKS = (60, 250)
+
     @staticmethod
-    def get_support_resistance(df, window=5):
-        if len(df) < window * 2:
-            return [], []
-        
-        df = df.copy()
-        df['is_min'] = df['low'] == df['low'].rolling(window=window*2+1, center=True).min()
-        df['is_max'] = df['high'] == df['high'].rolling(window=window*2+1, center=True).max()
-        
-        minima = df[df['is_min']]['low'].tolist()
-        maxima = df[df['is_max']]['high'].tolist()
-        
-        def cluster_levels(levels, current_price, is_resistance=True):
-            if not levels: return []
-            clusters = []
-            for l in sorted(levels):
-                found = False
-                for c in clusters:
-                    if abs(c['value'] - l) / l < 0.02:
-                        c['hits'] += 1
-                        c['value'] = (c['value'] * (c['hits']-1) + l) / c['hits']
-                        found = True
-                        break
-                if not found:
-                    clusters.append({'value': l, 'hits': 1})
-            
-            for c in clusters:
-                if c['value'] > 1000:
-                    c['value'] = round(c['value'], -1)
-                elif c['value'] > 100:
-                    c['value'] = round(c['value'], 0)
-                else:
-                    c['value'] = round(c['value'], 2)
-                    
-                dist = abs(c['value'] - current_price) / current_price
-                c['strength'] = round(c['hits'] * (1 / (dist + 0.05)), 1)
-                
-            if is_resistance:
-                valid = [c for c in clusters if c['value'] > current_price]
-                return sorted(valid, key=lambda x: x['value'])[:5]
+    def cluster_levels(levels, current_price, is_resistance=True, tolerance=0.02):
+        """
+        Groups pivot prices into levels with a sort-and-sweep pass (O(n log n)).
+        A pivot joins a cluster while it lies within `tolerance` (relative) of the cluster's running
+        mean. After sorting, a pivot can only ever match the most recently opened cluster: once a
+        pivot opens a new cluster, every later (larger) pivot is even farther from all earlier
+        clusters. So comparing against the last cluster alone reproduces the all-clusters scan.
+        """
+        if len(levels) == 0: return []
+        clusters = []
+        last = None
+        for l in np.sort(np.asarray(levels, dtype=np.float64)):
+            if last is not None and abs(last['value'] - l) / l < tolerance:
+                last['hits'] += 1
+                last['value'] = (last['value'] * (last['hits'] - 1) + l) / last['hits']
             else:
-                valid = [c for c in clusters if c['value'] < current_price]
-                return sorted(valid, key=lambda x: x['value'], reverse=True)[:5]
+                last = {'value': float(l), 'hits': 1}
+                clusters.append(last)
+
+        for c in clusters:
+            if c['value'] > 1000:
+                c['value'] = round(c['value'], -1)
+            elif c['value'] > 100:
+                c['value'] = round(c['value'], 0)
+            else:
+                c['value'] = round(c['value'], 2)
 
-        current_price = df['close'].iloc[-1]
-        supports = cluster_levels(minima, current_price, False)
-        resistances = cluster_levels(maxima, current_price, True)
-        
-        return supports, resistances
+            dist = abs(c['value'] - current_price) / current_price
+            c['strength'] = round(c['hits'] * (1 / (dist + 0.05)), 1)
+
+        if is_resistance:
+            valid = [c for c in clusters if c['value'] > current_price]
+            return sorted(valid, key=lambda x: x['value'])[:5]
+        else:
+            valid = [c for c in clusters if c['value'] < current_price]
+            return sorted(valid, key=lambda x: x['value'], reverse=True)[:5]
+
+    @classmethod
+    def get_support_resistance_levels(cls, df, window=5, tolerance=0.02, lookbacks=(None,)):
+        """
+        Support / resistance levels for several lookback windows from one pivot detection pass.
+        df must be sorted by date ascending. Returns {lookback: (supports, resistances)}, where a
+        lookback is a number of most recent bars (None = whole history); pivots are detected on
+        the full series so a window edge never creates artificial pivots.
+        """
+        if len(df) < window * 2:
+            return {lookback: ([], []) for lookback in lookbacks}
+
+        lows = pd.to_numeric(df['low'], errors='coerce')
+        highs = pd.to_numeric(df['high'], errors='coerce')
+        span = window * 2 + 1
+        is_min = (lows == lows.rolling(window=span, center=True).min()).to_numpy()
+        is_max = (highs == highs.rolling(window=span, center=True).max()).to_numpy()
+        lows, highs = lows.to_numpy(dtype=np.float64), highs.to_numpy(dtype=np.float64)
+        positions = np.arange(len(df))
+        current_price = float(df['close'].iloc[-1])
+
+        levels = {}
+        for lookback in lookbacks:
+            recent = positions >= len(df) - lookback if lookback else np.ones(len(df), dtype=bool)
+            levels[lookback] = (
+                cls.cluster_levels(lows[is_min & recent], current_price, False, tolerance),
+                cls.cluster_levels(highs[is_max & recent], current_price, True, tolerance),
+            )
+        return levels
+
+    @classmethod
+    def get_support_resistance(cls, df, window=5, tolerance=0.02, lookback=None):
+        return cls.get_support_resistance_levels(df, window, tolerance, (lookback,))[lookback]
+
+    @staticmethod
+    def _precomputed_levels(df):
+        """(supports, resistances) attached by calculate_technical_analysis to its latest row, if present."""
+        if 'supports' not in df.columns or 'resistances' not in df.columns:
+            return None
+        for supports, resistances in zip(df['supports'], df['resistances']):
+            if isinstance(supports, list) and isinstance(resistances, list):
+                return supports, resistances
+        return None
+
+    # (name, type, description, required columns) of the indicators ranked by prioritize_indicators
+    RANKED_INDICATORS = (
+        ('RSI', 'Momentum', 'سیگنال‌های نوسانی و اشباع خرید/فروش', ('RSI',)),
+        ('MACD', 'Trend', 'تایید روند و واگرایی‌ها', ('MACD', 'MACD_Sig')),
+        ('SMA', 'Trend', 'تقاطع میانگین‌های متحرک', ('SMA20', 'SMA50')),
+        ('Bollinger', 'Volatility', 'نواحی حمایتی و مقاومتی پویا', ('BBL', 'BBU')),
+        ('Stoch', 'Momentum', 'سرعت تغییرات قیمت و بازگشت‌ها', ('STOCHk',)),
+    )
+
+    @staticmethod
+    def _float_column(frame, name):
+        """Column (or scalar) as float64 with None / missing values as NaN, so comparisons are NaN-safe."""
+        return np.asarray(frame[name], dtype=np.float64)
 
     @staticmethod
-    def prioritize_indicators(df):
+    def _cross(fast, slow):
+        """+1 / -1 where fast crosses above / below slow, 0 otherwise; NaN on the first bar (as .diff())."""
+        above = (fast > slow).astype(np.float64)
+        return np.concatenate([[np.nan], np.diff(above)])
+
+    @classmethod
+    def prioritize_indicators(cls, df):
+        """
+        Ranks indicators by how often their signals were followed by a move in the signalled
+        direction 5 bars later. Evaluated with boolean masks over the whole history; indicators
+        whose columns are missing are skipped.
+        """
         if df.empty or len(df) < 50:
             return []
 
-        history = df.sort_values('date').copy()
-        history['future_return'] = (history['close'].shift(-5) - history['close']) / history['close']
-        
-        indicators = [
-            {'name': 'RSI', 'type': 'Momentum', 'desc': 'سیگنال‌های نوسانی و اشباع خرید/فروش'},
-            {'name': 'MACD', 'type': 'Trend', 'desc': 'تایید روند و واگرایی‌ها'},
-            {'name': 'SMA', 'type': 'Trend', 'desc': 'تقاطع میانگین‌های متحرک'},
-            {'name': 'Bollinger', 'type': 'Volatility', 'desc': 'نواحی حمایتی و مقاومتی پویا'},
-            {'name': 'Stoch', 'type': 'Momentum', 'desc': 'سرعت تغییرات قیمت و بازگشت‌ها'}
-        ]
-        
+        history = df.sort_values('date')
+        col = lambda name: cls._float_column(history, name)
+        close = col('close')
+        future_return = np.full(len(close), np.nan)
+        future_return[:-5] = (close[5:] - close[:-5]) / close[:-5]
+        rising, falling = future_return > 0, future_return < 0
+
         rankings = []
-        for ind in indicators:
-            accuracy = 0
-            signals_count = 0
-            avg_profit = 0
-            
-            if ind['name'] == 'RSI':
-                signals = history[(history['RSI'] < 30) | (history['RSI'] > 70)]
-                if not signals.empty:
-                    success = signals.apply(lambda r: (r['future_return'] > 0 if r['RSI'] < 30 else r['future_return'] < 0), axis=1)
-                    accuracy = success.mean()
-                    signals_count = len(signals)
-                    avg_profit = signals['future_return'].abs().mean()
-            
-            elif ind['name'] == 'MACD':
-                history['macd_cross'] = (history['MACD'] > history['MACD_Sig']).astype(int).diff()
-                signals = history[history['macd_cross'] != 0]
-                if not signals.empty:
-                    success = signals.apply(lambda r: (r['future_return'] > 0 if r['macd_cross'] > 0 else r['future_return'] < 0), axis=1)
-                    accuracy = success.mean()
-                    signals_count = len(signals)
-                    avg_profit = signals['future_return'].abs().mean()
-
-            elif ind['name'] == 'SMA':
-                if 'SMA20' in history.columns and 'SMA50' in history.columns:
-                    history['sma_cross'] = (history['SMA20'] > history['SMA50']).astype(int).diff()
-                    signals = history[history['sma_cross'].notnull() & (history['sma_cross'] != 0)]
-                    if not signals.empty:
-                        success = signals.apply(lambda r: (r['future_return'] > 0 if r['sma_cross'] > 0 else r['future_return'] < 0), axis=1)
-                        accuracy = success.mean()
-                        signals_count = len(signals)
-                        avg_profit = signals['future_return'].abs().mean()
-
-            elif ind['name'] == 'Bollinger':
-                signals = history[(history['close'] < history['BBL']) | (history['close'] > history['BBU'])]
-                if not signals.empty:
-                    success = signals.apply(lambda r: (r['future_return'] > 0 if r['close'] < r['BBL'] else r['future_return'] < 0), axis=1)
-                    accuracy = success.mean()
-                    signals_count = len(signals)
-                    avg_profit = signals['future_return'].abs().mean()
-
-            elif ind['name'] == 'Stoch':
-                signals = history[(history['STOCHk'] < 20) | (history['STOCHk'] > 80)]
-                if not signals.empty:
-                    success = signals.apply(lambda r: (r['future_return'] > 0 if r['STOCHk'] < 20 else r['future_return'] < 0), axis=1)
-                    accuracy = success.mean()
-                    signals_count = len(signals)
-                    avg_profit = signals['future_return'].abs().mean()
+        for name, ind_type, desc, columns in cls.RANKED_INDICATORS:
+            if any(c not in history.columns for c in columns):
+                continue
+
+            # signals: bars with a signal; bullish: signals expecting a rise (the rest expect a fall)
+            if name == 'RSI':
+                rsi = col('RSI')
+                signals, bullish = (rsi < 30) | (rsi > 70), rsi < 30
+            elif name == 'MACD':
+                cross = cls._cross(col('MACD'), col('MACD_Sig'))
+                signals, bullish = cross != 0, cross > 0
+            elif name == 'SMA':
+                cross = cls._cross(col('SMA20'), col('SMA50'))
+                signals, bullish = ~np.isnan(cross) & (cross != 0), cross > 0
+            elif name == 'Bollinger':
+                lower, upper = col('BBL'), col('BBU')
+                signals, bullish = (close < lower) | (close > upper), close < lower
+            else:
+                stoch = col('STOCHk')
+                signals, bullish = (stoch < 20) | (stoch > 80), stoch < 20
+
+            signals_count = int(signals.sum())
+            accuracy, avg_profit = 0, 0
+            if signals_count:
+                accuracy = np.where(bullish, rising, falling)[signals].mean()
+                moves = np.abs(future_return[signals])
+                moves = moves[~np.isnan(moves)]
+                avg_profit = moves.mean() if len(moves) else np.nan
 
             score = (accuracy * 0.6) + (avg_profit * 0.3) + (min(signals_count / 10, 1) * 0.1)
             rankings.append({
-                'name': ind['name'],
-                'type': ind['type'],
-                'description': ind['desc'],
+                'name': name,
+                'type': ind_type,
+                'description': desc,
                 'accuracy': round(accuracy * 100, 1),
                 'score': round(score, 3),
                 'signals': signals_count
@@ -297,7 +427,186 @@ class TechnicalAnalyzer:
         return rankings
 
     @classmethod
-    def calculate_technical_analysis(cls, data, index_data=None):
+    def signal_flags(cls, frame):
+        """
+        Bit flags (bit i set = SIGNAL_LABELS[i]) per bar, from a DataFrame or a single row mapping.
+        Missing indicator values compare as False instead of raising.
+        """
+        col = lambda name: cls._float_column(frame, name)
+        sma20, sma50, rsi = col('SMA20'), col('SMA50'), col('RSI')
+        masks = (
+            sma20 > sma50, sma20 < sma50,
+            rsi < 30, rsi > 70,
+            col('MACD') > col('MACD_Sig'),
+            col('Ichimoku_Conv') > col('Ichimoku_Base'),
+        )
+        flags = np.zeros(np.shape(sma20), dtype=np.int64)
+        for bit, mask in enumerate(masks):
+            flags |= mask.astype(np.int64) << bit
+        return flags
+
+    @classmethod
+    def signal_labels(cls, row):
+        """Signal text of one bar (mapping with the indicator columns)."""
+        return _SIGNAL_TEXT[int(cls.signal_flags(row))]
+
+    @staticmethod
+    def _indicator_columns_ta(df):
+        """Reference backend: one `ta` call per indicator (kept for NaN-holed data and benchmarks)."""
+        df = df[['high', 'low', 'close']].copy()
+        # Trend & Momentum
+        if len(df) >= 20:
+            df['SMA20'] = ta.trend.sma_indicator(df['close'], window=20)
+            df['BBU'] = ta.volatility.bollinger_hband(df['close'], window=20)
+            df['BBL'] = ta.volatility.bollinger_lband(df['close'], window=20)
+        else:
+            df['SMA20'] = df['close'].rolling(window=min(len(df), 5)).mean()
+            df['BBU'] = None
+            df['BBL'] = None
+
+        if len(df) >= 50:
+            df['SMA50'] = ta.trend.sma_indicator(df['close'], window=50)
+        else:
+            df['SMA50'] = None
+
+        if len(df) >= 26:
+            df['MACD'] = ta.trend.macd(df['close'])
+            df['MACD_Sig'] = ta.trend.macd_signal(df['close'])
+        else:
+            df['MACD'] = None
+            df['MACD_Sig'] = None
+
+        if len(df) >= 14:
+            df['RSI'] = ta.momentum.rsi(df['close'], window=14)
+            df['ADX'] = ta.trend.adx(df['high'], df['low'], df['close'])
+            df['ATR'] = ta.volatility.average_true_range(df['high'], df['low'], df['close'], window=14)
+        else:
+            df['RSI'] = None
+            df['ADX'] = None
+            df['ATR'] = None
+
+        # Ichimoku
+        if len(df) >= 52:
+            df['Ichimoku_A'] = ta.trend.ichimoku_a(df['high'], df['low'])
+            df['Ichimoku_B'] = ta.trend.ichimoku_b(df['high'], df['low'])
+            df['Ichimoku_Base'] = ta.trend.ichimoku_base_line(df['high'], df['low'])
+            df['Ichimoku_Conv'] = ta.trend.ichimoku_conversion_line(df['high'], df['low'])
+        else:
+            df['Ichimoku_A'] = None
+            df['Ichimoku_B'] = None
+            df['Ichimoku_Base'] = None
+            df['Ichimoku_Conv'] = None
+        return {col: df[col] for col in INDICATOR_COLUMNS}
+
+    @classmethod
+    def compute_indicator_columns(cls, df, backend=None):
+        """
+        Indicator columns (SMA20/50, Bollinger, MACD, RSI, ADX, ATR, Ichimoku) for an OHLC frame
+        sorted by date. The default NumPy backend computes them in one pass with shared
+        intermediates (see app.services.indicators); it falls back to `ta` when the price
+        columns have holes the kernels do not model. Unavailable indicators are None.
+        """
+        backend = backend or cls.INDICATOR_BACKEND
+        prices = df[['high', 'low', 'close']].to_numpy(dtype=np.float64)
+        if backend == 'ta' or np.isnan(prices).any():
+            return cls._indicator_columns_ta(df)
+        return indicators.compute_indicators(prices[:, 0], prices[:, 1], prices[:, 2])
+
+    @staticmethod
+    def _round_columns(df):
+        """Rounds the numeric columns in place: oscillators to 2 decimals, the rest by their magnitude."""
+        for col in df.select_dtypes(include=[np.number]).columns:
+            if any(x in col for x in ['MACD', 'RSI', 'ADX', 'ATR', 'Ichimoku']):
+                df[col] = df[col].round(2)
+            else:
+                avg_val = df[col].mean()
+                if avg_val > 1000:
+                    df[col] = df[col].round(0)
+                elif avg_val > 100:
+                    df[col] = df[col].round(1)
+                else:
+                    df[col] = df[col].round(2)
+
+    @classmethod
+    def series_summary(cls, data):
+        """
+        The whole-series summaries of calculate_technical_analysis, for candles sorted by date (rows
+        or a prepare_ohlcv_arrays frame): {'sr_levels': {lookback: (supports, resistances)},
+        'recommended_indicators': rankings}. Only the price columns and indicators are computed.
+        """
+        df = pd.DataFrame(data)
+        if len(df) < 10:
+            return None
+        df = df[['date', 'high', 'low', 'close']].sort_values('date')
+        for col in ['high', 'low', 'close']:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        for col, values in cls.compute_indicator_columns(df).items():
+            df[col] = values
+        cls._round_columns(df)
+        return {
+            'sr_levels': cls.get_support_resistance_levels(df, lookbacks=(None, *cls.SR_LOOKBACKS)),
+            'recommended_indicators': cls.prioritize_indicators(df),
+        }
+
+    @staticmethod
+    def candle_patterns(df):
+        """'Doji', 'Hammer' (wins over Doji) or None per bar of an OHLC frame."""
+        body = (df['close'] - df['open']).abs()
+        upper_shadow = df['high'] - df[['open', 'close']].max(axis=1)
+        lower_shadow = df[['open', 'close']].min(axis=1) - df['low']
+        patterns = np.full(len(df), None, dtype=object)
+        patterns[(body <= (df['high'] - df['low']) * 0.1).to_numpy()] = 'Doji'
+        patterns[((lower_shadow >= 2 * body) & (upper_shadow <= 0.1 * body) & (body > 0)).to_numpy()] = 'Hammer'
+        return patterns
+
+    @classmethod
+    def latest_bar_analysis(cls, data):
+        """
+        The newest row of calculate_technical_analysis for scans that only need the latest bar:
+        OHLCV, indicators, Signal, Pattern, supports / resistances, divergence and risk_reward,
+        plus 'bars' and 'previous_close'. Signals and patterns are evaluated for that bar only, and
+        the S/R lookbacks, Fibonacci levels, indicator rankings and record conversion are skipped.
+        Accepts rows or a prepare_ohlcv_arrays frame; None with fewer than 10 candles or on error.
+        """
+        if data is None or len(data) < 10:
+            return None
+        try:
+            df = pd.DataFrame(data)
+            for col in ['open', 'high', 'low', 'close', 'volume']:
+                if col in df.columns:
+                    df[col] = pd.to_numeric(df[col], errors='coerce')
+            if 'date' in df.columns:
+                df = df.sort_values('date')
+            for col, values in cls.compute_indicator_columns(df).items():
+                df[col] = values
+            cls._round_columns(df)
+
+            latest = {k: None if isinstance(v, float) and np.isnan(v) else v for k, v in df.iloc[-1].items()}
+            latest['Signal'] = cls.signal_labels(latest)
+            latest['Pattern'] = cls.candle_patterns(df.tail(1))[0]
+            supports, resistances = cls.get_support_resistance_levels(df)[None]
+            latest.update(
+                supports=supports,
+                resistances=resistances,
+                divergence=cls.detect_divergence(df),
+                risk_reward=cls.calculate_risk_reward(df['close'].iloc[-1], supports, resistances),
+                bars=len(df),
+                previous_close=df['close'].iloc[-2] if len(df) > 1 else None,
+            )
+            return latest
+        except Exception as e:
+            logger.error(f"Error: {e}")
+            return None
+
+    @classmethod
+    def calculate_technical_analysis(cls, data, index_data=None, summary_data=None):
+        """
+        Indicators, signals and patterns of every candle (newest first); the newest row also carries
+        the summaries (S/R levels, Fibonacci, divergence, risk/reward, beta, indicator rankings).
+        When `data` is only a window of the series (output range plus warm-up), summary_data holds
+        the whole series up to the same candle (see series_summary) so the S/R levels and indicator
+        rankings do not depend on the window.
+        """
         if not data or not isinstance(data, list) or len(data) < 10:
             return data
 
@@ -310,48 +619,8 @@ class TechnicalAnalyzer:
             df = df.sort_values('date')
 
         try:
-            # Trend & Momentum
-            if len(df) >= 20:
-                df['SMA20'] = ta.trend.sma_indicator(df['close'], window=20)
-                df['BBU'] = ta.volatility.bollinger_hband(df['close'], window=20)
-                df['BBL'] = ta.volatility.bollinger_lband(df['close'], window=20)
-            else:
-                df['SMA20'] = df['close'].rolling(window=min(len(df), 5)).mean()
-                df['BBU'] = None
-                df['BBL'] = None
-
-            if len(df) >= 50:
-                df['SMA50'] = ta.trend.sma_indicator(df['close'], window=50)
-            else:
-                df['SMA50'] = None
-
-            if len(df) >= 26:
-                df['MACD'] = ta.trend.macd(df['close'])
-                df['MACD_Sig'] = ta.trend.macd_signal(df['close'])
-            else:
-                df['MACD'] = None
-                df['MACD_Sig'] = None
-
-            if len(df) >= 14:
-                df['RSI'] = ta.momentum.rsi(df['close'], window=14)
-                df['ADX'] = ta.trend.adx(df['high'], df['low'], df['close'])
-                df['ATR'] = ta.volatility.average_true_range(df['high'], df['low'], df['close'], window=14)
-            else:
-                df['RSI'] = None
-                df['ADX'] = None
-                df['ATR'] = None
-
-            # Ichimoku
-            if len(df) >= 52:
-                df['Ichimoku_A'] = ta.trend.ichimoku_a(df['high'], df['low'])
-                df['Ichimoku_B'] = ta.trend.ichimoku_b(df['high'], df['low'])
-                df['Ichimoku_Base'] = ta.trend.ichimoku_base_line(df['high'], df['low'])
-                df['Ichimoku_Conv'] = ta.trend.ichimoku_conversion_line(df['high'], df['low'])
-            else:
-                df['Ichimoku_A'] = None
-                df['Ichimoku_B'] = None
-                df['Ichimoku_Base'] = None
-                df['Ichimoku_Conv'] = None
+            for col, values in cls.compute_indicator_columns(df).items():
+                df[col] = values
 
             # Beta calculation if index_data is provided
             beta_val = None
@@ -372,40 +641,18 @@ class TechnicalAnalyzer:
                 except:
                     pass
 
-            for col in df.select_dtypes(include=[np.number]).columns:
-                if any(x in col for x in ['MACD', 'RSI', 'ADX', 'ATR', 'Ichimoku']):
-                    df[col] = df[col].round(2)
-                else:
-                    avg_val = df[col].mean()
-                    if avg_val > 1000:
-                        df[col] = df[col].round(0)
-                    elif avg_val > 100:
-                        df[col] = df[col].round(1)
-                    else:
-                        df[col] = df[col].round(2)
-            
-            def get_signals(row):
-                sigs = []
-                if row['SMA20'] > row['SMA50']: sigs.append('Bullish (SMA)')
-                elif row['SMA20'] < row['SMA50']: sigs.append('Bearish (SMA)')
-                if row['RSI'] < 30: sigs.append('Oversold')
-                elif row['RSI'] > 70: sigs.append('Overbought')
-                if row['MACD'] > row['MACD_Sig']: sigs.append('MACD Bullish')
-                if row['Ichimoku_Conv'] > row['Ichimoku_Base']: sigs.append('Ichimoku Bullish Cross')
-                return ", ".join(sigs) if sigs else 'Neutral'
-
-            df['Signal'] = df.apply(get_signals, axis=1)
-            
-            # Patterns
-            df['Pattern'] = None
-            body = (df['close'] - df['open']).abs()
-            upper_shadow = df['high'] - df[['open', 'close']].max(axis=1)
-            lower_shadow = df[['open', 'close']].min(axis=1) - df['low']
-            df.loc[body <= (df['high'] - df['low']) * 0.1, 'Pattern'] = 'Doji'
-            df.loc[(lower_shadow >= 2 * body) & (upper_shadow <= 0.1 * body) & (body > 0), 'Pattern'] = 'Hammer'
+            cls._round_columns(df)
+
+            df['Signal'] = _SIGNAL_TEXT[cls.signal_flags(df)]
+            df['Pattern'] = cls.candle_patterns(df)
 
             # S/R and Advanced
-            supports, resistances = cls.get_support_resistance(df)
+            summary = cls.series_summary(summary_data) if summary_data is not None else None
+            if summary:
+                sr_levels = summary['sr_levels']
+            else:
+                sr_levels = cls.get_support_resistance_levels(df, lookbacks=(None, *cls.SR_LOOKBACKS))
+            supports, resistances = sr_levels[None]
             fib_levels = cls.get_fibonacci_levels(df)
             divergence = cls.detect_divergence(df)
             risk_reward = cls.calculate_risk_reward(df['close'].iloc[-1], supports, resistances)
@@ -422,12 +669,16 @@ class TechnicalAnalyzer:
             if results:
                 results[0]['supports'] = supports
                 results[0]['resistances'] = resistances
+                results[0]['sr_levels'] = {
+                    str(lookback or 'all'): {'supports': sup, 'resistances': res}
+                    for lookback, (sup, res) in sr_levels.items()
+                }
                 results[0]['fibonacci'] = fib_levels
                 results[0]['divergence'] = divergence
                 results[0]['risk_reward'] = risk_reward
                 results[0]['beta'] = beta_val
                 try:
-                    indicator_rankings = cls.prioritize_indicators(df)
+                    indicator_rankings = summary['recommended_indicators'] if summary else cls.prioritize_indicators(df)
                     results[0]['recommended_indicators'] = indicator_rankings
                 except:
                     pass
@@ -440,9 +691,14 @@ class TechnicalAnalyzer:
     @classmethod
     @classmethod
     @classmethod
-    def generate_chart_image(cls, data, symbol_name, timeframe='daily'):
+    def generate_chart_image(cls, data, symbol_name, timeframe='daily', levels=None):
+        """
+        Renders the candle chart. S/R lines come from `levels` ((supports, resistances)), else from
+        the levels calculate_technical_analysis attached to the data, and are only recomputed
+        for raw data.
+        """
         try:
-            if not data: return None
+            if data is None or len(data) == 0: return None
             df = pd.DataFrame(data)
             if df.empty: return None
             
@@ -461,7 +717,11 @@ class TechnicalAnalyzer:
                 if c in df_plot.columns:
                     df_plot[c] = pd.to_numeric(df_plot[c], errors='coerce')
 
-            supports, resistances = cls.get_support_resistance(df)
+            levels = levels or cls._precomputed_levels(df)
+            if levels is None:
+                ordered = df.sort_values('date') if 'date' in df.columns else df
+                levels = cls.get_support_resistance(ordered.reset_index(drop=True))
+            supports, resistances = levels
             
             hlines, colors, hlabels = [], [], []
             for s in supports[:3]:
@@ -491,7 +751,7 @@ class TechnicalAnalyzer:
             tf_fa = "هفتگی" if timeframe == 'weekly' else "روزانه"
             
             # Create subplots for better control
-            fig, axes = mpf.plot(df_plot, type='candle', style=s, volume=True, 
+            fig, axes = mpf.plot(df_plot, type='candle', style=s, volume=True, volume_panel=3,
                                  addplot=apds,
                                  hlines=dict(hlines=hlines, colors=colors, linestyle='-.', alpha=0.4),
                                  title=f"Technical Analysis ({tf_fa}): {symbol_name}",
@@ -0,0 +1,582 @@
+import copy
+import time
+import asyncio
+import random
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+import requests
+
+from app.core_utils import (
+    SAFE_BROWSER_UA, TLS_CLIENT_AVAILABLE, CURL_CFFI_AVAILABLE, crequests, tls_client
+)
+
+logger = logging.getLogger(__name__)
+
+class HttpSessionManager:
+    """
+    Keep-alive HTTP sessions per bypass technique ('bridge', 'curl_cffi', 'tls_client', 'requests'),
+    shared by all threads: each technique has a pool of sessions that requests check out and return
+    (a session is used by one thread at a time, as the session objects are not thread-safe), so
+    requests served by short-lived threads still reuse open connections instead of paying a TCP +
+    TLS handshake each time. At most POOL_SIZE idle sessions are kept per technique; concurrent
+    requests beyond that open extra sessions that are closed on return. Fingerprinting techniques
+    rotate their client identity on a schedule (every IDENTITY_TTL seconds, or early via rotate());
+    a session is dropped when its identity is out of date or after a transport error.
+    """
+
+    IDENTITY_TTL = 900         # seconds one client identity is kept
+    POOL_SIZE = 4              # idle sessions kept per technique
+    TECHNIQUES = ('bridge', 'curl_cffi', 'tls_client', 'requests')
+    IDENTITIES = {
+        'tls_client': ("chrome_120", "firefox_117", "chrome_110", "safari_15_6_1", "chrome_131"),
+        'curl_cffi': ("chrome120", "chrome124", "chrome110"),
+    }
+
+    def __init__(self, proxy=None):
+        self.proxy = proxy
+        self._lock = threading.Lock()
+        self._idle = {t: [] for t in self.TECHNIQUES}     # technique -> idle slots, most recent last
+        self._busy = {t: 0 for t in self.TECHNIQUES}
+        self._offsets = {t: random.randrange(len(ids)) for t, ids in self.IDENTITIES.items()}
+        self._stats = {t: {"opened": 0, "reused": 0, "requests": 0, "errors": 0, "rotated": 0, "discarded": 0}
+                       for t in self.TECHNIQUES}
+
+    def available(self, technique):
+        if technique == 'curl_cffi':
+            return CURL_CFFI_AVAILABLE
+        if technique == 'tls_client':
+            return TLS_CLIENT_AVAILABLE
+        return technique in self.TECHNIQUES
+
+    def _identity(self, technique):
+        """Scheduled identity of a technique. Caller holds the lock."""
+        idents = self.IDENTITIES.get(technique)
+        if not idents:
+            return None
+        return idents[(int(time.time() // self.IDENTITY_TTL) + self._offsets[technique]) % len(idents)]
+
+    def identity(self, technique):
+        """Client identity currently scheduled for a technique (None for plain HTTP techniques)."""
+        with self._lock:
+            return self._identity(technique)
+
+    def rotate(self, technique):
+        """Moves a technique to its next identity now (e.g. after the current fingerprint got blocked)."""
+        if technique in self._offsets:
+            with self._lock:
+                self._offsets[technique] += 1
+
+    def _open(self, technique, identity):
+        # As before pooling, only tls_client goes through the proxy (curl uses it too, see
+        # TSETMCClient._curl_fallback_request); the bridge, curl_cffi and requests connect directly
+        if technique == 'curl_cffi':
+            session = crequests.Session(impersonate=identity)
+        elif technique == 'tls_client':
+            session = tls_client.Session(client_identifier=identity, random_tls_extension_order=True)
+            if self.proxy:
+                session.proxies = {"http": self.proxy, "https": self.proxy}
+        else:
+            session = requests.Session()
+            session.headers["User-Agent"] = SAFE_BROWSER_UA
+        return session
+
+    def _close(self, session):
+        try: session.close()
+        except Exception: pass
+
+    def _checkout(self, technique):
+        """An idle session of the current identity (warmest first), else a newly opened one."""
+        stale = []
+        with self._lock:
+            identity = self._identity(technique)
+            idle = self._idle[technique]
+            slot = None
+            while idle:
+                candidate = idle.pop()
+                if candidate["identity"] == identity:
+                    slot = candidate
+                    break
+                stale.append(candidate)
+            self._stats[technique]["rotated"] += len(stale)
+            self._busy[technique] += 1
+        for old in stale:
+            self._close(old["session"])
+        if slot is not None:
+            return slot
+        try:
+            slot = {"session": self._open(technique, identity), "identity": identity,
+                    "created": time.time(), "requests": 0}
+        except Exception:
+            with self._lock:
+                self._busy[technique] -= 1
+            raise
+        with self._lock:
+            self._stats[technique]["opened"] += 1
+        return slot
+
+    def _checkin(self, technique, slot, keep=True):
+        with self._lock:
+            self._busy[technique] -= 1
+            if keep and len(self._idle[technique]) < self.POOL_SIZE:
+                self._idle[technique].append(slot)
+                return
+            if not keep:
+                self._stats[technique]["discarded"] += 1
+        self._close(slot["session"])
+
+    def discard(self, technique):
+        """Closes the idle sessions of a technique (the next request opens a fresh one)."""
+        with self._lock:
+            idle, self._idle[technique] = self._idle[technique], []
+            self._stats[technique]["discarded"] += len(idle)
+        for slot in idle:
+            self._close(slot["session"])
+
+    def get(self, technique, url, headers=None, timeout=30, verify=True):
+        """
+        GET through a pooled session of a technique. Transport errors discard the session used
+        and are re-raised, so callers keep their own fallback handling.
+        """
+        slot = self._checkout(technique)
+        with self._lock:
+            self._stats[technique]["requests"] += 1
+            if slot["requests"] > 0:
+                self._stats[technique]["reused"] += 1
+        session = slot["session"]
+        try:
+            if technique == 'tls_client':
+                response = session.get(url, headers=headers, timeout_seconds=timeout)
+            else:
+                response = session.get(url, headers=headers, timeout=timeout, verify=verify)
+        except Exception:
+            with self._lock:
+                self._stats[technique]["errors"] += 1
+            self._checkin(technique, slot, keep=False)
+            raise
+        slot["requests"] += 1
+        self._checkin(technique, slot)
+        return response
+
+    def close_all(self):
+        for technique in self.TECHNIQUES:
+            self.discard(technique)
+
+    def stats(self):
+        """Per-technique session counters; reuse_ratio is the share of requests sent on a warm session."""
+        with self._lock:
+            return {
+                technique: {
+                    **counters,
+                    "open_sessions": len(self._idle[technique]) + self._busy[technique],
+                    "idle_sessions": len(self._idle[technique]),
+                    "reuse_ratio": round(counters["reused"] / counters["requests"], 3) if counters["requests"] else None,
+                }
+                for technique, counters in self._stats.items() if self.available(technique)
+            }
+
+class TechniqueScoreboard:
+    """
+    Live scores of the transport techniques ('bridge:https', 'curl_cffi:http', ...) that decide the
+    order in which a request tries them. Per technique it keeps EWMAs of the success rate, the
+    latency of successful attempts and the cost of failed ones (often a timeout), plus failure
+    streaks. Techniques are tried by expected time to success, cost / p where
+    cost = p * latency + (1 - p) * failure_cost: the optimal order for "try until one works".
+
+    A technique that fails FAILURE_THRESHOLD times in a row is opened (skipped) for a cooldown that
+    doubles on every failed probe, up to MAX_COOLDOWN. After the cooldown it is half-open: one
+    request at a time may probe it, ranked by its success latency as if it worked again, so a
+    recovered technique that beats the current one is found again. A technique whose last attempt
+    failed gets the same probe once that failure is a cooldown old. Unknown techniques start from
+    neutral priors and keep their declared order.
+    """
+
+    ALPHA = 0.2                 # EWMA weight of the newest attempt
+    PRIOR_SUCCESS = 0.5
+    PRIOR_LATENCY = 5.0         # seconds
+    FAILURE_THRESHOLD = 3
+    COOLDOWN = 120              # seconds before the first half-open probe
+    MAX_COOLDOWN = 3600
+    PROBE_TIMEOUT = 90          # a claimed probe that never reports back expires after this
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scores = {}
+
+    def _score(self, technique):
+        score = self._scores.get(technique)
+        if score is None:
+            score = self._scores[technique] = {
+                "success_rate": self.PRIOR_SUCCESS, "latency": self.PRIOR_LATENCY,
+                "failure_cost": self.PRIOR_LATENCY, "attempts": 0, "successes": 0, "streak": 0,
+                "last_success": None, "last_failure": None, "open_until": 0.0, "cooldown": 0.0,
+                "probe_claimed": 0.0,
+            }
+        return score
+
+    def _expected_time(self, score, probe=False):
+        if probe:
+            # Optimistic: what the technique costs if it works again
+            return score["latency"]
+        p = max(score["success_rate"], 0.01)
+        cost = p * score["latency"] + (1 - p) * score["failure_cost"]
+        return cost / p
+
+    def order(self, techniques):
+        """
+        Techniques to try for one request, best first. Open techniques are left out. A request
+        claims at most one half-open technique for its probe, ranked optimistically; the other
+        half-open ones (claimed by concurrent requests, or beyond this request's probe) follow the
+        ranked techniques as a last resort. When every technique is open, the one whose cooldown
+        ends first is probed, so the list is never empty and the client can still recover.
+        """
+        now = time.time()
+        ranked, deferred, waiting = [], [], []
+        probe = None
+        with self._lock:
+            for position, technique in enumerate(techniques):
+                score = self._score(technique)
+                if score["open_until"] > now:
+                    waiting.append((score["open_until"], position, technique))
+                    continue
+                # Half-open after a trip, or a failure that has not been retried for a cooldown
+                half_open = score["cooldown"] > 0 or (
+                    score["last_failure"] is not None and score["streak"] > 0
+                    and now - score["last_failure"] > self.COOLDOWN)
+                if not half_open:
+                    ranked.append((self._expected_time(score), position, technique))
+                elif now - score["probe_claimed"] < self.PROBE_TIMEOUT:
+                    # Another request is probing it
+                    deferred.append((self._expected_time(score), position, technique))
+                else:
+                    candidate = (self._expected_time(score, probe=True), position, technique)
+                    if probe is None or candidate < probe:
+                        if probe is not None:
+                            deferred.append((self._expected_time(self._score(probe[2])), probe[1], probe[2]))
+                        probe = candidate
+                    else:
+                        deferred.append((self._expected_time(score), position, technique))
+            if probe is not None:
+                self._score(probe[2])["probe_claimed"] = now
+                ranked.append(probe)
+            if not ranked and not deferred and waiting:
+                _, position, technique = min(waiting)
+                self._score(technique)["probe_claimed"] = now
+                ranked.append((0.0, position, technique))
+        return [technique for _, _, technique in sorted(ranked) + sorted(deferred)]
+
+    def record(self, technique, ok, seconds):
+        """Folds one attempt (success flag, wall time) into the technique's score."""
+        now = time.time()
+        a = self.ALPHA
+        with self._lock:
+            score = self._score(technique)
+            score["attempts"] += 1
+            score["success_rate"] += a * ((1.0 if ok else 0.0) - score["success_rate"])
+            score["probe_claimed"] = 0.0
+            if ok:
+                # The first observation replaces the prior
+                score["latency"] += (a if score["successes"] else 1.0) * (seconds - score["latency"])
+                score["successes"] += 1
+                score.update(streak=0, last_success=now, open_until=0.0, cooldown=0.0)
+                return
+            failures = score["attempts"] - 1 - score["successes"]
+            score["failure_cost"] += (a if failures else 1.0) * (seconds - score["failure_cost"])
+            score["streak"] += 1
+            score["last_failure"] = now
+            if score["cooldown"] > 0 or score["streak"] >= self.FAILURE_THRESHOLD:
+                # Trip (or re-trip after a failed probe) with a doubling cooldown
+                score["cooldown"] = min(score["cooldown"] * 2 or self.COOLDOWN, self.MAX_COOLDOWN)
+                score["open_until"] = now + score["cooldown"]
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return {
+                technique: {
+                    "state": "open" if s["open_until"] > now else ("half-open" if s["cooldown"] > 0 else "closed"),
+                    "expected_seconds": round(self._expected_time(s), 2),
+                    "success_rate": round(s["success_rate"], 3),
+                    "latency": round(s["latency"], 3),
+                    "failure_cost": round(s["failure_cost"], 3),
+                    "attempts": s["attempts"],
+                    "successes": s["successes"],
+                    "last_failure": datetime.fromtimestamp(s["last_failure"]).isoformat() if s["last_failure"] else None,
+                    "retry_in": round(max(s["open_until"] - now, 0), 1),
+                }
+                for technique, s in sorted(self._scores.items(), key=lambda item: self._expected_time(item[1]))
+            }
+
+class RateLimiter:
+    """
+    Upstream fair-use limiter (at most `max_requests` calls per `window` seconds, calls at least
+    `min_gap` seconds apart plus a random jitter) built on slot reservation: under the lock a
+    caller only computes and books the start time of its call, then sleeps outside the lock.
+
+    Traffic runs in priority lanes, highest first: 'interactive' (user requests) books the next
+    free slot at once, so it only ever waits behind the gap and other interactive calls.
+    'background' (preload, registry sync) and 'backfill' (proxy index components, bulk history)
+    book a slot only when it is due and no higher lane is waiting, so they never hold future slots
+    an interactive call would need. While interactive traffic was seen within the last window,
+    bulk lanes leave `interactive_reserve` calls of the window budget free; otherwise they use the
+    whole budget.
+    """
+
+    LANES = ('interactive', 'background', 'backfill')
+
+    def __init__(self, max_requests, window, min_gap, jitter=0.5, interactive_reserve=10):
+        self.max_requests = max_requests
+        self.window = window
+        self.min_gap = min_gap
+        self.jitter = jitter
+        self.interactive_reserve = interactive_reserve
+        self._cond = threading.Condition()
+        self._calls = deque()            # booked call times inside the window
+        self._next_free = 0.0            # earliest start allowed by the gap
+        self._cooling_until = 0.0        # circuit breaker
+        self._last_interactive = float('-inf')
+        self._waiting = {lane: 0 for lane in self.LANES}
+        self._stats = {lane: {"calls": 0, "waited": 0.0, "max_wait": 0.0} for lane in self.LANES}
+
+    def cool_down(self, seconds):
+        """Holds every lane for `seconds` (e.g. after repeated blocks)."""
+        with self._cond:
+            self._cooling_until = max(self._cooling_until, time.time() + seconds)
+
+    def _earliest(self, now, lane):
+        """Earliest start a call of `lane` could book. Caller holds the lock."""
+        while self._calls and self._calls[0] <= now - self.window:
+            self._calls.popleft()
+        start = max(now, self._next_free, self._cooling_until)
+        budget = self.max_requests
+        if lane != 'interactive' and now - self._last_interactive < self.window:
+            budget -= self.interactive_reserve
+        if len(self._calls) >= budget:
+            # The call that has to leave the window first
+            start = max(start, self._calls[len(self._calls) - budget] + self.window)
+        return start
+
+    def _book(self, start, lane):
+        self._calls.append(start)
+        self._next_free = start + self.min_gap + random.uniform(0, self.jitter)
+        if lane == 'interactive':
+            self._last_interactive = start
+
+    def rank(self, lane):
+        """Priority of a lane, 0 (interactive) first; unknown lanes count as interactive."""
+        return self.LANES.index(lane) if lane in self.LANES else 0
+
+    def expected_wait(self, lane='interactive'):
+        """Seconds a call of `lane` would wait if it asked now (bulk lanes also count the callers queued ahead)."""
+        now = time.time()
+        with self._cond:
+            wait = self._earliest(now, lane) - now
+            if lane != 'interactive':
+                ahead = sum(self._waiting[l] for l in self.LANES[:self.LANES.index(lane) + 1])
+                wait += ahead * (self.min_gap + self.jitter / 2)
+        return max(wait, 0.0)
+
+    def _try_book(self, lane, now):
+        """
+        Books a slot for `lane` if the lane may take one now. Returns (start, None) when booked,
+        else (None, seconds until it is worth asking again). Caller holds the lock.
+        """
+        start = self._earliest(now, lane)
+        if lane == 'interactive':
+            self._book(start, lane)
+            return start, None
+        higher = self.LANES[:self.LANES.index(lane)]
+        if start <= now and not any(self._waiting[l] for l in higher):
+            self._book(now, lane)
+            return now, None
+        return None, min(max(start - now, 0.05), 5.0)
+
+    def _record(self, lane, requested):
+        waited = time.time() - requested
+        with self._cond:
+            stats = self._stats[lane]
+            stats["calls"] += 1
+            stats["waited"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+        if waited > 5:
+            logger.info(f"Rate limiter held a {lane} call for {waited:.1f}s")
+        return waited
+
+    def acquire(self, lane='interactive'):
+        """Blocks until a call of `lane` may start; returns the seconds waited."""
+        lane = lane if lane in self.LANES else 'interactive'
+        requested = time.time()
+        with self._cond:
+            self._waiting[lane] += 1
+            try:
+                while True:
+                    start, retry_in = self._try_book(lane, time.time())
+                    if start is not None:
+                        break
+                    # wait() releases the lock; bookings of other lanes wake us up early
+                    self._cond.wait(timeout=retry_in)
+            finally:
+                self._waiting[lane] -= 1
+            self._cond.notify_all()
+        delay = start - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        return self._record(lane, requested)
+
+    async def acquire_async(self, lane='interactive'):
+        """acquire() for coroutines: same slots and lanes, but waits with asyncio.sleep."""
+        lane = lane if lane in self.LANES else 'interactive'
+        requested = time.time()
+        with self._cond:
+            self._waiting[lane] += 1
+        try:
+            while True:
+                with self._cond:
+                    start, retry_in = self._try_book(lane, time.time())
+                    if start is not None:
+                        self._cond.notify_all()
+                        break
+                await asyncio.sleep(retry_in)
+        finally:
+            with self._cond:
+                self._waiting[lane] -= 1
+        delay = start - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return self._record(lane, requested)
+
+    def stats(self):
+        now = time.time()
+        with self._cond:
+            in_window = sum(1 for t in self._calls if t > now - self.window)
+            lanes = {
+                lane: {
+                    "calls": s["calls"], "waiting": self._waiting[lane],
+                    "avg_wait": round(s["waited"] / s["calls"], 3) if s["calls"] else None,
+                    "max_wait": round(s["max_wait"], 3),
+                }
+                for lane, s in self._stats.items()
+            }
+        return {
+            "window_used": in_window, "window_budget": self.max_requests,
+            "cooling_for": round(max(self._cooling_until - now, 0), 1),
+            "expected_wait": {lane: round(self.expected_wait(lane), 2) for lane in self.LANES},
+            "lanes": lanes,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight calls: the first caller of a key (the leader) takes its
+    rate-limiter slot (`acquire`) and runs the call, callers arriving before it finishes wait for
+    its outcome instead of spending another upstream request. Followers receive their own deep copy
+    of the result (callers may mutate it) and re-raise the leader's exception.
+
+    Calls carry a priority rank (RateLimiter lane index, 0 = interactive). A caller only joins a
+    leader of the same or a higher priority, or one already past its slot wait; otherwise waiting
+    would hand it the leader's lane, so it runs on its own. Sync (do) and async (do_async) callers
+    share one map, so a thread and a coroutine asking for the same call coalesce too.
+    """
+
+    class _Call:
+        __slots__ = ("done", "result", "error", "followers", "rank", "started")
+
+        def __init__(self, rank):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+            self.followers = 0
+            self.rank = rank
+            self.started = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._leaders = 0
+        self._saved = 0
+        self._bypassed = 0
+
+    def _join(self, key, rank):
+        """(call, is_leader); call is None when the caller must run uncoalesced."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = self._Call(rank)
+                self._leaders += 1
+                return call, True
+            if call.rank <= rank or call.started:
+                call.followers += 1
+                self._saved += 1
+                return call, False
+            self._bypassed += 1
+            return None, False
+
+    def _result(self, call):
+        if call.error is not None:
+            raise call.error
+        return copy.deepcopy(call.result)
+
+    def _finish(self, key, call, result):
+        with self._lock:
+            del self._calls[key]
+            followers = call.followers
+        if followers and call.error is None:
+            # Frozen snapshot, so the leader's caller can mutate its result meanwhile
+            call.result = copy.deepcopy(result)
+        call.done.set()
+
+    def do(self, key, fn, rank=0, acquire=None):
+        call, leader = self._join(key, rank)
+        if call is None:
+            if acquire: acquire()
+            return fn()
+        if not leader:
+            call.done.wait()
+            return self._result(call)
+
+        result = None
+        try:
+            if acquire: acquire()
+            call.started = True
+            result = fn()
+            return result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call, result)
+
+    async def do_async(self, key, fn, rank=0, acquire=None):
+        """do() for coroutines: fn and acquire are coroutine functions; followers wait without blocking the loop."""
+        call, leader = self._join(key, rank)
+        if call is None:
+            if acquire: await acquire()
+            return await fn()
+        if not leader:
+            await asyncio.to_thread(call.done.wait)
+            return self._result(call)
+
+        result = None
+        try:
+            if acquire: await acquire()
+            call.started = True
+            result = await fn()
+            return result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call, result)
+
+    def stats(self):
+        with self._lock:
+            total = self._leaders + self._saved
+            return {
+                "upstream_calls": self._leaders + self._bypassed,
+                "saved_calls": self._saved,
+                "priority_bypasses": self._bypassed,
+                "in_flight": len(self._calls),
+                "saved_ratio": round(self._saved / total, 3) if total else None,
+            }
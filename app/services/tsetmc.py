@@ -1,22 +1,27 @@
 import os
 import json
+import asyncio
 import time
 import random
 import threading
 import subprocess
 import shutil
 import logging
+from contextlib import contextmanager
 from datetime import datetime
 from urllib.parse import urlencode, quote
+import numpy as np
 import pandas as pd
 
-import requests
 from app.core_utils import (
     SAFE_BROWSER_UA, update_stats, TLS_CLIENT_AVAILABLE, 
-    CURL_CFFI_AVAILABLE, crequests, tls_client, BRIDGE_URL,
-    API_KEY, PROXY_URL
+    CURL_CFFI_AVAILABLE, HTTPX_AVAILABLE, BRIDGE_URL, API_KEY, PROXY_URL
 )
 from app.database import db
+from app.services.transport import HttpSessionManager, TechniqueScoreboard, RateLimiter, SingleFlight
+from app.services.tsetmc_async import AsyncTSETMCClient
+from app.services.index_engine import build_aggregate_index
+from app.services.classification import classify_equity_market, normalize_text, CLASSIFIER_VERSION
 
 logger = logging.getLogger(__name__)
 
@@ -47,90 +52,99 @@ class TSETMCClient:
         self.api_key = api_key
         self.proxy = proxy
         self.curl_path = shutil.which("curl")
-        self._network_lock = threading.Lock()
-        self._last_network_call = 0
-        self._request_history = []
+        # Keep-alive sessions per bypass technique (identities rotate on a schedule)
+        self.sessions = HttpSessionManager(proxy)
+        self.scoreboard = TechniqueScoreboard()
+        self.limiter = RateLimiter(self.MAX_REQS_STRICT, self.WINDOW_SECONDS, self.MIN_REQUEST_GAP)
+        self._lane = threading.local()
+        self.inflight = SingleFlight()
         self._consecutive_failures = 0
-        self._cooling_until = 0
         self._symbols_cache = {} # Short-term memory cache
+        self._registry_locks = {}
+        self._registry_locks_guard = threading.Lock()
         
         # Diagnostics
+        # Market classes are precomputed into the registry; reclassifies stored rows if the rules changed
+        db.register_classifier(classify_equity_market, CLASSIFIER_VERSION)
+
         if TLS_CLIENT_AVAILABLE: self.client_name = "TLS-Fingerprint-Spoof"
         elif CURL_CFFI_AVAILABLE: self.client_name = "CURL-Impersonate"
         else: self.client_name = "Native-Requests (High Risk)"
         logger.info(f"Initialized TSETMC Client via {self.client_name}")
 
     def _normalize_text(self, text):
-        if not text: return ""
-        # Standardize Persian characters
-        return text.replace('ي', 'ی').replace('ك', 'ک').strip()
+        return normalize_text(text)
 
     def _classify_equity_market(self, s):
-        """Refined classification logic."""
-        isin = str(s.get('isin', ''))
-        cs_id = str(s.get('cs_id', '') or s.get('cs', ''))
-        cs_name = str(s.get('cs_name', ''))
-        flow = str(s.get('flow', ''))
-        market_name = str(s.get('market_name', '')).lower()
-        ticker = str(s.get('l18', ''))
-
-        if not isin or isin == "None": return "unknown"
-        if cs_id == "68" or isin.startswith("IRO5") or "etf" in cs_name.lower() or "صندوق" in cs_name or "صندوق" in ticker: return "etf"
-        if cs_id == "69" or isin.startswith(("IRO2", "IRO4", "IROB")) or any(k in cs_name for k in ["اوراق", "سکوک", "اجاره", "مرابحه", "منفعت", "گام"]): return "fixed_income"
-        if cs_id == "59" or isin.startswith("IROL") or any(k in cs_name for k in ["تسهیلات", "مسکن"]) or ticker.startswith("تسه"): return "tashilat"
-        if "انرژی" in market_name or "energy" in market_name or "انرژی" in cs_name: return "energy"
-        if cs_id in ["67", "28", "32"] or any(k in ticker for k in ["سکه", "طلا", "زعف", "نفت", "برنج", "پسته", "میوه", "شمش"]): return "commodity"
-        if flow in ["5", "6", "7", "8"] or any(k in market_name for k in ["پایه", "payeh", "زرد", "نارنجی", "قرمز"]) or isin.startswith("IRO7"): return "base"
-        if flow in ["3", "4"] or any(k in market_name for k in ["فرابورس", "farabourse", "ifb"]) or isin.startswith("IRO3"): return "farabourse"
-        if flow in ["1", "2"] or any(k in market_name for k in ["بورس", "bourse", "tse"]) or isin.startswith("IRO1"): return "bourse"
-        return "bourse"
+        """Refined classification logic (see app.services.classification)."""
+        return classify_equity_market(s)
+
+    def _registry_lock(self, db_category):
+        """One lock per registry category so concurrent refreshes don't all hit the API."""
+        with self._registry_locks_guard:
+            return self._registry_locks.setdefault(db_category, threading.Lock())
+
+    def _cache_get(self, cache_key, max_age=21600):
+        """Short-term memory cache lookup; entries die after max_age or when the registry generation moves."""
+        cached = self._symbols_cache.get(cache_key)
+        if not cached:
+            return None
+        data, timestamp, generation = cached
+        if (datetime.now() - timestamp).total_seconds() >= max_age: return None
+        if generation != db.get_registry_generation(): return None
+        return data
+
+    def _cache_set(self, cache_key, data):
+        self._symbols_cache[cache_key] = (data, datetime.now(), db.get_registry_generation())
 
     def _fetch_symbols_by_type(self, api_type, force_refresh=False):
         """Low-level fetcher for brute-force symbol discovery."""
-        cache_key = f"raw_symbols_type_{api_type}"
-        now = datetime.now()
+        db_category = f"symbols_type_{api_type}"
         
         # Logic for Refreshing the Registry
         if force_refresh:
-            logger.info(f"Refreshing Registry for Type {api_type}...")
-            data = self._make_request("Api/Tsetmc/AllSymbols.php", {"type": api_type}, service="discovery")
-            if isinstance(data, list) and len(data) > 0:
-                # Save to Persistent Database
-                db_category = f"symbols_type_{api_type}"
-                db.clear_symbols(db_category)
-                db.save_symbols(data, db_category)
-                return data
+            generation_before = db.get_registry_generation(db_category)
+            with self._registry_lock(db_category):
+                # Another thread swapped in a fresh universe while we waited: reuse it
+                if db.get_registry_generation(db_category) != generation_before:
+                    return db.get_symbols_by_market(db_category)
+                logger.info(f"Refreshing Registry for Type {api_type}...")
+                data = self._make_request("Api/Tsetmc/AllSymbols.php", {"type": api_type}, service="discovery")
+                if isinstance(data, list) and len(data) > 0:
+                    # Atomic swap into the persistent registry (readers never see an empty market)
+                    db.replace_symbols(data, db_category)
+                    return data
         
         # Default: Try to load from Persistent Database first (Fast & Safe)
-        db_category = f"symbols_type_{api_type}"
         stored_data = db.get_symbols_by_market(db_category)
         if stored_data and len(stored_data) > 0:
             return stored_data
             
-        # If DB is empty, only then call API
-        logger.info(f"Registry empty for Type {api_type}. Initializing fetch...")
-        data = self._make_request("Api/Tsetmc/AllSymbols.php", {"type": api_type}, service="discovery")
-        if isinstance(data, list) and len(data) > 0:
-            db.save_symbols(data, db_category)
-            return data
+        # If DB is empty, only then call API (once, even with concurrent callers)
+        with self._registry_lock(db_category):
+            stored_data = db.get_symbols_by_market(db_category)
+            if stored_data:
+                return stored_data
+            logger.info(f"Registry empty for Type {api_type}. Initializing fetch...")
+            data = self._make_request("Api/Tsetmc/AllSymbols.php", {"type": api_type}, service="discovery")
+            if isinstance(data, list) and len(data) > 0:
+                db.replace_symbols(data, db_category)
+                return data
             
         return data if data else []
 
     def _get_equity_universe(self, api_type="1", force_refresh=False):
         """Unified fetch for symbol universes (Type 1 or 2)."""
         cache_key = f"symbols_universe_type_{api_type}"
-        now = datetime.now()
         
         if not force_refresh:
-            cached = self._symbols_cache.get(cache_key)
+            cached = self._cache_get(cache_key)
             if cached:
-                data, timestamp = cached
-                if (now - timestamp).total_seconds() < 21600: # 6 hours
-                    return data
+                return cached
 
         data = self._fetch_symbols_by_type(api_type, force_refresh=force_refresh)
         if isinstance(data, list):
-            self._symbols_cache[cache_key] = (data, now)
+            self._cache_set(cache_key, data)
         return data
 
     def _filter_symbols(self, universe, categories):
@@ -142,156 +156,123 @@ class TSETMCClient:
         filtered = [sym for sym in universe if self._classify_equity_market(sym) in allowed]
         return filtered
 
+    @contextmanager
+    def traffic_lane(self, lane):
+        """
+        Runs the upstream calls of the current thread in a RateLimiter lane ('background' for
+        preload/sync jobs, 'backfill' for bulk history loads). Calls default to 'interactive'.
+        """
+        previous = getattr(self._lane, "name", None)
+        self._lane.name = lane
+        try:
+            yield
+        finally:
+            self._lane.name = previous
+
     def _apply_fair_use_control(self, endpoint):
         """
-        Enforces BrsApi Fair Use Policy and Anti-NGFW Timing.
-        Absolute sequential execution via locking.
+        Enforces BrsApi Fair Use Policy and Anti-NGFW Timing (gap with random jitter, window budget,
+        circuit breaker) through the shared RateLimiter. The lock only books a slot; the wait
+        happens outside it, so a user request is never stuck behind a sleeping bulk job.
         """
-        with self._network_lock:
-            now = time.time()
-            
-            # 0. Circuit Breaker
-            if now < self._cooling_until:
-                wait_time = self._cooling_until - now
-                logger.warning(f"Circuit breaker active. Cooling for {wait_time:.1f}s")
-                time.sleep(wait_time)
-                now = time.time()
-
-            # 1. Human-Like Behavior
-            think_time = random.uniform(0.5, 1.5)
-            time.sleep(think_time)
-            now = time.time()
-
-            # 2. Mandatory gap
-            elapsed_since_last = now - self._last_network_call
-            if elapsed_since_last < self.MIN_REQUEST_GAP:
-                sleep_time = self.MIN_REQUEST_GAP - elapsed_since_last
-                time.sleep(sleep_time)
-                now = time.time() 
-                
-            # 3. Rate limiting
-            self._request_history = [t for t in self._request_history if (now - t) < self.WINDOW_SECONDS]
-            
-            if len(self._request_history) >= self.MAX_REQS_STRICT:
-                wait_needed = self.WINDOW_SECONDS - (now - self._request_history[0])
-                logger.warning(f"Rate limit reached. Waiting {wait_needed + 2:.1f}s")
-                time.sleep(wait_needed + 2)
-                now = time.time()
-                self._request_history = [t for t in self._request_history if (now - t) < self.WINDOW_SECONDS]
-                
-            self._last_network_call = now
-            self._request_history.append(now)
+        return self.limiter.acquire(getattr(self._lane, "name", None) or "interactive")
+
+    @staticmethod
+    def _request_key(endpoint, params):
+        """Coalescing key of an upstream call (endpoint plus params with sorted keys)."""
+        return endpoint, json.dumps(params or {}, sort_keys=True, default=str)
 
     def _make_request(self, endpoint, params=None, service=None):
         """
         Professional Resilient Request Handler.
+        Identical calls (same endpoint and params) already in flight are coalesced (SingleFlight):
+        only the leader goes through fair-use control and upstream, the others share its answer.
+        """
+        lane = getattr(self._lane, "name", None) or "interactive"
+        return self.inflight.do(
+            self._request_key(endpoint, params), lambda: self._locked_make_request(endpoint, params, service),
+            rank=self.limiter.rank(lane), acquire=lambda: self._apply_fair_use_control(endpoint))
+
+    def _techniques(self, endpoint, query):
+        """
+        Transports able to fetch an endpoint, in the legacy preference order (bridge, curl,
+        curl_cffi, tls_client, requests; https before http). Each call takes the retry round and
+        returns the parsed JSON, or None when the technique got no usable answer.
         """
-        # Call apply_fair_use_control which now handles the lock internally
-        self._apply_fair_use_control(endpoint)
-        return self._locked_make_request(endpoint, params, service)
+        def json_body(resp):
+            return resp.json() if resp.status_code == 200 else None
+
+        techniques = {}
+        for protocol in ("https", "http"):
+            url = f"{protocol}://brsapi.ir/{endpoint}"
+            full_url = f"{url}?{urlencode(query, doseq=True)}"
+
+            if BRIDGE_URL:
+                def bridge(retry, full_url=full_url):
+                    # Use absolute encoding (safe='') for Google Script redirects
+                    resp = self.sessions.get("bridge", f"{BRIDGE_URL}?url={quote(full_url, safe='')}", timeout=30)
+                    content = resp.text.strip() if resp.status_code == 200 else ""
+                    if content.startswith(('[', '{')):
+                        return resp.json()
+                    logger.debug(f"Bridge returned non-JSON: {content[:100]}")
+                    return None
+                techniques[f"bridge:{protocol}"] = bridge
+            if self.curl_path:
+                def curl(retry, url=url, protocol=protocol):
+                    data = self._curl_fallback_request(url, query, force_http11=retry > 0 or protocol == "http")
+                    return data if isinstance(data, (list, dict)) and "error" not in str(data)[:50] else None
+                techniques[f"curl:{protocol}"] = curl
+            if CURL_CFFI_AVAILABLE:
+                techniques[f"curl_cffi:{protocol}"] = lambda retry, full_url=full_url: json_body(
+                    self.sessions.get("curl_cffi", full_url, timeout=30, verify=False))
+            if TLS_CLIENT_AVAILABLE and protocol == "https":
+                techniques[f"tls_client:{protocol}"] = lambda retry, full_url=full_url: json_body(
+                    self.sessions.get("tls_client", full_url, headers=self.CHROME_HEADERS, timeout=45))
+            techniques[f"requests:{protocol}"] = lambda retry, full_url=full_url: json_body(
+                self.sessions.get("requests", full_url, headers={"User-Agent": "Mozilla/5.0"}, timeout=15, verify=False))
+        return techniques
 
     def _locked_make_request(self, endpoint, params=None, service=None):
         query = params.copy() if params else {}
         query["key"] = self.api_key
         
-        protocols = ["https", "http"]
-        idents = ["chrome_120", "firefox_117", "chrome_110", "safari_15_6_1", "chrome_131"]
-        
         is_discovery = (service == "symbols" or "AllSymbols" in endpoint)
-        current_max = 3 if is_discovery else 5
+        rounds = 1 if is_discovery else 2
+        techniques = self._techniques(endpoint, query)
         
-        for protocol in protocols:
-            url = f"{protocol}://brsapi.ir/{endpoint}"
-            full_url = f"{url}?{urlencode(query, doseq=True)}"
-            
-            if BRIDGE_URL:
+        # Techniques are tried by expected time to success (see TechniqueScoreboard); techniques
+        # that keep failing are skipped until their half-open probe.
+        for retry in range(rounds):
+            if retry > 0:
+                wait = (3 if is_discovery else 10) + random.uniform(1, 3)
+                logger.info(f"Retrying {endpoint} (round {retry})...")
+                time.sleep(wait)
+
+            for name in self.scoreboard.order(list(techniques)):
+                logger.debug(f"Technique {name} for {endpoint}...")
+                started = time.perf_counter()
                 try:
-                    # Use absolute encoding (safe='') for Google Script redirects
-                    encoded_target = quote(full_url, safe='')
-                    bridge_request_url = f"{BRIDGE_URL}?url={encoded_target}"
-                    logger.debug(f"Trying Bridge for {endpoint}...")
-                    resp = requests.get(bridge_request_url, timeout=30)
-                    if resp.status_code == 200:
-                        content = resp.text.strip()
-                        if content.startswith(('[', '{')):
-                            self._consecutive_failures = 0
-                            if service: update_stats(service, "success")
-                            return resp.json()
-                        else:
-                            logger.debug(f"Bridge returned non-JSON: {content[:100]}")
+                    data = techniques[name](retry)
                 except Exception as e:
-                    logger.error(f"Bridge failed: {str(e)[:50]}")
-
-            for attempt in range(current_max):
-                tech_variant = attempt % 3
-
-                if attempt > 0:
-                    wait = (attempt * (3 if is_discovery else 10)) + random.uniform(1, 3)
-                    logger.info(f"Retrying {endpoint} (Attempt {attempt}, Tech {tech_variant})...")
-                    time.sleep(wait)
+                    logger.error(f"{name} failed: {str(e)[:50]}")
+                    data = None
+                self.scoreboard.record(name, data is not None, time.perf_counter() - started)
+                if data is not None:
+                    self._consecutive_failures = 0
+                    if service: update_stats(service, "success")
+                    return data
 
-                # Tech 0: Curl
-                if tech_variant == 0 and self.curl_path:
-                    try:
-                        logger.debug(f"Technique Curl for {endpoint}...")
-                        is_safe_mode = (attempt > 0) or (protocol == "http")
-                        data = self._curl_fallback_request(url, query, force_http11=is_safe_mode)
-                        if data and isinstance(data, (list, dict)) and "error" not in str(data)[:50]:
-                            self._consecutive_failures = 0
-                            if service: update_stats(service, "success")
-                            return data
-                    except Exception as e:
-                        logger.error(f"Curl failed: {str(e)[:50]}")
-
-                # Tech 1: cffi/tls
-                if tech_variant == 1:
-                    if CURL_CFFI_AVAILABLE:
-                        try:
-                            logger.debug(f"Technique CURL_CFFI for {endpoint}...")
-                            if protocol == "https":
-                                resp = crequests.get(full_url, impersonate="chrome120", timeout=30, verify=False)
-                            else:
-                                resp = crequests.get(full_url, timeout=30)
-                            if resp.status_code == 200:
-                                self._consecutive_failures = 0
-                                if service: update_stats(service, "success")
-                                return resp.json()
-                        except Exception as e:
-                            logger.error(f"CURL_CFFI failed: {str(e)[:50]}")
-                    
-                    if TLS_CLIENT_AVAILABLE and protocol == "https":
-                        try:
-                            logger.debug(f"Technique TLS_CLIENT for {endpoint}...")
-                            selected_id = random.choice(idents)
-                            sess = tls_client.Session(client_identifier=selected_id, random_tls_extension_order=True)
-                            if self.proxy: sess.proxies = {"http": self.proxy, "https": self.proxy}
-                            response = sess.get(full_url, headers=self.CHROME_HEADERS, timeout_seconds=45)
-                            if response.status_code == 200:
-                                self._consecutive_failures = 0
-                                if service: update_stats(service, "success")
-                                return response.json()
-                        except Exception as e:
-                            logger.error(f"TLS_CLIENT failed: {str(e)[:50]}")
-
-                # Tech 2: Requests
-                if tech_variant == 2 or attempt == current_max - 1:
-                    try:
-                        logger.debug(f"Technique Requests for {endpoint}...")
-                        resp = requests.get(full_url, headers={"User-Agent": "Mozilla/5.0"}, timeout=15, verify=False)
-                        if resp.status_code == 200:
-                            self._consecutive_failures = 0
-                            if service: update_stats(service, "success")
-                            return resp.json()
-                    except Exception as e:
-                        logger.error(f"Requests failed: {str(e)[:50]}")
+        return self._all_techniques_failed(endpoint, service, is_discovery)
 
+    def _all_techniques_failed(self, endpoint, service, is_discovery):
+        """Counts a request no technique could serve (trips the circuit breaker) and returns the error."""
         if service: update_stats(service, "blocked")
         print(f"🚨 CRITICAL: All techniques failed for {endpoint}")
         
         if not is_discovery:
             self._consecutive_failures += 1
             if self._consecutive_failures >= 3:
-                self._cooling_until = time.time() + 60
+                self.limiter.cool_down(60)
                 self._consecutive_failures = 0 
 
         return {
@@ -305,7 +286,7 @@ class TSETMCClient:
         try:
             encoded = urlencode(params or {}, doseq=True)
             full_url = f"{url}?{encoded}" if encoded else url
-            header_args = ["-H", f"User-Agent: {SAFE_BROWSER_UA}", "-H", "Accept: */*", "-H", "Connection: close"]
+            header_args = ["-H", f"User-Agent: {SAFE_BROWSER_UA}", "-H", "Accept: */*"]
             cmd = [self.curl_path, "-sS", "-L", "-k", "--max-time", "25"]
             if force_http11: cmd.append("--http1.1")
             
@@ -326,41 +307,44 @@ class TSETMCClient:
             return None
         except Exception: return None
 
+    # Mapping UI market_type keys to internal classification categories
+    MARKET_CLASSES = {
+        "1": ["bourse"],
+        "2": ["farabourse"],
+        "4": ["base"],
+        "5": ["etf"],
+        "etf": ["etf"],
+        "fixed_income": ["fixed_income"],
+        "tashilat": ["tashilat"],
+        "commodity": ["commodity"],
+        "energy": ["energy"]
+    }
+
+    def ensure_equity_registry(self, force_refresh=False):
+        """Makes sure every discovery bucket (1-5) is stored in the registry (fetching only missing ones)."""
+        for t in ["1", "2", "3", "4", "5"]:
+            if force_refresh or db.is_market_empty(f"symbols_type_{t}"):
+                self._get_equity_universe(t, force_refresh=force_refresh)
+
     def get_all_symbols(self, market_type, force_refresh=False):
         cache_key = f"symbols_{market_type}"
-        now = datetime.now()
         
         if not force_refresh:
-            cached = self._symbols_cache.get(cache_key)
+            cached = self._cache_get(cache_key)
             if cached:
-                data, timestamp = cached
-                if (now - timestamp).total_seconds() < 21600:
-                    return data
+                return cached
 
         result_symbols = []
-        
-        # Mapping UI market_type keys to internal classification categories
-        market_map = {
-            "1": ["bourse"],
-            "2": ["farabourse"],
-            "4": ["base"],
-            "5": ["etf"],
-            "etf": ["etf"],
-            "fixed_income": ["fixed_income"],
-            "tashilat": ["tashilat"],
-            "commodity": ["commodity"],
-            "energy": ["energy"]
-        }
 
-        if market_type in market_map:
-            # We combine all discovery buckets (1-5) to ensure NO symbol is missed
-            # and classification decides where it belongs.
-            combined = []
-            for t in ["1", "2", "3", "4", "5"]:
-                u = self._get_equity_universe(t, force_refresh=force_refresh)
-                if isinstance(u, list): combined.extend(u)
-            
-            result_symbols = self._filter_symbols(combined, market_map[market_type])
+        if market_type in self.MARKET_CLASSES:
+            # All discovery buckets (1-5) must be in the registry so NO symbol is missed;
+            # the classification stored at ingest time decides where each one belongs.
+            self.ensure_equity_registry(force_refresh)
+
+            # Indexed query, rows are already unique per ISIN
+            result_symbols = db.get_symbols_by_class(self.MARKET_CLASSES[market_type])
+            self._cache_set(cache_key, result_symbols)
+            return result_symbols
 
         elif market_type == "indices_market":
             lists = []
@@ -393,7 +377,7 @@ class TSETMCClient:
                 key = item.get('isin') or item.get('l18') or item.get('id')
                 if key and key not in unique: unique[key] = item
             cleaned = list(unique.values())
-            self._symbols_cache[cache_key] = (cleaned, now)
+            self._cache_set(cache_key, cleaned)
             return cleaned
 
         return result_symbols if isinstance(result_symbols, dict) else {"error": "داده‌ای یافت نشد."}
@@ -439,41 +423,121 @@ class TSETMCClient:
         
         return list(reversed(mock_data))  # Return newest first
 
-    def get_price_history(self, symbol, data_type=0, adjusted=True, service=None, force_refresh=False):
-        db_key = f"{symbol}_{data_type}"
-        if adjusted and data_type == 0: db_key = f"{symbol}_adj_{data_type}"
+    @staticmethod
+    def _history_db_key(symbol, data_type=0, adjusted=True):
+        """Key under which a symbol's candles are stored in price_history."""
+        if adjusted and data_type == 0: return f"{symbol}_adj_{data_type}"
+        return f"{symbol}_{data_type}"
+
+    def _is_proxy_index(self, symbol):
+        return symbol in ["شاخص کل", "شاخص کل (هم وزن)", "شاخص کل فرابورس"] or "شاخص صنعت" in str(symbol) or str(symbol).endswith("صنعت")
+
+    def _history_delta(self, db_key, api_data, adjusted):
+        """
+        Incremental sync: picks the candles of a freshly downloaded series that are not stored yet.
+        Keeps candles newer than the latest stored date (plus the latest one itself, which may have
+        been saved while the session was still open) and candles falling into gaps of the stored series.
+        For adjusted series a changed close on an already stored, closed candle means a capital
+        adjustment was applied retroactively, so the whole series is returned for an upsert.
+        """
+        latest = db.get_latest_date(db_key)
+        if not latest:
+            return api_data
+
+        stored = db.get_history_dates(db_key)
+        if adjusted:
+            closed = sorted(d for d in stored if d < latest)
+            if closed:
+                ref_date = closed[-1]
+                stored_close = db.get_close(db_key, ref_date)
+                api_candle = next((c for c in api_data if c.get('date') == ref_date), None)
+                if api_candle is not None and stored_close is not None:
+                    api_close = api_candle.get('pc') or api_candle.get('close')
+                    try:
+                        if api_close is not None and abs(float(api_close) - stored_close) > 1e-6:
+                            logger.info(f"Adjustment detected for {db_key} at {ref_date}. Rewriting series.")
+                            return api_data
+                    except (TypeError, ValueError):
+                        pass
+
+        delta = [c for c in api_data if c.get('date') and (c['date'] >= latest or c['date'] not in stored)]
+        filled = sum(1 for c in delta if c['date'] < latest)
+        if filled:
+            logger.info(f"Filling {filled} missing candles inside stored history of {db_key}")
+        return delta
+
+    def get_history_gaps(self, symbol, data_type=0, adjusted=True, max_gap_days=10):
+        """Reports holes in the locally stored history of a symbol (see SymbolDatabase.find_history_gaps)."""
+        return db.find_history_gaps(self._history_db_key(symbol, data_type, adjusted), max_gap_days)
+
+    @staticmethod
+    def _history_request(symbol, data_type=0, adjusted=True):
+        """Endpoint and params downloading the full history of a symbol."""
+        if data_type == 0:
+            return "Api/Tsetmc/Candlestick.php", {"l18": symbol, "adjusted": str(adjusted).lower()}
+        return "Api/Tsetmc/History.php", {"l18": symbol, "type": data_type}
+
+    def _store_history_response(self, symbol, api_data, data_type=0, adjusted=True, has_history=False,
+                                force_refresh=False, incremental=True):
+        """
+        Writes a downloaded history (the answer to _history_request) to price_history: the delta
+        against the stored series with incremental=True, upserted on a forced refresh. When the
+        download failed and nothing is stored, mock candles are saved and returned; otherwise
+        returns None and the caller reads the stored series back.
+        """
+        db_key = self._history_db_key(symbol, data_type, adjusted)
+        if data_type == 0 and isinstance(api_data, dict):
+            for k in ['candle_daily', 'candle_daily_adjusted', 'candles', 'history']:
+                if k in api_data and isinstance(api_data[k], list):
+                    api_data = api_data[k]
+                    break
+
+        if isinstance(api_data, list) and api_data:
+            if incremental and has_history:
+                api_data = self._history_delta(db_key, api_data, adjusted and data_type == 0)
+                logger.debug(f"Incremental sync for {db_key}: {len(api_data)} new/changed candles")
+            # A forced refresh upserts so retroactive price adjustments replace stale candles.
+            if api_data:
+                db.save_history(db_key, api_data, mode="upsert" if force_refresh else "ignore")
+        elif isinstance(api_data, dict) and "error" in api_data and not has_history:
+            # Nothing cached to fall back on: serve (and keep) mock data
+            print(f"DEBUG: API failed for {symbol}, generating mock data as fallback...")
+            mock_data = self._generate_mock_history(symbol)
+            db.save_history(db_key, mock_data)
+            return mock_data
+        return None
+
+    def get_price_history(self, symbol, data_type=0, adjusted=True, service=None, force_refresh=False, incremental=True,
+                          start_date=None, end_date=None, limit=None, lead=0):
+        """
+        Returns the price history of a symbol, served from the local DB when available.
+        On refresh (or an empty cache) the series is downloaded; with incremental=True only
+        the delta against the stored series is written (new candles, gap fills, adjustments).
+        start_date / end_date / limit / lead narrow what is read back (see SymbolDatabase.get_history);
+        by default the whole stored series is returned.
+        """
+        db_key = self._history_db_key(symbol, data_type, adjusted)
+        window = {'start_date': start_date, 'end_date': end_date, 'limit': limit, 'lead': lead}
         
-        cached_data = db.get_history(db_key)
-        if force_refresh or not cached_data:
-            if symbol in ["شاخص کل", "شاخص کل (هم وزن)", "شاخص کل فرابورس"]:
-                market_type = "1" if "فرابورس" not in symbol else "2"
-                api_data = self.get_market_proxy_history(market_type, adjusted=False, weighted=("هم وزن" not in symbol))
-            elif "شاخص صنعت" in str(symbol) or str(symbol).endswith("صنعت"):
-                sector_name = symbol.replace("شاخص صنعت ", "").replace("شاخص ", "").replace(" صنعت", "").strip()
-                api_data = self.get_sector_history(sector_name, adjusted=adjusted)
-            elif data_type == 0:
-                api_data = self._make_request("Api/Tsetmc/Candlestick.php", {"l18": symbol, "adjusted": str(adjusted).lower()}, service=service)
-                if isinstance(api_data, dict):
-                    for k in ['candle_daily', 'candle_daily_adjusted', 'candles', 'history']:
-                        if k in api_data and isinstance(api_data[k], list):
-                            api_data = api_data[k]
-                            break
-            else:
-                api_data = self._make_request("Api/Tsetmc/History.php", {"l18": symbol, "type": data_type}, service=service)
-            
-            if isinstance(api_data, list) and api_data:
-                db.save_history(db_key, api_data)
-                cached_data = db.get_history(db_key)
-            elif isinstance(api_data, dict) and "error" in api_data:
-                # Try cache or fallback to mock data
-                if cached_data:
-                    return cached_data
-                print(f"DEBUG: API failed for {symbol}, generating mock data as fallback...")
-                mock_data = self._generate_mock_history(symbol)
-                db.save_history(db_key, mock_data)
+        if self._is_proxy_index(symbol):
+            history = self._get_proxy_index_history(symbol, adjusted, force_refresh)
+            if isinstance(history, list) and history:
+                return history
+            # Materialization failed: serve a series stored by older versions, else mock data
+            return db.get_history(db_key, **window) or self._generate_mock_history(symbol)
+
+        has_history = db.get_latest_date(db_key) is not None
+        if force_refresh or not has_history:
+            endpoint, params = self._history_request(symbol, data_type, adjusted)
+            api_data = self._make_request(endpoint, params, service=service)
+            mock_data = self._store_history_response(symbol, api_data, data_type, adjusted, has_history,
+                                                     force_refresh, incremental)
+            if mock_data is not None:
                 return mock_data
         
-        if cached_data:
+        cached_data = db.get_history(db_key, **window)
+        if cached_data or has_history or db.get_latest_date(db_key):
+            # An empty list here only means the requested window holds no candles
             return cached_data
         
         # Final fallback: generate mock data if nothing is available
@@ -481,51 +545,130 @@ class TSETMCClient:
         mock_data = self._generate_mock_history(symbol)
         return mock_data
 
-    def get_sector_history(self, sector_name, top_count=10, adjusted=True):
-        try:
+    def _get_proxy_index_history(self, symbol, adjusted=True, force_refresh=False):
+        """Routes a proxy index name to its materialized series (candles sorted by date ascending)."""
+        if symbol in ["شاخص کل", "شاخص کل (هم وزن)", "شاخص کل فرابورس"]:
+            market_type = "1" if "فرابورس" not in symbol else "2"
+            history = self.get_market_proxy_history(market_type, adjusted=False, weighted=("هم وزن" not in symbol),
+                                                    force_refresh=force_refresh)
+        else:
+            sector_name = symbol.replace("شاخص صنعت ", "").replace("شاخص ", "").replace(" صنعت", "").strip()
+            history = self.get_sector_history(sector_name, adjusted=adjusted, force_refresh=force_refresh)
+        return list(reversed(history)) if isinstance(history, list) else history
+
+    @staticmethod
+    def _proxy_index_key(kind, name, adjusted, weighted=True):
+        """Key of a materialized proxy index in proxy_index_history, e.g. 'market:1:raw:mv'."""
+        return f"{kind}:{name}:{'adj' if adjusted else 'raw'}:{'mv' if weighted else 'ew'}"
+
+    def get_sector_history(self, sector_name, top_count=10, adjusted=True, force_refresh=False):
+        def select_components():
             data = []
             for t in ["1", "2"]:
                 u = self.get_all_symbols(t)
                 if isinstance(u, list): data.extend(u)
             sector_symbols = [s for s in data if s.get('cs') == sector_name]
             if not sector_symbols: return {"error": f"نمادی در صنعت {sector_name} یافت نشد."}
-            top_symbols = sorted(sector_symbols, key=lambda x: float(x.get('mv') or x.get('v') or 0), reverse=True)[:top_count]
-            return self._calculate_aggregate_history(top_symbols, adjusted, weighted=True)
-        except Exception as e: return {"error": str(e)}
+            return sorted(sector_symbols, key=lambda x: float(x.get('mv') or x.get('v') or 0), reverse=True)[:top_count]
 
-    def get_market_proxy_history(self, market_type, top_count=30, adjusted=False, weighted=True):
         try:
+            index_key = self._proxy_index_key("sector", sector_name, adjusted)
+            return self._proxy_index_history(index_key, select_components, adjusted, True, force_refresh)
+        except Exception as e: return {"error": str(e)}
+
+    def get_market_proxy_history(self, market_type, top_count=30, adjusted=False, weighted=True, force_refresh=False):
+        def select_components():
             data = self.get_all_symbols(market_type)
             if not isinstance(data, list): return data
-            top_symbols = sorted(data, key=lambda x: float(x.get('mv') or 0), reverse=True)[:top_count]
-            return self._calculate_aggregate_history(top_symbols, adjusted, weighted=weighted)
+            return sorted(data, key=lambda x: float(x.get('mv') or 0), reverse=True)[:top_count]
+
+        try:
+            index_key = self._proxy_index_key("market", market_type, adjusted, weighted)
+            return self._proxy_index_history(index_key, select_components, adjusted, weighted, force_refresh)
         except Exception as e: return {"error": str(e)}
 
-    def _calculate_aggregate_history(self, symbols, adjusted, weighted=True):
-        all_dfs = []
-        for ts in symbols:
-            name = ts.get('l18')
-            weight = float(ts.get('mv') or 1) if weighted else 1.0
-            h = self.get_price_history(name, adjusted=adjusted, service="proxy_component")
-            if isinstance(h, list) and h:
-                df = pd.DataFrame(h)
-                if 'date' in df.columns:
-                    df['date'] = df['date'].str[:10]
-                    for col in ['pc', 'pf', 'pmax', 'pmin', 'tvol']:
-                        if col in df.columns: df[col] = pd.to_numeric(df[col], errors='coerce')
-                    if weighted:
-                        for col in ['pc', 'pf', 'pmax', 'pmin']: df[col] *= weight
-                    df['weight'] = weight
-                    all_dfs.append(df)
-        
-        if not all_dfs: return []
-        combined = pd.concat(all_dfs)
-        if weighted:
-            grouped = combined.groupby('date').sum().reset_index()
-            for col in ['pc', 'pf', 'pmax', 'pmin']: grouped[col] /= grouped['weight']
+    def prefetch_histories(self, symbols, adjusted=True, lane="backfill", service=None):
+        """
+        Downloads, concurrently through AsyncTSETMCClient, the daily histories of the symbols that
+        have none stored yet, so a following serial pass reads them from the DB. For sync callers;
+        does nothing without httpx or inside a running event loop. Returns how many were fetched.
+        """
+        missing = [s for s in dict.fromkeys(symbols)
+                   if s and db.get_latest_date(self._history_db_key(s, 0, adjusted)) is None]
+        if len(missing) < 2 or not HTTPX_AVAILABLE:
+            return 0
+        try:
+            asyncio.get_running_loop()
+            return 0
+        except RuntimeError:
+            pass
+
+        async def run():
+            async with AsyncTSETMCClient(self) as aclient:
+                # limit=1: only the download matters here, not the rows read back
+                await aclient.gather_histories(missing, adjusted=adjusted, lane=lane, service=service, limit=1)
+
+        asyncio.run(run())
+        return len(missing)
+
+    def _load_history_frame(self, symbol, adjusted=True, service=None):
+        """Columnar OHLCV frame straight from price_history, syncing the symbol first if nothing is stored."""
+        db_key = self._history_db_key(symbol, 0, adjusted)
+        df = db.get_history_frame(db_key)
+        if df.empty:
+            self.get_price_history(symbol, adjusted=adjusted, service=service)
+            df = db.get_history_frame(db_key)
+        return df
+
+    def _proxy_index_history(self, index_key, select_components, adjusted, weighted=True, force_refresh=False):
+        """
+        Serves a proxy index from its materialized series in proxy_index_history (newest first).
+        The series is rebuilt from all component histories only on a forced refresh or when nothing
+        is stored yet; select_components is called just then, so constituents and weights stay fixed
+        until the next rebuild. Otherwise, when components received candles past the date each one
+        was synced to, only the days from the earliest such date on are recomputed (seeded with the
+        components' prior closes) and upserted. Retroactive adjustments need a forced refresh.
+        """
+        stored = db.get_proxy_components(index_key)
+        components = [row[:3] for row in stored]
+        synced = {key: synced_date for _, key, _, synced_date in stored}
+        latest = db.get_proxy_latest_date(index_key)
+
+        if force_refresh or not components or not latest:
+            selected = select_components()
+            if not isinstance(selected, list): return selected
+            components = [
+                (ts.get('l18'), self._history_db_key(ts.get('l18'), 0, adjusted),
+                 float(ts.get('mv') or 1) if weighted else 1.0)
+                for ts in selected if ts.get('l18')
+            ]
+            self.prefetch_histories([name for name, _, _ in components], adjusted, service="proxy_component")
+            with self.traffic_lane("backfill"):
+                frames = [self._load_history_frame(name, adjusted, service="proxy_component") for name, _, _ in components]
+            if not any(len(df) for df in frames): return []
+            index_df = build_aggregate_index(frames, weights=[w for _, _, w in components])
+            current = db.get_latest_dates([key for _, key, _ in components])
+            db.save_proxy_index(index_key, components, index_df, current, replace=True)
+            logger.info(f"Materialized proxy index {index_key}: {len(index_df)} days from {len(components)} components")
         else:
-            grouped = combined.groupby('date').mean().reset_index()
-        return grouped.sort_values('date', ascending=False).to_dict('records')
+            history_keys = [key for _, key, _ in components]
+            current = db.get_latest_dates(history_keys)
+            changed = [key for key in history_keys if current.get(key) != synced.get(key)]
+            if changed:
+                # Recompute from the earliest day that may have gained candles (a component's last
+                # synced candle may have been saved while its session was still open)
+                start = min([(synced.get(key) or '')[:10] for key in changed] + [latest[:10]])
+                seed = None
+                if start:
+                    prev_day = (pd.Timestamp(start) - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+                    closes = db.get_last_closes(history_keys, prev_day)
+                    seed = [closes.get(key, np.nan) for key in history_keys]
+                arrays = [db.get_history_arrays(key, start_date=start or None) for key in history_keys]
+                index_df = build_aggregate_index(arrays, weights=[w for _, _, w in components], seed_close=seed)
+                written = db.save_proxy_index(index_key, components, index_df, current)
+                logger.debug(f"Extended proxy index {index_key} from {start or 'the start'}: {written} days")
+
+        return list(reversed(db.get_proxy_history(index_key)))
 
     def get_indices(self, index_type, force_refresh=False):
         db_category = f"indices_type_{index_type}"
@@ -533,8 +676,7 @@ class TSETMCClient:
             data = self._make_request("Api/Tsetmc/Index.php", {"type": index_type})
             if data and isinstance(data, dict) and "error" not in data: data = [data]
             if data and isinstance(data, list):
-                db.clear_symbols(db_category)
-                db.save_symbols(data, db_category)
+                db.replace_symbols(data, db_category)
                 return data
 
         stored = db.get_symbols_by_market(db_category)
@@ -542,7 +684,7 @@ class TSETMCClient:
         
         data = self._make_request("Api/Tsetmc/Index.php", {"type": index_type})
         if data and isinstance(data, dict) and "error" not in data: data = [data]
-        if data and isinstance(data, list): db.save_symbols(data, db_category)
+        if data and isinstance(data, list): db.replace_symbols(data, db_category)
         return data if data else {"error": "عدم دریافت اطلاعات شاخص"}
 
     def get_nav(self, symbol):
@@ -0,0 +1,190 @@
+import time
+import random
+import asyncio
+import logging
+from urllib.parse import urlencode, quote
+
+from app.core_utils import HTTPX_AVAILABLE, BRIDGE_URL, update_stats, httpx
+from app.database import db
+
+logger = logging.getLogger(__name__)
+# httpx logs every request URL at INFO, and brsapi URLs carry the API key
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+class AsyncTSETMCClient:
+    """
+    asyncio front end of a TSETMCClient for multi-symbol jobs (proxy index builds, bulk syncs).
+
+    Upstream calls go through the client's RateLimiter and TechniqueScoreboard, so sync and async
+    traffic share one fair-use budget. Up to `max_concurrency` calls are in flight at once: their
+    starts are still spaced by the limiter, but a slow answer no longer holds back the next symbol.
+    The bridge and the direct route use pooled httpx.AsyncClient connections; the other bypass
+    techniques (curl, curl_cffi, tls_client) run in worker threads. Identical calls in flight are
+    coalesced together with the sync client's. Storage and fallbacks are the sync client's
+    (_store_history_response).
+
+        async with AsyncTSETMCClient(client) as aclient:
+            histories = await aclient.gather_histories(symbols, lane="backfill")
+    """
+
+    MAX_CONCURRENCY = 4
+
+    def __init__(self, client, max_concurrency=None):
+        if not HTTPX_AVAILABLE:
+            raise RuntimeError("AsyncTSETMCClient requires httpx")
+        self.client = client
+        self.max_concurrency = max_concurrency or self.MAX_CONCURRENCY
+        self._semaphore = None
+        self._http = None
+        self._bridge = None
+
+    async def __aenter__(self):
+        # Semaphore and connection pools belong to the running event loop
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        # Like the sync 'requests' and bridge sessions (HttpSessionManager), both connect directly
+        self._http = httpx.AsyncClient(verify=False, limits=limits, headers={"User-Agent": "Mozilla/5.0"}, timeout=15)
+        self._bridge = httpx.AsyncClient(limits=limits, follow_redirects=True, timeout=30)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        for http in (self._http, self._bridge):
+            if http is not None:
+                await http.aclose()
+        self._http = self._bridge = None
+
+    def _techniques(self, endpoint, query):
+        """
+        The sync client's techniques, with the bridge and the direct requests route replaced by
+        httpx coroutines ('requests:*' becomes 'httpx:*'); the others are wrapped in worker threads.
+        """
+        def json_body(resp):
+            return resp.json() if resp.status_code == 200 else None
+
+        techniques = {}
+        for name, fetch in self.client._techniques(endpoint, query).items():
+            kind, protocol = name.split(":")
+            full_url = f"{protocol}://brsapi.ir/{endpoint}?{urlencode(query, doseq=True)}"
+            if kind == "bridge":
+                async def bridge(retry, full_url=full_url):
+                    resp = await self._bridge.get(f"{BRIDGE_URL}?url={quote(full_url, safe='')}")
+                    content = resp.text.strip() if resp.status_code == 200 else ""
+                    if content.startswith(('[', '{')):
+                        return resp.json()
+                    logger.debug(f"Bridge returned non-JSON: {content[:100]}")
+                    return None
+                techniques[name] = bridge
+            elif kind == "requests":
+                async def direct(retry, full_url=full_url):
+                    return json_body(await self._http.get(full_url))
+                techniques[f"httpx:{protocol}"] = direct
+            else:
+                async def threaded(retry, fetch=fetch):
+                    return await asyncio.to_thread(fetch, retry)
+                techniques[name] = threaded
+        return techniques
+
+    async def _fetch(self, endpoint, params, service):
+        """Async twin of TSETMCClient._locked_make_request (same rounds, scoreboard and circuit breaker)."""
+        sync = self.client
+        query = params.copy() if params else {}
+        query["key"] = sync.api_key
+
+        is_discovery = (service == "symbols" or "AllSymbols" in endpoint)
+        rounds = 1 if is_discovery else 2
+        techniques = self._techniques(endpoint, query)
+
+        for retry in range(rounds):
+            if retry > 0:
+                logger.info(f"Retrying {endpoint} (round {retry})...")
+                await asyncio.sleep((3 if is_discovery else 10) + random.uniform(1, 3))
+
+            for name in sync.scoreboard.order(list(techniques)):
+                logger.debug(f"Technique {name} for {endpoint}...")
+                started = time.perf_counter()
+                try:
+                    data = await techniques[name](retry)
+                except Exception as e:
+                    logger.error(f"{name} failed: {str(e)[:50]}")
+                    data = None
+                sync.scoreboard.record(name, data is not None, time.perf_counter() - started)
+                if data is not None:
+                    sync._consecutive_failures = 0
+                    if service: update_stats(service, "success")
+                    return data
+
+        return sync._all_techniques_failed(endpoint, service, is_discovery)
+
+    async def request(self, endpoint, params=None, service=None, lane="interactive"):
+        """
+        Async _make_request: waits for a concurrency slot and a rate-limiter slot of `lane`, then
+        tries the techniques. Identical calls in flight are coalesced through the sync client's
+        SingleFlight, so async and sync callers share one upstream call.
+        """
+        limiter = self.client.limiter
+
+        # The concurrency slot is only held by callers doing the call, not by coalesced followers
+        async def acquire():
+            await self._semaphore.acquire()
+            try:
+                await limiter.acquire_async(lane)
+            except BaseException:
+                self._semaphore.release()
+                raise
+
+        async def fetch():
+            try:
+                return await self._fetch(endpoint, params, service)
+            finally:
+                self._semaphore.release()
+
+        return await self.client.inflight.do_async(self.client._request_key(endpoint, params), fetch,
+                                                   rank=limiter.rank(lane), acquire=acquire)
+
+    async def get_price_history(self, symbol, data_type=0, adjusted=True, service=None, force_refresh=False,
+                                incremental=True, lane="interactive", **window):
+        """
+        Async TSETMCClient.get_price_history for regular symbols (window arguments as there).
+        Proxy indices are built by the sync client in a worker thread.
+        """
+        sync = self.client
+        if sync._is_proxy_index(symbol):
+            return await asyncio.to_thread(sync.get_price_history, symbol, data_type, adjusted, service,
+                                           force_refresh, incremental, **window)
+
+        db_key = sync._history_db_key(symbol, data_type, adjusted)
+        has_history = db.get_latest_date(db_key) is not None
+        if force_refresh or not has_history:
+            endpoint, params = sync._history_request(symbol, data_type, adjusted)
+            api_data = await self.request(endpoint, params, service=service, lane=lane)
+            mock_data = await asyncio.to_thread(sync._store_history_response, symbol, api_data, data_type,
+                                                adjusted, has_history, force_refresh, incremental)
+            if mock_data is not None:
+                return mock_data
+        return await asyncio.to_thread(db.get_history, db_key, **window)
+
+    async def get_symbol_info(self, symbol, lane="interactive"):
+        return await self.request("Api/Tsetmc/Symbol.php", {"l18": symbol}, service="realtime", lane=lane)
+
+    async def gather_histories(self, symbols, lane="backfill", **kwargs):
+        """
+        Price histories of many symbols at once ({symbol: rows}); kwargs as get_price_history.
+        A symbol that raised maps to {"error": ...} instead of failing the batch.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        results = await asyncio.gather(
+            *(self.get_price_history(symbol, lane=lane, **kwargs) for symbol in symbols), return_exceptions=True)
+        return {symbol: {"error": str(r)} if isinstance(r, Exception) else r for symbol, r in zip(symbols, results)}
+
+    async def gather_symbol_info(self, symbols, lane="interactive"):
+        """Symbol.php answers of many symbols at once ({symbol: info}), errors as {"error": ...}."""
+        symbols = list(dict.fromkeys(symbols))
+        results = await asyncio.gather(
+            *(self.get_symbol_info(symbol, lane=lane) for symbol in symbols), return_exceptions=True)
+        return {symbol: {"error": str(r)} if isinstance(r, Exception) else r for symbol, r in zip(symbols, results)}
+
+    def stats(self):
+        return {"max_concurrency": self.max_concurrency, **self.client.inflight.stats()}
@@ -0,0 +1,67 @@
+"""
+Compares payload size and encoding time of the response layouts in app/api/formats.py
+(records, columnar, columnar + compact, projected columnar, arrow when pyarrow is installed)
+for a technical-analysis result over a multi-year daily history.
+Usage: python scripts/bench_formats.py [years] [repeats]
+"""
+import sys
+import os
+import json
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.getcwd())
+
+from app.services.technical_analysis import TechnicalAnalyzer
+from app.api import formats
+
+warnings.filterwarnings("ignore")
+
+def make_result(bars, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 1000 * np.exp(np.cumsum(rng.normal(0, 0.02, bars)))
+    dates = pd.bdate_range("2010-01-01", periods=bars).strftime("%Y-%m-%d")
+    # BrsApi-style candles, raw keys included as stored by save_history
+    candles = [
+        {"date": d, "pc": c, "pf": c * (1 + rng.normal(0, 0.005)), "pmax": c * 1.02, "pmin": c * 0.98,
+         "tvol": int(rng.integers(1e5, 1e7)), "pl": c, "count": int(rng.integers(100, 5000))}
+        for d, c in zip(dates, close)
+    ]
+    return TechnicalAnalyzer.calculate_technical_analysis(TechnicalAnalyzer.prepare_ohlcv_data(candles))
+
+def timed(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+if __name__ == "__main__":
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    rows = make_result(years * 245)
+    fields = ["date", "open", "high", "low", "close", "volume", "RSI", "MACD", "Signal"]
+
+    layouts = {
+        "records": lambda: json.dumps(rows, ensure_ascii=False, separators=(",", ":")),
+        "columnar": lambda: formats.columnar_json(rows),
+        "columnar compact": lambda: formats.columnar_json(rows, compact=True),
+        "columnar fields": lambda: formats.columnar_json(rows, fields=fields, compact=True),
+    }
+    if formats.PYARROW_AVAILABLE:
+        layouts["arrow"] = lambda: formats.arrow_stream(rows)
+        layouts["arrow compact"] = lambda: formats.arrow_stream(rows, compact=True)
+
+    base = None
+    print(f"{len(rows)} rows, {len(rows[-1])} keys per row")
+    for name, encode in layouts.items():
+        t, payload = timed(encode, repeats)
+        size = len(payload.encode() if isinstance(payload, str) else payload)
+        base = base or (t, size)
+        print(f"{name:<17} {size / 1024:9.1f} KiB ({base[1] / size:4.1f}x smaller) {t * 1000:8.2f} ms ({base[0] / t:4.1f}x faster)")
+    if not formats.PYARROW_AVAILABLE:
+        print("arrow             skipped (pyarrow not installed)")
@@ -0,0 +1,54 @@
+"""
+Compares the per-indicator `ta` backend of TechnicalAnalyzer against the shared NumPy kernels
+(app/services/indicators.py) and checks that both produce the same columns.
+Usage: python scripts/bench_indicators.py [bars] [repeats]
+"""
+import sys
+import os
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.getcwd())
+
+from app.services.technical_analysis import TechnicalAnalyzer, INDICATOR_COLUMNS
+
+warnings.filterwarnings("ignore")
+
+def make_ohlc(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 1000 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    return pd.DataFrame({
+        "high": close * (1 + rng.uniform(0, 0.02, n)),
+        "low": close * (1 - rng.uniform(0, 0.02, n)),
+        "close": close,
+    })
+
+def timed(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    df = make_ohlc(n)
+
+    t_ta, ref = timed(lambda: TechnicalAnalyzer.compute_indicator_columns(df, backend="ta"), repeats)
+    t_np, out = timed(lambda: TechnicalAnalyzer.compute_indicator_columns(df, backend="numpy"), repeats)
+    print(f"ta (one call per indicator): {t_ta * 1000:8.2f} ms")
+    print(f"NumPy shared kernels       : {t_np * 1000:8.2f} ms  ({t_ta / t_np:.1f}x faster)")
+
+    for col in INDICATOR_COLUMNS:
+        if ref[col] is None or out[col] is None:
+            print(f"  {col:<14} unavailable for {n} bars")
+            continue
+        expected = np.asarray(ref[col], dtype=np.float64)
+        err = np.nanmax(np.abs(expected - out[col]) / np.maximum(1.0, np.abs(expected)))
+        same_nan = np.array_equal(np.isnan(expected), np.isnan(out[col]))
+        print(f"  {col:<14} max rel. error {err:.1e}{'' if same_nan else '  (NaN mask differs!)'}")
@@ -0,0 +1,57 @@
+"""
+Compares the legacy row-by-row inserts against the batched executemany ingestion
+of SymbolDatabase on a throwaway database. Usage: python scripts/bench_ingest.py [rows]
+"""
+import sys
+import os
+import json
+import time
+import random
+import sqlite3
+import tempfile
+
+sys.path.append(os.getcwd())
+
+from app.database import SymbolDatabase
+
+def make_candles(n):
+    price = 1000.0
+    rows = []
+    for i in range(n):
+        price *= 1 + random.uniform(-0.03, 0.03)
+        rows.append({
+            "date": f"{2000 + i // 360:04d}-{(i // 30) % 12 + 1:02d}-{i % 30 + 1:02d}",
+            "pf": round(price * 0.99), "pmax": round(price * 1.02), "pmin": round(price * 0.97),
+            "pc": round(price), "tvol": random.randint(1000, 100000),
+        })
+    return rows
+
+def legacy_save_history(db_path, symbol, history_data):
+    """The original per-row implementation (one execute + json.dumps per candle)."""
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        for item in history_data:
+            cursor.execute('''
+                INSERT OR IGNORE INTO price_history
+                (symbol, date, open, high, low, close, volume, raw_data, last_updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (symbol, item['date'], item['pf'], item['pmax'], item['pmin'], item['pc'], item['tvol'],
+                  json.dumps(item, ensure_ascii=False), "now"))
+        conn.commit()
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    candles = make_candles(n)
+    db = SymbolDatabase(os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+    t0 = time.perf_counter()
+    legacy_save_history(db.db_path, "LEGACY", candles)
+    legacy = time.perf_counter() - t0
+    print(f"Legacy row-by-row : {n / legacy:>10,.0f} rows/s ({legacy:.2f}s)")
+
+    res = db.save_history("BULK", candles)
+    print(f"Bulk executemany  : {res['rows_per_sec']:>10,} rows/s ({res['seconds']:.2f}s)")
+
+    for c in candles[::10]: c["pc"] += 1
+    res = db.save_history("BULK", candles, mode="upsert")
+    print(f"Upsert (10% changed): {res['rows_per_sec']:>8,} rows/s, {res['written']} of {res['rows']} rows rewritten")
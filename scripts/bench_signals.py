@@ -0,0 +1,92 @@
+"""
+Compares the former row-wise Signal / indicator-ranking evaluation (DataFrame.apply per row)
+against the vectorized mask implementation of TechnicalAnalyzer on multi-year daily and
+weekly histories, and checks that both give the same results.
+Usage: python scripts/bench_signals.py [years] [repeats]
+"""
+import sys
+import os
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.getcwd())
+
+from app.services.technical_analysis import TechnicalAnalyzer, _SIGNAL_TEXT
+
+warnings.filterwarnings("ignore")
+
+def make_history(bars, seed=0):
+    rng = np.random.default_rng(seed)
+    close = np.round(1000 * np.exp(np.cumsum(rng.normal(0, 0.02, bars))))
+    df = pd.DataFrame({
+        "date": pd.bdate_range("2010-01-01", periods=bars).strftime("%Y-%m-%d"),
+        "high": close * (1 + rng.uniform(0, 0.02, bars)),
+        "low": close * (1 - rng.uniform(0, 0.02, bars)),
+        "close": close,
+    })
+    for col, values in TechnicalAnalyzer.compute_indicator_columns(df).items():
+        df[col] = values
+    # The row-wise ranking expects a stochastic column; give both paths the same one
+    low14, high14 = df["low"].rolling(14).min(), df["high"].rolling(14).max()
+    df["STOCHk"] = 100 * (df["close"] - low14) / (high14 - low14)
+    return df
+
+def legacy_signals(df):
+    def get_signals(row):
+        sigs = []
+        if row['SMA20'] > row['SMA50']: sigs.append('Bullish (SMA)')
+        elif row['SMA20'] < row['SMA50']: sigs.append('Bearish (SMA)')
+        if row['RSI'] < 30: sigs.append('Oversold')
+        elif row['RSI'] > 70: sigs.append('Overbought')
+        if row['MACD'] > row['MACD_Sig']: sigs.append('MACD Bullish')
+        if row['Ichimoku_Conv'] > row['Ichimoku_Base']: sigs.append('Ichimoku Bullish Cross')
+        return ", ".join(sigs) if sigs else 'Neutral'
+    return df.apply(get_signals, axis=1)
+
+def legacy_prioritize(df):
+    history = df.sort_values('date').copy()
+    history['future_return'] = (history['close'].shift(-5) - history['close']) / history['close']
+    rules = {
+        'RSI': (lambda h: h[(h['RSI'] < 30) | (h['RSI'] > 70)], lambda r: r['RSI'] < 30),
+        'Bollinger': (lambda h: h[(h['close'] < h['BBL']) | (h['close'] > h['BBU'])], lambda r: r['close'] < r['BBL']),
+        'Stoch': (lambda h: h[(h['STOCHk'] < 20) | (h['STOCHk'] > 80)], lambda r: r['STOCHk'] < 20),
+    }
+    history['macd_cross'] = (history['MACD'] > history['MACD_Sig']).astype(int).diff()
+    history['sma_cross'] = (history['SMA20'] > history['SMA50']).astype(int).diff()
+    rules['MACD'] = (lambda h: h[h['macd_cross'] != 0], lambda r: r['macd_cross'] > 0)
+    rules['SMA'] = (lambda h: h[h['sma_cross'].notnull() & (h['sma_cross'] != 0)], lambda r: r['sma_cross'] > 0)
+    out = {}
+    for name, (select, is_bullish) in rules.items():
+        signals = select(history)
+        success = signals.apply(lambda r: r['future_return'] > 0 if is_bullish(r) else r['future_return'] < 0, axis=1)
+        out[name] = (round(success.mean() * 100, 1), len(signals))
+    return out
+
+def timed(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+if __name__ == "__main__":
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    for label, bars in (("daily", years * 245), ("weekly", years * 52)):
+        df = make_history(bars)
+        t_old, old = timed(lambda: legacy_signals(df), repeats)
+        t_new, new = timed(lambda: _SIGNAL_TEXT[TechnicalAnalyzer.signal_flags(df)], repeats)
+        same = list(old) == list(new)
+        print(f"{label:>6} {bars:>5} bars | Signal : apply {t_old * 1000:8.2f} ms, masks {t_new * 1000:6.2f} ms "
+              f"({t_old / t_new:5.0f}x) {'identical' if same else 'MISMATCH'}")
+
+        t_old, old = timed(lambda: legacy_prioritize(df), repeats)
+        t_new, new = timed(lambda: TechnicalAnalyzer.prioritize_indicators(df), repeats)
+        same = all(old[r['name']] == (r['accuracy'], r['signals']) for r in new)
+        print(f"{'':>18} | Ranking: apply {t_old * 1000:8.2f} ms, masks {t_new * 1000:6.2f} ms "
+              f"({t_old / t_new:5.0f}x) {'identical' if same else 'MISMATCH'}")
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.database import SymbolDatabase
+
+
+@pytest.fixture
+def tmp_db(tmp_path):
+    """Empty SymbolDatabase in a temporary directory."""
+    return SymbolDatabase(str(tmp_path / "test.db"))
+
+
+@pytest.fixture
+def tsetmc_client(tmp_db, monkeypatch):
+    """The TSETMC client singleton reading and writing tmp_db (tests must not reach the network)."""
+    from app.services import tsetmc
+
+    monkeypatch.setattr(tsetmc, "db", tmp_db)
+    return tsetmc.client
+
+
+def make_candles(n=300, seed=0, start="2020-01-01"):
+    """Random-walk BrsApi-style daily candles (pc/pf/pmax/pmin/tvol), oldest first."""
+    import random
+    import pandas as pd
+
+    rnd = random.Random(seed)
+    price = 1000.0
+    candles = []
+    for day in pd.bdate_range(start, periods=n):
+        price *= 1 + rnd.uniform(-0.03, 0.03)
+        open_, close = price * (1 + rnd.uniform(-0.01, 0.01)), price * (1 + rnd.uniform(-0.01, 0.01))
+        candles.append({
+            "date": day.strftime("%Y-%m-%d"), "pc": round(close), "pf": round(open_),
+            "pmax": round(max(open_, close) * 1.01), "pmin": round(min(open_, close) * 0.99),
+            "tvol": rnd.randint(1000, 100000),
+        })
+    return candles
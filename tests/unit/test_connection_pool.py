@@ -0,0 +1,110 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app.database import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), timeout=5, size=2)
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE t (v INTEGER)")
+    yield pool
+    pool.close_all()
+
+
+def _in_thread(target):
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+
+
+def test_thread_per_request_reuses_one_connection(pool):
+    seen = []
+
+    def request():
+        with pool.connection() as conn:
+            seen.append(id(conn))
+            conn.execute("INSERT INTO t VALUES (1)")
+
+    for _ in range(20):
+        _in_thread(request)
+
+    stats = pool.stats()
+    assert len(set(seen)) == 1
+    assert stats["opened"] == 1
+    assert stats["reused"] == 20
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 20
+
+
+def test_concurrent_threads_stay_within_the_pool_size(pool):
+    release = threading.Event()
+    in_use, peak, lock = [0], [0], threading.Lock()
+
+    def request():
+        with pool.connection():
+            with lock:
+                in_use[0] += 1
+                peak[0] = max(peak[0], in_use[0])
+            release.wait(timeout=5)
+            with lock:
+                in_use[0] -= 1
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    # Two threads hold the connections, the other four wait for them
+    deadline = time.monotonic() + 5
+    while pool.stats()["waited"] < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    stats = pool.stats()
+    assert peak[0] == 2
+    assert stats["opened"] == 2
+    assert stats["waited"] >= 4
+    assert stats["idle_connections"] == 2
+
+
+def test_nested_blocks_share_the_threads_connection(pool):
+    with pool.connection() as outer:
+        outer.execute("INSERT INTO t VALUES (1)")
+        with pool.connection() as inner:
+            assert inner is outer
+            inner.execute("INSERT INTO t VALUES (2)")
+    assert pool.stats()["opened"] == 1
+
+
+def test_failed_block_rolls_back_and_returns_the_connection(pool):
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            raise ValueError("boom")
+
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    assert pool.stats()["idle_connections"] == 1
+
+
+def test_exhausted_pool_times_out(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "small.db"), timeout=0.2, size=1)
+    errors = []
+
+    def request():
+        try:
+            with pool.connection():
+                pass
+        except sqlite3.OperationalError as e:
+            errors.append(e)
+
+    with pool.connection():
+        _in_thread(request)
+    assert len(errors) == 1
+    _in_thread(request)
+    assert len(errors) == 1
@@ -0,0 +1,39 @@
+from conftest import make_candles
+
+
+def test_delta_keeps_new_candles_and_the_latest_stored_one(tsetmc_client, tmp_db):
+    candles = make_candles(105)
+    tmp_db.save_history("AAA_adj_0", candles[:100])
+    delta = tsetmc_client._history_delta("AAA_adj_0", candles, adjusted=True)
+    assert [c["date"] for c in delta] == [c["date"] for c in candles[99:]]
+
+
+def test_delta_fills_gaps_of_the_stored_series(tsetmc_client, tmp_db):
+    candles = make_candles(60)
+    tmp_db.save_history("AAA_adj_0", candles[:20] + candles[25:])
+    delta = tsetmc_client._history_delta("AAA_adj_0", candles, adjusted=True)
+    assert [c["date"] for c in delta] == [c["date"] for c in candles[20:25] + candles[-1:]]
+
+
+def test_adjustment_returns_the_whole_series(tsetmc_client, tmp_db):
+    candles = make_candles(60)
+    tmp_db.save_history("AAA_adj_0", candles)
+    adjusted = [{**c, "pc": round(c["pc"] * 0.9)} for c in candles]
+    assert tsetmc_client._history_delta("AAA_adj_0", adjusted, adjusted=True) == adjusted
+    # Unadjusted series are never rewritten retroactively
+    assert len(tsetmc_client._history_delta("AAA_adj_0", adjusted, adjusted=False)) == 1
+
+
+def test_incremental_store_ends_with_the_downloaded_series(tsetmc_client, tmp_db):
+    candles = make_candles(80)
+    tsetmc_client._store_history_response("AAA", candles[:70])
+    update = candles[:69] + [{**candles[69], "pc": candles[69]["pc"] + 10}] + candles[70:]
+    tsetmc_client._store_history_response("AAA", update, has_history=True)
+    stored = tmp_db.get_history("AAA_adj_0")
+    assert len(stored) == 80
+    assert stored[69]["pc"] == candles[69]["pc"]  # "ignore" mode keeps the stored candle
+
+    # A forced refresh upserts, so a detected adjustment replaces every stored candle
+    adjusted = [{**c, "pc": round(c["pc"] * 0.9)} for c in candles]
+    tsetmc_client._store_history_response("AAA", adjusted, has_history=True, force_refresh=True)
+    assert tmp_db.get_history("AAA_adj_0") == adjusted
@@ -0,0 +1,84 @@
+import http.server
+import json
+import threading
+
+import pytest
+
+from app.services.transport import HttpSessionManager
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"          # keep-alive
+    disable_nagle_algorithm = True
+    clients = set()
+
+    def do_GET(self):
+        _Handler.clients.add(self.client_address)
+        body = json.dumps({"path": self.path}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.clients = set()
+    srv = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_sessions_are_reused_across_request_threads(server):
+    sessions = HttpSessionManager()
+    for i in range(20):
+        # One short-lived thread per request, like Flask's threaded server
+        thread = threading.Thread(target=lambda i=i: sessions.get("requests", f"{server}/{i}", timeout=5))
+        thread.start()
+        thread.join()
+    stats = sessions.stats()["requests"]
+    assert stats["opened"] == 1
+    assert stats["reused"] == 19
+    assert len(_Handler.clients) == 1
+
+
+def test_concurrent_requests_get_separate_sessions(server):
+    sessions = HttpSessionManager()
+    barrier = threading.Barrier(3)
+    original = sessions._checkout
+
+    def checkout(technique):
+        slot = original(technique)
+        barrier.wait(timeout=5)        # all three hold a session at once
+        return slot
+
+    sessions._checkout = checkout
+    threads = [threading.Thread(target=sessions.get, args=("requests", f"{server}/x"), kwargs={"timeout": 5})
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = sessions.stats()["requests"]
+    assert stats["opened"] == 3
+    assert stats["idle_sessions"] == 3 and stats["open_sessions"] == 3
+
+
+def test_failed_session_is_dropped():
+    sessions = HttpSessionManager()
+    with pytest.raises(Exception):
+        sessions.get("requests", "http://127.0.0.1:9/unreachable", timeout=1)
+    stats = sessions.stats()["requests"]
+    assert stats["errors"] == 1 and stats["discarded"] == 1 and stats["open_sessions"] == 0
+
+
+def test_proxy_only_applies_to_tls_client():
+    sessions = HttpSessionManager(proxy="http://proxy.invalid:8080")
+    assert not sessions._open("requests", None).proxies
+    assert not sessions._open("bridge", None).proxies
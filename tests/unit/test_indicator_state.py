@@ -0,0 +1,88 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.indicator_state import IndicatorStateStore, StreamingIndicators
+from app.services.technical_analysis import INDICATOR_COLUMNS, TechnicalAnalyzer
+from conftest import make_candles
+
+
+@pytest.mark.parametrize("n", [15, 30, 60, 400])
+def test_streaming_snapshot_matches_the_batch_kernels(n):
+    rows = TechnicalAnalyzer.prepare_ohlcv_data(make_candles(n, seed=n))
+    batch = TechnicalAnalyzer.compute_indicator_columns(pd.DataFrame(rows))
+    state = StreamingIndicators()
+    for row in rows:
+        state.update(row["high"], row["low"], row["close"])
+    snapshot = state.snapshot()
+
+    for column in INDICATOR_COLUMNS:
+        expected = None if batch[column] is None else float(batch[column][-1])
+        if expected is None or math.isnan(expected):
+            assert snapshot[column] is None, column
+        else:
+            assert snapshot[column] == pytest.approx(expected, rel=1e-9), column
+
+
+def test_state_survives_a_round_trip():
+    state = StreamingIndicators()
+    for row in TechnicalAnalyzer.prepare_ohlcv_data(make_candles(80)):
+        state.update(row["high"], row["low"], row["close"])
+    restored = StreamingIndicators.from_dict(state.to_dict())
+    assert restored.snapshot() == state.snapshot()
+    assert StreamingIndicators.from_dict({**state.to_dict(), "version": 0}) is None
+
+
+def _latest_batch_row(database, key):
+    results = TechnicalAnalyzer.calculate_technical_analysis(TechnicalAnalyzer.prepare_ohlcv_data(database.get_history(key)))
+    return results[0]
+
+
+def _assert_matches_batch(latest, expected):
+    assert latest["date"] == expected["date"]
+    assert latest["close"] == expected["close"]
+    assert latest["Signal"] == expected["Signal"]
+    for column in INDICATOR_COLUMNS:
+        # Prices are rounded by the close here and by the column's mean in the batch path
+        tolerance = 0.5 if column in ("SMA20", "BBU", "BBL", "SMA50") else 0.011
+        assert latest[column] == pytest.approx(expected[column], abs=tolerance), column
+
+
+def test_store_follows_new_candles_incrementally(tmp_db):
+    candles = make_candles(400, seed=7)
+    tmp_db.save_history("AAA", candles[:300])
+    store = IndicatorStateStore(tmp_db)
+    _assert_matches_batch(store.latest("AAA"), _latest_batch_row(tmp_db, "AAA"))
+
+    tmp_db.save_history("AAA", candles[300:])
+    latest = store.latest("AAA")
+    assert latest["bars"] == 400
+    _assert_matches_batch(latest, _latest_batch_row(tmp_db, "AAA"))
+
+
+def test_store_rebuilds_after_an_adjustment(tmp_db):
+    candles = make_candles(300, seed=8)
+    tmp_db.save_history("AAA", candles)
+    store = IndicatorStateStore(tmp_db)
+    store.latest("AAA")
+
+    # Capital-adjusted history: every stored candle is rewritten
+    adjusted = [{**c, **{f: round(c[f] * 0.8) for f in ("pc", "pf", "pmax", "pmin")}} for c in candles]
+    tmp_db.save_history("AAA", adjusted, mode="upsert")
+    _assert_matches_batch(store.latest("AAA"), _latest_batch_row(tmp_db, "AAA"))
+
+
+def test_store_reapplies_the_open_candle(tmp_db):
+    candles = make_candles(200, seed=9)
+    tmp_db.save_history("AAA", candles)
+    store = IndicatorStateStore(tmp_db)
+    store.latest("AAA")
+
+    candles[-1] = {**candles[-1], "pc": candles[-1]["pc"] + 25}
+    tmp_db.save_history("AAA", candles[-1:], mode="upsert")
+    latest = store.latest("AAA")
+    assert latest["bars"] == 200
+    _assert_matches_batch(latest, _latest_batch_row(tmp_db, "AAA"))
+    assert np.isclose(latest["close"], candles[-1]["pc"])
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import indicators
+from app.services.technical_analysis import INDICATOR_COLUMNS, TechnicalAnalyzer
+from conftest import make_candles
+
+
+def _frame(n, seed):
+    return pd.DataFrame(TechnicalAnalyzer.prepare_ohlcv_data(make_candles(n, seed=seed)))
+
+
+def _values(column):
+    """Column as float64, or None for a missing / all-NaN indicator."""
+    if column is None:
+        return None
+    values = np.asarray(column, dtype=np.float64)
+    return None if np.isnan(values).all() else values
+
+
+@pytest.mark.parametrize("n", [30, 60, 400, 1500])
+def test_numpy_backend_matches_ta(n):
+    df = _frame(n, seed=n)
+    fast = TechnicalAnalyzer.compute_indicator_columns(df, backend="numpy")
+    reference = TechnicalAnalyzer.compute_indicator_columns(df, backend="ta")
+
+    for column in INDICATOR_COLUMNS:
+        x, y = _values(fast[column]), _values(reference[column])
+        assert (x is None) == (y is None), column
+        if x is None:
+            continue
+        assert np.array_equal(np.isnan(x), np.isnan(y)), column
+        valid = ~np.isnan(y)
+        max_rel_err = np.max(np.abs(x[valid] - y[valid]) / np.maximum(np.abs(y[valid]), 1e-12))
+        assert max_rel_err < 1e-9, (column, max_rel_err)
+
+
+def test_nan_holes_fall_back_to_ta():
+    df = _frame(120, seed=1)
+    df.loc[60, "high"] = np.nan
+    columns = TechnicalAnalyzer.compute_indicator_columns(df)
+    assert isinstance(columns["SMA20"], pd.Series)
+
+
+def test_linear_recurrence_matches_the_loop():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=1000)
+    for a in (0.5, 12 / 13, 0.999):
+        expected, y = np.empty_like(x), 3.0
+        for i, value in enumerate(x):
+            y = a * y + value
+            expected[i] = y
+        np.testing.assert_allclose(indicators.linear_recurrence(x, a, y0=3.0), expected, rtol=1e-10, atol=1e-10)
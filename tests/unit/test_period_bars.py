@@ -0,0 +1,76 @@
+import pytest
+
+from app.periods import period_end
+from app.services.technical_analysis import TechnicalAnalyzer
+from conftest import make_candles
+
+FIELDS = ("date", "open", "high", "low", "close", "volume")
+
+
+def _bars(rows):
+    return [tuple(row[f] for f in FIELDS) for row in sorted(rows, key=lambda r: r["date"])]
+
+
+def _resampled(database, key, timeframe, end_date=None):
+    daily = TechnicalAnalyzer.prepare_ohlcv_data(database.get_history(key, end_date=end_date))
+    return _bars(TechnicalAnalyzer.resample(daily, timeframe))
+
+
+def _stored(database, key, timeframe, **window):
+    return _bars(TechnicalAnalyzer.prepare_ohlcv_data(database.get_period_bars(key, timeframe, **window)))
+
+
+@pytest.mark.parametrize("date, timeframe, label", [
+    ("2024-03-10", "weekly", "2024-03-13"),     # Sunday -> Wednesday
+    ("2024-03-13", "weekly", "2024-03-13"),
+    ("2024-03-14", "weekly", "2024-03-20"),
+    ("2024-03-10", "monthly", "2024-03-19"),    # Esfand 1402 ends the day before Nowruz
+    ("2024-03-20", "monthly", "2024-04-19"),    # Farvardin 1403
+])
+def test_period_labels(date, timeframe, label):
+    assert period_end(date, timeframe) == label
+
+
+@pytest.mark.parametrize("timeframe", ["weekly", "monthly"])
+def test_stored_bars_match_the_resampler(tmp_db, timeframe):
+    tmp_db.save_history("AAA", make_candles(600, seed=3))
+    assert _stored(tmp_db, "AAA", timeframe) == _resampled(tmp_db, "AAA", timeframe)
+
+
+@pytest.mark.parametrize("timeframe", ["weekly", "monthly"])
+def test_new_sessions_extend_the_open_period(tmp_db, timeframe):
+    candles = make_candles(300, seed=4)
+    tmp_db.save_history("AAA", candles[:298])
+    before = tmp_db.get_period_bars("AAA", timeframe)
+
+    tmp_db.save_history("AAA", candles[298:])
+    after = tmp_db.get_period_bars("AAA", timeframe)
+    assert sum(bar["sessions"] for bar in after) == sum(bar["sessions"] for bar in before) + 2
+    assert _stored(tmp_db, "AAA", timeframe) == _resampled(tmp_db, "AAA", timeframe)
+
+
+def test_adjusted_rewrite_rebuilds_the_bars(tmp_db):
+    candles = make_candles(200, seed=5)
+    tmp_db.save_history("AAA", candles)
+    tmp_db.get_period_bars("AAA", "weekly")
+
+    adjusted = [{**c, "pc": round(c["pc"] * 0.9)} for c in candles]
+    tmp_db.save_history("AAA", adjusted, mode="upsert")
+    assert _stored(tmp_db, "AAA", "weekly") == _resampled(tmp_db, "AAA", "weekly")
+
+
+@pytest.mark.parametrize("timeframe, end_date", [("weekly", "2020-06-01"), ("monthly", "2020-07-07")])
+def test_end_date_inside_a_period_gives_a_partial_bar(tmp_db, timeframe, end_date):
+    tmp_db.save_history("AAA", make_candles(300, seed=6))
+    stored = _stored(tmp_db, "AAA", timeframe, end_date=end_date)
+    assert stored == _resampled(tmp_db, "AAA", timeframe, end_date=end_date)
+    assert stored[-1][0] == period_end(end_date, timeframe)
+
+
+def test_window_counts_bars(tmp_db):
+    tmp_db.save_history("AAA", make_candles(600, seed=7))
+    full = tmp_db.get_period_bars("AAA", "weekly")
+    assert tmp_db.get_period_bars("AAA", "weekly", limit=10) == full[-10:]
+    start = full[50]["date"]
+    windowed = tmp_db.get_period_bars("AAA", "weekly", start_date=start, lead=5)
+    assert windowed == full[45:]
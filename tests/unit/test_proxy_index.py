@@ -0,0 +1,35 @@
+import pytest
+
+from app.services.tsetmc import TSETMCClient
+from conftest import make_candles
+
+COMPONENTS = [{"l18": name, "mv": mv} for name, mv in (("AAA", 5e9), ("BBB", 2e9), ("CCC", 1e9))]
+
+
+def _store_components(database, count, offset=0):
+    for i, component in enumerate(COMPONENTS):
+        candles = make_candles(200, seed=i)[offset:count]
+        database.save_history(TSETMCClient._history_db_key(component["l18"], 0, False), candles)
+
+
+def test_incremental_proxy_index_equals_a_full_rebuild(tsetmc_client, tmp_db):
+    _store_components(tmp_db, 150)
+    tsetmc_client._proxy_index_history("test:inc", lambda: COMPONENTS, adjusted=False)
+
+    _store_components(tmp_db, 200, offset=150)
+    incremental = tsetmc_client._proxy_index_history("test:inc", lambda: pytest.fail("components reselected"), adjusted=False)
+    rebuilt = tsetmc_client._proxy_index_history("test:full", lambda: COMPONENTS, adjusted=False, force_refresh=True)
+
+    assert len(incremental) == len(rebuilt) == 200
+    for a, b in zip(incremental, rebuilt):
+        assert a["date"] == b["date"]
+        for field in ("pf", "pmax", "pmin", "pc", "tvol"):
+            assert a[field] == pytest.approx(b[field], rel=1e-9), (a["date"], field)
+
+
+def test_proxy_index_is_served_from_storage(tsetmc_client, tmp_db):
+    _store_components(tmp_db, 120)
+    first = tsetmc_client._proxy_index_history("test:cached", lambda: COMPONENTS, adjusted=False)
+    again = tsetmc_client._proxy_index_history("test:cached", lambda: pytest.fail("rebuilt"), adjusted=False)
+    assert first == again
+    assert first[0]["date"] > first[-1]["date"]  # newest first
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.transport import RateLimiter
+
+
+def test_interactive_calls_keep_the_gap():
+    limiter = RateLimiter(max_requests=100, window=10, min_gap=0.05, jitter=0)
+    started = time.time()
+    for _ in range(3):
+        limiter.acquire("interactive")
+    assert time.time() - started >= 0.1
+    assert limiter.stats()["lanes"]["interactive"]["calls"] == 3
+
+
+def test_bulk_lanes_use_the_whole_budget_without_interactive_traffic():
+    limiter = RateLimiter(max_requests=3, window=60, min_gap=0, jitter=0, interactive_reserve=2)
+    for _ in range(3):
+        assert limiter.acquire("backfill") < 0.5
+    assert limiter.stats()["window_used"] == 3
+    assert limiter.expected_wait("backfill") > 50
+
+
+def test_bulk_lanes_leave_the_interactive_reserve():
+    limiter = RateLimiter(max_requests=4, window=60, min_gap=0, jitter=0, interactive_reserve=2)
+    limiter.acquire("interactive")
+    limiter.acquire("background")
+    # Budget left for bulk lanes is used up; the reserve is still there for interactive calls
+    assert limiter.expected_wait("background") > 50
+    assert limiter.expected_wait("backfill") > 50
+    assert limiter.expected_wait("interactive") < 0.5
+    limiter.acquire("interactive")
+    limiter.acquire("interactive")
+    assert limiter.stats()["window_used"] == 4
+
+
+def test_waiting_interactive_call_goes_before_bulk_lanes():
+    limiter = RateLimiter(max_requests=100, window=60, min_gap=0.1, jitter=0)
+    limiter.cool_down(0.3)
+    order = []
+
+    def call(lane):
+        limiter.acquire(lane)
+        order.append(lane)
+
+    bulk = threading.Thread(target=call, args=("backfill",))
+    bulk.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=call, args=("interactive",))
+    interactive.start()
+    bulk.join()
+    interactive.join()
+    assert order == ["interactive", "backfill"]
+
+
+@pytest.mark.parametrize("lane, rank", [("interactive", 0), ("background", 1), ("backfill", 2), ("unknown", 0)])
+def test_lane_rank(lane, rank):
+    assert RateLimiter(10, 10, 0).rank(lane) == rank
+
+
+def test_async_acquire_books_from_the_same_slots():
+    limiter = RateLimiter(max_requests=100, window=10, min_gap=0.05, jitter=0)
+    limiter.acquire("interactive")
+
+    async def bulk():
+        return await asyncio.gather(limiter.acquire_async("background"), limiter.acquire_async("backfill"))
+
+    started = time.time()
+    asyncio.run(bulk())
+    assert time.time() - started >= 0.09
+    lanes = limiter.stats()["lanes"]
+    assert lanes["background"]["calls"] == lanes["backfill"]["calls"] == 1
@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+
+def _symbols(prefix, count):
+    return [{"isin": f"IR{prefix}{i:04d}", "l18": f"{prefix}{i}", "l30": f"{prefix} {i}"} for i in range(count)]
+
+
+def test_swap_replaces_the_category(tmp_db):
+    first = tmp_db.replace_symbols(_symbols("OLD", 50), "symbols_type_1")
+    second = tmp_db.replace_symbols(_symbols("NEW", 30), "symbols_type_1")
+
+    assert second == first + 1
+    assert sorted(s["l18"] for s in tmp_db.get_symbols_by_market("symbols_type_1")) == sorted(f"NEW{i}" for i in range(30))
+    assert tmp_db.get_registry_generation("symbols_type_1") == second
+
+
+def test_swap_leaves_other_categories_alone(tmp_db):
+    tmp_db.replace_symbols(_symbols("A", 10), "symbols_type_1")
+    tmp_db.replace_symbols(_symbols("B", 10), "symbols_type_2")
+    tmp_db.replace_symbols(_symbols("C", 5), "symbols_type_1")
+    assert len(tmp_db.get_symbols_by_market("symbols_type_2")) == 10
+    assert tmp_db.get_registry_generation("symbols_type_2") == 1
+    assert tmp_db.get_registry_generation() == 3
+
+
+@pytest.mark.parametrize("symbols", [[], None, [{"l30": "no identifier"}]])
+def test_empty_download_keeps_the_registry(tmp_db, symbols):
+    tmp_db.replace_symbols(_symbols("OLD", 10), "symbols_type_1")
+    assert tmp_db.replace_symbols(symbols, "symbols_type_1") is None
+    assert len(tmp_db.get_symbols_by_market("symbols_type_1")) == 10
+
+
+def test_failed_swap_rolls_back(tmp_db, monkeypatch):
+    tmp_db.replace_symbols(_symbols("OLD", 10), "symbols_type_1")
+
+    def fail(conn, category):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(tmp_db, "_bump_generation", fail)
+    with pytest.raises(RuntimeError):
+        tmp_db.replace_symbols(_symbols("NEW", 20), "symbols_type_1")
+    assert sorted(s["l18"] for s in tmp_db.get_symbols_by_market("symbols_type_1")) == sorted(f"OLD{i}" for i in range(10))
+    assert tmp_db.get_registry_generation("symbols_type_1") == 1
+
+
+def test_readers_never_see_an_empty_market(tmp_db):
+    tmp_db.replace_symbols(_symbols("S0_", 300), "symbols_type_1")
+    done, sizes = threading.Event(), []
+
+    def read():
+        while not done.is_set():
+            sizes.append(len(tmp_db.get_symbols_by_market("symbols_type_1")))
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for round_ in range(1, 6):
+        tmp_db.replace_symbols(_symbols(f"S{round_}_", 300), "symbols_type_1")
+    done.set()
+    reader.join()
+    assert sizes and set(sizes) == {300}
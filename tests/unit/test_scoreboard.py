@@ -0,0 +1,84 @@
+import threading
+
+from app.services.transport import TechniqueScoreboard
+
+TECHNIQUES = ["bridge:https", "curl:https", "requests:https"]
+
+
+def trip(board, technique):
+    for _ in range(board.FAILURE_THRESHOLD):
+        board.record(technique, False, 1.0)
+
+
+def make_half_open(board, technique):
+    trip(board, technique)
+    board._scores[technique]["open_until"] = 0.0   # cooldown elapsed
+
+
+def test_orders_by_expected_time():
+    board = TechniqueScoreboard()
+    board.record("bridge:https", True, 4.0)
+    board.record("curl:https", True, 0.5)
+    assert board.order(TECHNIQUES)[0] == "curl:https"
+
+
+def test_open_technique_is_skipped():
+    board = TechniqueScoreboard()
+    trip(board, "bridge:https")
+    assert "bridge:https" not in board.order(TECHNIQUES)
+
+
+def test_one_probe_per_request():
+    board = TechniqueScoreboard()
+    for technique in TECHNIQUES:
+        make_half_open(board, technique)
+    first = board.order(TECHNIQUES)
+    assert sorted(first) == sorted(TECHNIQUES)
+    claimed = [t for t in TECHNIQUES if board._scores[t]["probe_claimed"]]
+    assert claimed == [first[0]]
+
+
+def test_concurrent_requests_never_get_an_empty_list():
+    board = TechniqueScoreboard()
+    for technique in TECHNIQUES:
+        make_half_open(board, technique)
+    barrier = threading.Barrier(2)
+    results = []
+
+    def request():
+        barrier.wait()
+        results.append(board.order(TECHNIQUES))
+
+    threads = [threading.Thread(target=request) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(sorted(result) == sorted(TECHNIQUES) for result in results)
+    # Each request claimed its own probe
+    assert results[0][0] != results[1][0]
+
+
+def test_claimed_probe_still_offered_as_last_resort():
+    board = TechniqueScoreboard()
+    make_half_open(board, "bridge:https")
+    assert board.order(["bridge:https"]) == ["bridge:https"]
+    # Claimed by the first request, but a concurrent one still gets something to try
+    assert board.order(["bridge:https"]) == ["bridge:https"]
+
+
+def test_all_open_probes_the_earliest_cooldown():
+    board = TechniqueScoreboard()
+    for technique in TECHNIQUES:
+        trip(board, technique)
+    board._scores["curl:https"]["open_until"] -= 60
+    assert board.order(TECHNIQUES) == ["curl:https"]
+
+
+def test_recovered_probe_closes_the_breaker():
+    board = TechniqueScoreboard()
+    make_half_open(board, "bridge:https")
+    board.order(["bridge:https"])
+    board.record("bridge:https", True, 0.3)
+    assert board.stats()["bridge:https"]["state"] == "closed"
+    assert board.order(TECHNIQUES)[0] == "bridge:https"
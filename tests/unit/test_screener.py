@@ -0,0 +1,89 @@
+import math
+
+import pytest
+
+from app.services.screener import SCREEN_FIELDS, Screener, ScreenerFilterError, analyze_symbol, compile_filter
+from app.services.technical_analysis import TechnicalAnalyzer
+from conftest import make_candles
+
+ROW = {"symbol": "AAA", "RSI": 25.0, "SMA20": 110.0, "SMA50": 100.0, "close": 120.0, "Signal": "Bullish (SMA), Oversold",
+       "MACD": None}
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("RSI < 30 and SMA20 > SMA50", True),
+    ("rsi < 30 && sma20 < sma50", False),
+    ("RSI > 70 or SMA20 > SMA50 and close > 100", True),
+    ("(RSI > 70 or SMA20 > SMA50) and close > 200", False),
+    ("not RSI > 70", True),
+    ("! (RSI < 30)", False),
+    ("close / SMA20 > 1.05", True),
+    ("close - SMA50 * 2 < -70", True),
+    ("-RSI < -20", True),
+    ("Signal contains 'oversold'", True),
+    ("symbol == \"AAA\"", True),
+    ("symbol != 'AAA'", False),
+    ("MACD > 0 or MACD <= 0", False),
+    ("MACD + 1 > 0", False),
+    ("RSI / 0 > 0", False),
+])
+def test_filter_grammar(expression, expected):
+    assert compile_filter(expression)(ROW) is expected
+
+
+@pytest.mark.parametrize("expression", ["RSI <", "(RSI < 30", "RSI < 30)", "foo > 1", "RSI < 30 $", "close >> 1"])
+def test_invalid_filters_raise(expression):
+    with pytest.raises(ScreenerFilterError):
+        compile_filter(expression)
+
+
+def test_empty_filter_matches_everything():
+    assert compile_filter("  ") is None
+
+
+def _same(a, b):
+    if isinstance(a, float) and isinstance(b, float):
+        return a == b or (math.isnan(a) and math.isnan(b))
+    return a == b
+
+
+@pytest.mark.parametrize("seed, scale", [(1, 1), (2, 1), (3, 0.02)])
+def test_analyze_symbol_matches_the_full_pipeline(tmp_db, seed, scale):
+    candles = make_candles(500, seed=seed)
+    for candle in candles:
+        for field in ("pc", "pf", "pmax", "pmin"):
+            candle[field] *= scale
+    tmp_db.save_history("AAA", candles)
+
+    row = analyze_symbol(tmp_db, "AAA", "AAA", bars=400)
+    history = tmp_db.get_history("AAA", limit=400)
+    results = TechnicalAnalyzer.calculate_technical_analysis(TechnicalAnalyzer.prepare_ohlcv_data(history))
+    latest = results[0]
+
+    assert row["bars"] == len(results) == 400
+    for field in SCREEN_FIELDS:
+        if field in latest and field != "bars":
+            assert _same(row[field], latest[field]), field
+    assert row["support"] == latest["supports"][0]["value"]
+    assert row["rr_ratio"] == (latest["risk_reward"] or {}).get("rr_ratio")
+    assert row["change"] == round((latest["close"] - results[1]["close"]) / results[1]["close"] * 100, 2)
+
+
+def test_analyze_symbol_needs_enough_history(tmp_db):
+    tmp_db.save_history("AAA", make_candles(20))
+    assert analyze_symbol(tmp_db, "AAA", "AAA", bars=400) is None
+
+
+def test_scan_cache_follows_universe_members(tmp_db):
+    for i, symbol in enumerate(("AAA", "BBB", "CCC")):
+        tmp_db.save_history(symbol, make_candles(120, seed=i))
+    screener = Screener(tmp_db, max_workers=1)
+
+    rows, info = screener.scan([("AAA", "AAA", "a", "x"), ("BBB", "BBB", "b", "x")], cache_key="market")
+    assert not info["cached"]
+    assert screener.scan([("BBB", "BBB", "b", "x"), ("AAA", "AAA", "a", "x")], cache_key="market")[1]["cached"]
+
+    # Same size, other members: scanned again
+    rows, info = screener.scan([("AAA", "AAA", "a", "x"), ("CCC", "CCC", "c", "x")], cache_key="market")
+    assert not info["cached"]
+    assert sorted(row["symbol"] for row in rows) == ["AAA", "CCC"]
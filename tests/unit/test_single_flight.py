@@ -0,0 +1,149 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.transport import SingleFlight
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert predicate()
+
+
+def _start(target, *args):
+    thread = threading.Thread(target=target, args=args)
+    thread.start()
+    return thread
+
+
+def test_identical_calls_share_one_upstream_call():
+    flight, release, calls, results = SingleFlight(), threading.Event(), [], []
+
+    def fetch():
+        calls.append(1)
+        release.wait(2)
+        return {"rows": [1, 2]}
+
+    threads = [_start(lambda: results.append(flight.do("key", fetch))) for _ in range(4)]
+    _wait_for(lambda: flight.stats()["saved_calls"] == 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"rows": [1, 2]}] * 4
+    # Every caller owns its copy
+    assert len({id(r) for r in results}) == 4
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_followers_reraise_the_leaders_error():
+    flight, release, errors = SingleFlight(), threading.Event(), []
+
+    def fetch():
+        release.wait(2)
+        raise ConnectionError("upstream down")
+
+    def call():
+        try:
+            flight.do("key", fetch)
+        except ConnectionError as e:
+            errors.append(e)
+
+    threads = [_start(call) for _ in range(3)]
+    _wait_for(lambda: flight.stats()["saved_calls"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+
+
+def test_interactive_call_bypasses_a_backfill_leader_waiting_for_its_slot():
+    flight, slot, calls = SingleFlight(), threading.Event(), []
+
+    def fetch(lane):
+        calls.append(lane)
+        return lane
+
+    leader = _start(lambda: flight.do("key", lambda: fetch("backfill"), rank=2, acquire=lambda: slot.wait(2)))
+    _wait_for(lambda: flight.stats()["in_flight"] == 1)
+    assert flight.do("key", lambda: fetch("interactive"), rank=0) == "interactive"
+    slot.set()
+    leader.join()
+
+    assert calls == ["interactive", "backfill"]
+    assert flight.stats()["priority_bypasses"] == 1
+
+
+def test_interactive_call_joins_a_leader_past_its_slot_wait():
+    flight, release, calls, results = SingleFlight(), threading.Event(), [], []
+
+    def fetch():
+        calls.append(1)
+        release.wait(2)
+        return "rows"
+
+    leader = _start(lambda: results.append(flight.do("key", fetch, rank=2)))
+    _wait_for(lambda: calls)
+    follower = _start(lambda: results.append(flight.do("key", fetch, rank=0)))
+    _wait_for(lambda: flight.stats()["saved_calls"] == 1)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(calls) == 1
+    assert results == ["rows", "rows"]
+
+
+def test_lower_priority_callers_join_a_higher_priority_leader():
+    flight, slot, calls = SingleFlight(), threading.Event(), []
+
+    def fetch():
+        calls.append(1)
+        return "rows"
+
+    leader = _start(lambda: flight.do("key", fetch, rank=0, acquire=lambda: slot.wait(2)))
+    _wait_for(lambda: flight.stats()["in_flight"] == 1)
+    follower = _start(lambda: flight.do("key", fetch, rank=2))
+    _wait_for(lambda: flight.stats()["saved_calls"] == 1)
+    slot.set()
+    leader.join()
+    follower.join()
+    assert len(calls) == 1
+
+
+def test_sync_and_async_callers_coalesce():
+    flight, release, calls = SingleFlight(), threading.Event(), []
+
+    def fetch():
+        calls.append(1)
+        release.wait(2)
+        return [1]
+
+    leader = _start(lambda: flight.do("key", fetch))
+    _wait_for(lambda: calls)
+
+    async def follower():
+        async def fetch_async():
+            calls.append(1)
+            return [2]
+        threading.Timer(0.05, release.set).start()
+        return await flight.do_async("key", fetch_async)
+
+    assert asyncio.run(follower()) == [1]
+    leader.join()
+    assert len(calls) == 1
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
+    assert flight.stats()["upstream_calls"] == 2
+    with pytest.raises(KeyError):
+        flight.do("c", lambda: {}["missing"])
+    assert flight.stats()["in_flight"] == 0
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from app.api import routes
+from conftest import make_candles
+
+SUMMARY_KEYS = ("sr_levels", "supports", "resistances", "recommended_indicators", "divergence", "fibonacci", "risk_reward")
+
+WINDOWS = (
+    {"start_date": "2022-06-01", "end_date": "2024-06-01"},
+    {"start_date": "2023-09-01"},
+    {"candle_count": 60},
+    {"candle_count": 40, "end_date": "2022-03-01"},
+)
+
+
+@pytest.fixture
+def stored(tmp_db, monkeypatch):
+    monkeypatch.setattr(routes, "db", tmp_db)
+    tmp_db.save_history("AAA", make_candles(1500, seed=4))
+    tmp_db.save_history("BBB", make_candles(700, seed=5, start="2021-01-01"))
+    return tmp_db
+
+
+def _summaries(row):
+    # NaN scores compare equal once serialized
+    return json.dumps({key: row.get(key) for key in SUMMARY_KEYS}, sort_keys=True, default=float)
+
+
+@pytest.mark.parametrize("window", WINDOWS)
+@pytest.mark.parametrize("timeframe", ("daily", "weekly"))
+def test_windowed_summaries_match_full_history(stored, window, timeframe):
+    start_date, end_date, candle_count = window.get("start_date"), window.get("end_date"), window.get("candle_count")
+    # Stored symbols read their weekly candles from period_bars, so the daily read is the daily window
+    history = stored.get_history("AAA", **routes._technical_window(window, "daily"))
+    assert len(history) < 1500
+
+    windowed = routes._technical_result(history, "AAA", timeframe, start_date, end_date, chart=False,
+                                        candle_count=candle_count, bars_key="AAA")
+    full = routes._technical_result(stored.get_history("AAA"), "AAA", timeframe, start_date, end_date, chart=False,
+                                    bars_key="AAA")
+    assert windowed[0]["date"] == full[0]["date"]
+    assert _summaries(windowed[0]) == _summaries(full[0])
+
+
+def test_summaries_do_not_depend_on_start_date(stored):
+    summaries = set()
+    for start_date in ("2021-01-04", "2023-01-02", "2025-01-01"):
+        window = {"start_date": start_date}
+        history = stored.get_history("AAA", **routes._technical_window(window, "daily"))
+        rows = routes._technical_result(history, "AAA", "daily", start_date, chart=False, bars_key="AAA")
+        summaries.add(_summaries(rows[0]))
+    assert len(summaries) == 1
+
+
+@pytest.mark.parametrize("window", WINDOWS)
+def test_history_many_applies_the_window_per_symbol(stored, window):
+    history_window = routes._technical_window(window, "daily")
+    histories = stored.get_history_many(["AAA", "BBB"], **history_window)
+    for key in ("AAA", "BBB"):
+        assert histories.get(key, []) == stored.get_history(key, **history_window)